@@ -0,0 +1,829 @@
+"""
+In-process stand-in for the Glue, SNS, SQS, S3 and DynamoDB APIs used by the replication Lambdas, with injectable
+per-call latency and throttling.
+
+Clients are real boto3 clients created from a LocalSession: parameters are validated and serialized, paginators,
+modeled exceptions and the client's event handlers (e.g. the Glue rate limiter and botocore's retry handler) run as
+usual, but every call is answered by the in-memory services of a LocalAWS instead of being sent over HTTP.
+Latency, throttling and request quotas are configured per "service.Operation" (e.g. "glue.GetPartitions"), per
+service (e.g. "glue") or for every API.
+
+Usage:
+    local_aws = LocalAWS(latency_ms=20, throttle_rates={"glue.BatchCreatePartition": 0.05},
+                         request_quotas={"glue": 100})
+    session = local_aws.create_session("111111111111")
+    glue = session.client("glue", region_name="us-east-1")
+"""
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import boto3
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+from botocore.hooks import first_non_none_response
+from botocore.response import StreamingBody
+
+# Error code and HTTP status each service answers with when a request is throttled.
+THROTTLING_ERRORS = {
+    "glue": ("ThrottlingException", 400),
+    "dynamodb": ("ThrottlingException", 400),
+    "sns": ("Throttling", 400),
+    "sqs": ("RequestThrottled", 403),
+    "s3": ("SlowDown", 503),
+}
+# Timestamp members of Glue databases, tables and partitions, stored as epoch seconds.
+GLUE_TIMESTAMP_FIELDS = ("CreateTime", "UpdateTime", "LastAccessTime", "LastAnalyzedTime", "CreationTime")
+GLUE_PAGE_SIZE = 100
+GLUE_PARTITION_PAGE_SIZE = 1000
+MAX_MESSAGE_BYTES = 262144
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class LocalServiceError(Exception):
+    def __init__(self, code, message="", status_code=400):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+class LocalSession(boto3.session.Session):
+    # A boto3 session of one account whose clients (and the clients behind its resources) are answered by local_aws.
+    def __init__(self, local_aws, account_id, region_name="us-east-1"):
+        super().__init__(aws_access_key_id="local", aws_secret_access_key="local", region_name=region_name)
+        self.local_aws = local_aws
+        self.account_id = account_id
+
+    def client(self, service_name, *args, **kwargs):
+        client = super().client(service_name, *args, **kwargs)
+        self.local_aws.attach(client, self.account_id)
+        return client
+
+
+class LocalAWS:
+    def __init__(self, latency_ms=0.0, latencies=None, throttle_rates=None, request_quotas=None, seed=None):
+        # latencies are in milliseconds, throttle_rates are the probability of a request being throttled and
+        # request_quotas the requests per second an account may send before being throttled.
+        self.latency_ms = latency_ms
+        self.latencies = latencies or {}
+        self.throttle_rates = throttle_rates or {}
+        self.request_quotas = request_quotas or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent_requests = {}
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.services = {
+            "glue": LocalGlue(),
+            "sns": LocalSNS(),
+            "sqs": LocalSQS(),
+            "s3": LocalS3(),
+            "dynamodb": LocalDynamoDB(),
+        }
+
+    @property
+    def glue(self):
+        return self.services["glue"]
+
+    @property
+    def sns(self):
+        return self.services["sns"]
+
+    @property
+    def sqs(self):
+        return self.services["sqs"]
+
+    @property
+    def s3(self):
+        return self.services["s3"]
+
+    @property
+    def dynamodb(self):
+        return self.services["dynamodb"]
+
+    def create_session(self, account_id, region_name="us-east-1"):
+        return LocalSession(self, account_id, region_name)
+
+    def attach(self, client, account_id):
+        service_id = client.meta.service_model.service_id.hyphenize()
+        if service_id not in self.services:
+            raise ValueError(f"Service '{service_id}' is not available locally.")
+
+        def save_params(params, context, **kwargs):
+            context["local_aws_params"] = params
+
+        def send(model, params, context, **kwargs):
+            return self.send(client, service_id, account_id, model, params, context["local_aws_params"])
+
+        # Registered last so every other before-call handler still runs before the call is answered.
+        client.meta.events.register_last(f"before-parameter-build.{service_id}", save_params)
+        client.meta.events.register_last(f"before-call.{service_id}", send)
+
+    def send(self, client, service_id, account_id, model, request_dict, api_params):
+        # Plays the part of botocore's endpoint: before-send and needs-retry are emitted for every attempt, so
+        # handlers pacing requests or deciding on retries see the same events as with a real endpoint.
+        events = client.meta.events
+        attempts = 1
+        while True:
+            events.emit(f"before-send.{service_id}.{model.name}", request=None)
+            http_response, parsed = self.invoke(service_id, model.name, account_id, api_params, attempts)
+            retry_delay = first_non_none_response(events.emit(
+                f"needs-retry.{service_id}.{model.name}", response=(http_response, parsed), endpoint=None,
+                operation=model, attempts=attempts, caught_exception=None, request_dict=request_dict))
+            if retry_delay is None:
+                return http_response, parsed
+            time.sleep(retry_delay)
+            attempts += 1
+
+    def invoke(self, service_id, operation_name, account_id, api_params, attempts=1):
+        api_name = f"{service_id}.{operation_name}"
+        with self.lock:
+            self.calls[api_name] += 1
+            throttled = self.is_throttled(service_id, api_name, account_id)
+            if throttled:
+                self.throttled[api_name] += 1
+
+        latency_ms = self.get_setting(self.latencies, service_id, api_name, self.latency_ms)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+        metadata = {"RequestId": str(uuid.uuid4()), "HTTPStatusCode": 200, "HTTPHeaders": {}, "RetryAttempts": attempts - 1}
+        try:
+            if throttled:
+                code, status_code = THROTTLING_ERRORS[service_id]
+                raise LocalServiceError(code, "Rate exceeded", status_code)
+            handler = getattr(self.services[service_id], xform_name(operation_name), None)
+            if handler is None:
+                raise LocalServiceError("InvalidAction", f"{api_name} is not available locally.")
+            parsed = handler(account_id, **api_params)
+        except LocalServiceError as e:
+            metadata["HTTPStatusCode"] = e.status_code
+            parsed = {"Error": {"Code": e.code, "Message": e.message}, "ResponseMetadata": metadata}
+            return AWSResponse(api_name, e.status_code, self.get_response_headers(parsed), None), parsed
+        parsed["ResponseMetadata"] = metadata
+        return AWSResponse(api_name, 200, self.get_response_headers(parsed), None), parsed
+
+    @staticmethod
+    def get_response_headers(parsed):
+        # The length of the parsed response as JSON stands in for the length of the body the endpoint would return.
+        return {"content-length": str(len(json.dumps(parsed, default=str)))}
+
+    def is_throttled(self, service_id, api_name, account_id):
+        throttle_rate = self.get_setting(self.throttle_rates, service_id, api_name, 0.0)
+        if throttle_rate and self.random.random() < throttle_rate:
+            return True
+        quota = self.get_setting(self.request_quotas, service_id, api_name, 0)
+        if not quota:
+            return False
+        now = time.monotonic()
+        recent = self.recent_requests.setdefault((account_id, api_name), deque())
+        while recent and now - recent[0] >= 1.0:
+            recent.popleft()
+        if len(recent) >= quota:
+            return True
+        recent.append(now)
+        return False
+
+    @staticmethod
+    def get_setting(settings, service_id, api_name, default):
+        return settings.get(api_name, settings.get(service_id, settings.get("*", default)))
+
+    def get_call_counts(self):
+        with self.lock:
+            return Counter(self.calls), Counter(self.throttled)
+
+    def reset_call_counts(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+
+def encode_glue_entity(entity):
+    return json.dumps(entity, default=lambda value: value.timestamp())
+
+
+def parse_glue_timestamps(entity):
+    # Entities loaded from GlueUtil output carry their timestamps as str(datetime).
+    return dict(entity, **{field: datetime.fromisoformat(entity[field]) for field in GLUE_TIMESTAMP_FIELDS
+                           if isinstance(entity.get(field), str)})
+
+
+def decode_glue_entity(document):
+    entity = json.loads(document)
+    for field in GLUE_TIMESTAMP_FIELDS:
+        if field in entity:
+            entity[field] = datetime.fromtimestamp(entity[field], timezone.utc)
+    return entity
+
+
+class LocalGlueTable:
+    # Partitions live in slots in the order they were created; a deleted partition leaves an empty slot so that
+    # page tokens (slot positions) stay valid while partitions are added and deleted.
+    def __init__(self, document):
+        self.document = document
+        self.partition_slots = []
+        self.partition_index = {}
+
+    @property
+    def num_partitions(self):
+        return len(self.partition_index)
+
+
+class LocalGlue:
+    # Databases, tables and partitions are stored as JSON documents, so every response returns new objects that
+    # callers may modify, like a parsed HTTP response.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.catalogs = {}
+
+    def get_catalog(self, catalog_id):
+        return self.catalogs.setdefault(catalog_id, {})
+
+    def get_database_entry(self, catalog_id, database_name):
+        database = self.get_catalog(catalog_id).get(database_name)
+        if database is None:
+            raise LocalServiceError("EntityNotFoundException", f"Database {database_name} not found.")
+        return database
+
+    def get_table_entry(self, catalog_id, database_name, table_name):
+        table = self.get_database_entry(catalog_id, database_name)["tables"].get(table_name)
+        if table is None:
+            raise LocalServiceError("EntityNotFoundException", f"Table {table_name} not found.")
+        return table
+
+    # Catalog setup and inspection, used by benchmarks.
+
+    def load_database(self, catalog_id, database):
+        database = dict(parse_glue_timestamps(database), CatalogId=catalog_id)
+        database.setdefault("CreateTime", datetime.now(timezone.utc))
+        with self.lock:
+            self.get_catalog(catalog_id)[database["Name"]] = {"document": encode_glue_entity(database), "tables": {}}
+
+    def load_table(self, catalog_id, table, partitions=()):
+        table = dict(parse_glue_timestamps(table), CatalogId=catalog_id)
+        table.setdefault("CreateTime", datetime.now(timezone.utc))
+        table.setdefault("UpdateTime", table["CreateTime"])
+        with self.lock:
+            database = self.get_database_entry(catalog_id, table["DatabaseName"])
+            table_entry = database["tables"][table["Name"]] = LocalGlueTable(encode_glue_entity(table))
+            for partition in partitions:
+                self.put_partition(table_entry, dict(parse_glue_timestamps(partition), DatabaseName=table["DatabaseName"],
+                                                     TableName=table["Name"], CatalogId=catalog_id))
+
+    def count_tables(self, catalog_id):
+        with self.lock:
+            return sum(len(database["tables"]) for database in self.get_catalog(catalog_id).values())
+
+    def count_partitions(self, catalog_id):
+        with self.lock:
+            return sum(table.num_partitions for database in self.get_catalog(catalog_id).values()
+                       for table in database["tables"].values())
+
+    @staticmethod
+    def put_partition(table_entry, partition):
+        key = tuple(partition["Values"])
+        slot = table_entry.partition_index.get(key)
+        if slot is None:
+            table_entry.partition_index[key] = len(table_entry.partition_slots)
+            table_entry.partition_slots.append(encode_glue_entity(partition))
+        else:
+            table_entry.partition_slots[slot] = encode_glue_entity(partition)
+
+    # Glue APIs.
+
+    def get_databases(self, account_id, CatalogId=None, NextToken=None, MaxResults=GLUE_PAGE_SIZE, **kwargs):
+        start = int(NextToken or 0)
+        with self.lock:
+            databases = list(self.get_catalog(CatalogId or account_id).values())
+        page = databases[start:start + MaxResults]
+        response = {"DatabaseList": [decode_glue_entity(database["document"]) for database in page]}
+        if start + MaxResults < len(databases):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def get_database(self, account_id, Name, CatalogId=None, **kwargs):
+        with self.lock:
+            document = self.get_database_entry(CatalogId or account_id, Name)["document"]
+        return {"Database": decode_glue_entity(document)}
+
+    def create_database(self, account_id, DatabaseInput, CatalogId=None, **kwargs):
+        catalog_id = CatalogId or account_id
+        with self.lock:
+            if DatabaseInput["Name"] in self.get_catalog(catalog_id):
+                raise LocalServiceError("AlreadyExistsException", f"Database {DatabaseInput['Name']} already exists.")
+            database = dict(DatabaseInput, CatalogId=catalog_id, CreateTime=datetime.now(timezone.utc))
+            self.get_catalog(catalog_id)[database["Name"]] = {"document": encode_glue_entity(database), "tables": {}}
+        return {}
+
+    def get_tables(self, account_id, DatabaseName, CatalogId=None, NextToken=None, MaxResults=GLUE_PAGE_SIZE, **kwargs):
+        start = int(NextToken or 0)
+        with self.lock:
+            tables = list(self.get_database_entry(CatalogId or account_id, DatabaseName)["tables"].values())
+        page = tables[start:start + MaxResults]
+        response = {"TableList": [decode_glue_entity(table.document) for table in page]}
+        if start + MaxResults < len(tables):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def get_table(self, account_id, DatabaseName, Name, CatalogId=None, **kwargs):
+        with self.lock:
+            document = self.get_table_entry(CatalogId or account_id, DatabaseName, Name).document
+        return {"Table": decode_glue_entity(document)}
+
+    def create_table(self, account_id, DatabaseName, TableInput, CatalogId=None, **kwargs):
+        catalog_id = CatalogId or account_id
+        now = datetime.now(timezone.utc)
+        table = dict(TableInput, DatabaseName=DatabaseName, CatalogId=catalog_id, CreateTime=now, UpdateTime=now,
+                     IsRegisteredWithLakeFormation=False, VersionId="0")
+        with self.lock:
+            tables = self.get_database_entry(catalog_id, DatabaseName)["tables"]
+            if TableInput["Name"] in tables:
+                raise LocalServiceError("AlreadyExistsException", f"Table {TableInput['Name']} already exists.")
+            tables[TableInput["Name"]] = LocalGlueTable(encode_glue_entity(table))
+        return {}
+
+    def update_table(self, account_id, DatabaseName, TableInput, CatalogId=None, **kwargs):
+        catalog_id = CatalogId or account_id
+        with self.lock:
+            table_entry = self.get_table_entry(catalog_id, DatabaseName, TableInput["Name"])
+            current = decode_glue_entity(table_entry.document)
+            table = dict(TableInput, DatabaseName=DatabaseName, CatalogId=catalog_id, CreateTime=current["CreateTime"],
+                         UpdateTime=datetime.now(timezone.utc), IsRegisteredWithLakeFormation=False,
+                         VersionId=str(int(current.get("VersionId", "0")) + 1))
+            table_entry.document = encode_glue_entity(table)
+        return {}
+
+    def get_partitions(self, account_id, DatabaseName, TableName, CatalogId=None, Segment=None, NextToken=None,
+                       MaxResults=GLUE_PARTITION_PAGE_SIZE, ExcludeColumnSchema=False, **kwargs):
+        segment_number = Segment["SegmentNumber"] if Segment else 0
+        total_segments = Segment["TotalSegments"] if Segment else 1
+        position = int(NextToken) if NextToken else segment_number
+        page = []
+        with self.lock:
+            slots = self.get_table_entry(CatalogId or account_id, DatabaseName, TableName).partition_slots
+            while position < len(slots) and len(page) < MaxResults:
+                if slots[position] is not None:
+                    page.append(slots[position])
+                position += total_segments
+            more = position < len(slots)
+
+        partitions = [decode_glue_entity(document) for document in page]
+        if ExcludeColumnSchema:
+            for partition in partitions:
+                partition.get("StorageDescriptor", {}).pop("Columns", None)
+        response = {"Partitions": partitions}
+        if more:
+            response["NextToken"] = str(position)
+        return response
+
+    def batch_get_partition(self, account_id, DatabaseName, TableName, PartitionsToGet, CatalogId=None, **kwargs):
+        if len(PartitionsToGet) > 1000:
+            raise LocalServiceError("InvalidInputException", "A maximum of 1000 partitions can be read per request.")
+        page = []
+        with self.lock:
+            table_entry = self.get_table_entry(CatalogId or account_id, DatabaseName, TableName)
+            for partition_value in PartitionsToGet:
+                slot = table_entry.partition_index.get(tuple(partition_value["Values"]))
+                if slot is not None:
+                    page.append(table_entry.partition_slots[slot])
+        return {"Partitions": [decode_glue_entity(document) for document in page], "UnprocessedKeys": []}
+
+    def batch_create_partition(self, account_id, DatabaseName, TableName, PartitionInputList, CatalogId=None, **kwargs):
+        if len(PartitionInputList) > 100:
+            raise LocalServiceError("InvalidInputException", "A maximum of 100 partitions can be created per request.")
+        catalog_id = CatalogId or account_id
+        now = datetime.now(timezone.utc)
+        errors = []
+        with self.lock:
+            table_entry = self.get_table_entry(catalog_id, DatabaseName, TableName)
+            for partition_input in PartitionInputList:
+                if tuple(partition_input["Values"]) in table_entry.partition_index:
+                    errors.append(self.partition_error(partition_input["Values"], "AlreadyExistsException",
+                                                       "Partition already exists."))
+                    continue
+                self.put_partition(table_entry, dict(partition_input, DatabaseName=DatabaseName, TableName=TableName,
+                                                     CatalogId=catalog_id, CreationTime=now))
+        return {"Errors": errors}
+
+    def batch_update_partition(self, account_id, DatabaseName, TableName, Entries, CatalogId=None, **kwargs):
+        if len(Entries) > 100:
+            raise LocalServiceError("InvalidInputException", "A maximum of 100 partitions can be updated per request.")
+        catalog_id = CatalogId or account_id
+        now = datetime.now(timezone.utc)
+        errors = []
+        with self.lock:
+            table_entry = self.get_table_entry(catalog_id, DatabaseName, TableName)
+            for entry in Entries:
+                slot = table_entry.partition_index.get(tuple(entry["PartitionValueList"]))
+                if slot is None:
+                    errors.append({"PartitionValueList": entry["PartitionValueList"], "ErrorDetail": {
+                        "ErrorCode": "EntityNotFoundException", "ErrorMessage": "Partition not found."}})
+                    continue
+                current = decode_glue_entity(table_entry.partition_slots[slot])
+                self.put_partition(table_entry, dict(entry["PartitionInput"], DatabaseName=DatabaseName,
+                                                     TableName=TableName, CatalogId=catalog_id,
+                                                     CreationTime=current.get("CreationTime", now)))
+        return {"Errors": errors}
+
+    def batch_delete_partition(self, account_id, DatabaseName, TableName, PartitionsToDelete, CatalogId=None, **kwargs):
+        if len(PartitionsToDelete) > 25:
+            raise LocalServiceError("InvalidInputException", "A maximum of 25 partitions can be deleted per request.")
+        errors = []
+        with self.lock:
+            table_entry = self.get_table_entry(CatalogId or account_id, DatabaseName, TableName)
+            for partition_value in PartitionsToDelete:
+                if not self.remove_partition(table_entry, partition_value["Values"]):
+                    errors.append(self.partition_error(partition_value["Values"], "EntityNotFoundException",
+                                                       "Partition not found."))
+        return {"Errors": errors}
+
+    def delete_partition(self, account_id, DatabaseName, TableName, PartitionValues, CatalogId=None, **kwargs):
+        with self.lock:
+            table_entry = self.get_table_entry(CatalogId or account_id, DatabaseName, TableName)
+            if not self.remove_partition(table_entry, PartitionValues):
+                raise LocalServiceError("EntityNotFoundException", "Partition not found.")
+        return {}
+
+    @staticmethod
+    def remove_partition(table_entry, values):
+        slot = table_entry.partition_index.pop(tuple(values), None)
+        if slot is None:
+            return False
+        table_entry.partition_slots[slot] = None
+        return True
+
+    @staticmethod
+    def partition_error(values, error_code, error_message):
+        return {"PartitionValues": values, "ErrorDetail": {"ErrorCode": error_code, "ErrorMessage": error_message}}
+
+
+def get_message_size(message, message_attributes):
+    size = len(message.encode("utf-8"))
+    for name, attribute in (message_attributes or {}).items():
+        size += len(name.encode("utf-8")) + len(attribute["DataType"].encode("utf-8"))
+        size += len(attribute.get("StringValue", "").encode("utf-8"))
+    return size
+
+
+def check_batch(entries, max_entries=10):
+    if len(entries) > max_entries:
+        raise LocalServiceError("TooManyEntriesInBatchRequest", f"A batch may hold at most {max_entries} entries.")
+    if len({entry["Id"] for entry in entries}) < len(entries):
+        raise LocalServiceError("BatchEntryIdsNotDistinct", "Two or more batch entries have the same Id.")
+
+
+class LocalSNS:
+    # Subscribers are callables that receive the Records entry Lambda would get for each message published to the
+    # topic. They are called on the publishing thread, so they should only queue the delivery.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.topics = {}
+        self.num_messages = 0
+
+    def add_topic(self, topic_arn):
+        with self.lock:
+            self.topics.setdefault(topic_arn, [])
+
+    def add_subscriber(self, topic_arn, subscriber):
+        with self.lock:
+            self.topics.setdefault(topic_arn, []).append(subscriber)
+
+    def deliver(self, topic_arn, message, message_attributes):
+        if get_message_size(message, message_attributes) > MAX_MESSAGE_BYTES:
+            raise LocalServiceError("InvalidParameter", "Invalid parameter: Message too long")
+        message_id = str(uuid.uuid4())
+        record = {
+            "EventSource": "aws:sns",
+            "Sns": {
+                "Type": "Notification",
+                "MessageId": message_id,
+                "TopicArn": topic_arn,
+                "Message": message,
+                "MessageAttributes": {name: {"Type": attribute["DataType"], "Value": attribute.get("StringValue")}
+                                      for name, attribute in (message_attributes or {}).items()}
+            }
+        }
+        with self.lock:
+            self.num_messages += 1
+            subscribers = list(self.topics[topic_arn])
+        for subscriber in subscribers:
+            subscriber(record)
+        return message_id
+
+    def check_topic(self, topic_arn):
+        with self.lock:
+            if topic_arn not in self.topics:
+                raise LocalServiceError("NotFound", "Topic does not exist", 404)
+
+    def publish(self, account_id, TopicArn, Message, MessageAttributes=None, **kwargs):
+        self.check_topic(TopicArn)
+        return {"MessageId": self.deliver(TopicArn, Message, MessageAttributes)}
+
+    def publish_batch(self, account_id, TopicArn, PublishBatchRequestEntries, **kwargs):
+        self.check_topic(TopicArn)
+        check_batch(PublishBatchRequestEntries)
+        if sum(get_message_size(entry["Message"], entry.get("MessageAttributes"))
+               for entry in PublishBatchRequestEntries) > MAX_MESSAGE_BYTES:
+            raise LocalServiceError("BatchRequestTooLong", "The length of all the messages put together is more than the limit.")
+        successful = [{"Id": entry["Id"], "MessageId": self.deliver(TopicArn, entry["Message"], entry.get("MessageAttributes"))}
+                      for entry in PublishBatchRequestEntries]
+        return {"Successful": successful, "Failed": []}
+
+
+class LocalQueue:
+    def __init__(self, queue_url, max_receive_count):
+        self.queue_url = queue_url
+        self.max_receive_count = max_receive_count
+        self.visible = deque()
+        self.in_flight = {}
+        self.dead_letters = []
+
+
+class LocalSQS:
+    # Besides the send APIs, receive_batch and complete_batch play the part of a Lambda event source mapping:
+    # messages are handed out as the Records of an SQS event and the ones reported as failed become visible again
+    # until they have been received max_receive_count times.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def add_queue(self, queue_url, max_receive_count=3):
+        with self.lock:
+            self.queues.setdefault(queue_url, LocalQueue(queue_url, max_receive_count))
+
+    def get_queue(self, queue_url):
+        queue = self.queues.get(queue_url)
+        if queue is None:
+            raise LocalServiceError("AWS.SimpleQueueService.NonExistentQueue", "The specified queue does not exist.")
+        return queue
+
+    def enqueue(self, queue, message_body, message_attributes, check_size=True):
+        if check_size and get_message_size(message_body, message_attributes) > MAX_MESSAGE_BYTES:
+            raise LocalServiceError("InvalidParameterValue", "One or more parameters are invalid.")
+        message_id = str(uuid.uuid4())
+        queue.visible.append({
+            "messageId": message_id,
+            "body": message_body,
+            "attributes": {"ApproximateReceiveCount": "0"},
+            "messageAttributes": {name: {"stringValue": attribute.get("StringValue"), "dataType": attribute["DataType"]}
+                                  for name, attribute in (message_attributes or {}).items()},
+            "md5OfBody": hashlib.md5(message_body.encode("utf-8")).hexdigest(),
+            "eventSource": "aws:sqs",
+            "eventSourceARN": queue.queue_url
+        })
+        return message_id
+
+    def send_notification(self, queue_url, notification):
+        # Delivery from an SNS subscription: the envelope of a message within the SNS size limit is always accepted.
+        with self.lock:
+            self.enqueue(self.get_queue(queue_url), json.dumps(notification), None, check_size=False)
+
+    def send_message(self, account_id, QueueUrl, MessageBody, MessageAttributes=None, **kwargs):
+        with self.lock:
+            message_id = self.enqueue(self.get_queue(QueueUrl), MessageBody, MessageAttributes)
+        return {"MessageId": message_id, "MD5OfMessageBody": hashlib.md5(MessageBody.encode("utf-8")).hexdigest()}
+
+    def send_message_batch(self, account_id, QueueUrl, Entries, **kwargs):
+        check_batch(Entries)
+        if sum(get_message_size(entry["MessageBody"], entry.get("MessageAttributes")) for entry in Entries) > MAX_MESSAGE_BYTES:
+            raise LocalServiceError("AWS.SimpleQueueService.BatchRequestTooLong", "Batch requests cannot be longer than 262144 bytes.")
+        successful = []
+        with self.lock:
+            queue = self.get_queue(QueueUrl)
+            for entry in Entries:
+                message_id = self.enqueue(queue, entry["MessageBody"], entry.get("MessageAttributes"))
+                successful.append({"Id": entry["Id"], "MessageId": message_id,
+                                   "MD5OfMessageBody": hashlib.md5(entry["MessageBody"].encode("utf-8")).hexdigest()})
+        return {"Successful": successful, "Failed": []}
+
+    def receive_batch(self, queue_url, max_messages):
+        records = []
+        with self.lock:
+            queue = self.queues[queue_url]
+            while queue.visible and len(records) < max_messages:
+                record = queue.visible.popleft()
+                record["attributes"]["ApproximateReceiveCount"] = str(int(record["attributes"]["ApproximateReceiveCount"]) + 1)
+                queue.in_flight[record["messageId"]] = record
+                records.append(json.loads(json.dumps(record)))
+        return records
+
+    def complete_batch(self, queue_url, records, failed_message_ids=()):
+        with self.lock:
+            queue = self.queues[queue_url]
+            for record in records:
+                message = queue.in_flight.pop(record["messageId"])
+                if record["messageId"] not in failed_message_ids:
+                    continue
+                if int(message["attributes"]["ApproximateReceiveCount"]) >= queue.max_receive_count:
+                    queue.dead_letters.append(message)
+                else:
+                    queue.visible.append(message)
+
+    def count_messages(self, queue_url):
+        with self.lock:
+            queue = self.queues[queue_url]
+            return len(queue.visible) + len(queue.in_flight)
+
+    def count_dead_letters(self, queue_url):
+        with self.lock:
+            return len(self.queues[queue_url].dead_letters)
+
+
+class LocalS3:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.uploads = {}
+
+    def add_bucket(self, bucket_name):
+        with self.lock:
+            self.buckets.setdefault(bucket_name, {})
+
+    def get_bucket(self, bucket_name):
+        bucket = self.buckets.get(bucket_name)
+        if bucket is None:
+            raise LocalServiceError("NoSuchBucket", "The specified bucket does not exist", 404)
+        return bucket
+
+    @staticmethod
+    def read_body(body):
+        if hasattr(body, "read"):
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return bytes(body or b"")
+
+    def store(self, bucket_name, key, content, metadata, content_type):
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        with self.lock:
+            self.get_bucket(bucket_name)[key] = {
+                "content": content,
+                "metadata": {name.lower(): value for name, value in (metadata or {}).items()},
+                "content_type": content_type or "binary/octet-stream",
+                "etag": etag
+            }
+        return etag
+
+    def put_object(self, account_id, Bucket, Key, Body=b"", Metadata=None, ContentType=None, **kwargs):
+        return {"ETag": self.store(Bucket, Key, self.read_body(Body), Metadata, ContentType)}
+
+    def get_object(self, account_id, Bucket, Key, **kwargs):
+        with self.lock:
+            stored = self.get_bucket(Bucket).get(Key)
+        if stored is None:
+            raise LocalServiceError("NoSuchKey", "The specified key does not exist.", 404)
+        content = stored["content"]
+        return {
+            "Body": StreamingBody(io.BytesIO(content), len(content)),
+            "ContentLength": len(content),
+            "ContentType": stored["content_type"],
+            "ETag": stored["etag"],
+            "Metadata": dict(stored["metadata"])
+        }
+
+    def create_multipart_upload(self, account_id, Bucket, Key, Metadata=None, ContentType=None, **kwargs):
+        upload_id = str(uuid.uuid4())
+        with self.lock:
+            self.get_bucket(Bucket)
+            self.uploads[upload_id] = {"bucket": Bucket, "key": Key, "metadata": Metadata, "content_type": ContentType,
+                                       "parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def get_upload(self, upload_id):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise LocalServiceError("NoSuchUpload", "The specified upload does not exist.", 404)
+        return upload
+
+    def upload_part(self, account_id, Bucket, Key, UploadId, PartNumber, Body=b"", **kwargs):
+        content = self.read_body(Body)
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        with self.lock:
+            self.get_upload(UploadId)["parts"][PartNumber] = (content, etag)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, account_id, Bucket, Key, UploadId, MultipartUpload=None, **kwargs):
+        with self.lock:
+            upload = self.get_upload(UploadId)
+            parts = []
+            for part in (MultipartUpload or {}).get("Parts", []):
+                content, etag = upload["parts"].get(part["PartNumber"], (None, None))
+                if etag != part["ETag"]:
+                    raise LocalServiceError("InvalidPart", f"Part {part['PartNumber']} could not be found.")
+                parts.append(content)
+            if any(len(content) < S3_MIN_PART_SIZE for content in parts[:-1]):
+                raise LocalServiceError("EntityTooSmall", "Your proposed upload is smaller than the minimum allowed size.")
+            del self.uploads[UploadId]
+        etag = self.store(Bucket, Key, b"".join(parts), upload["metadata"], upload["content_type"])
+        return {"Bucket": Bucket, "Key": Key, "ETag": etag}
+
+    def abort_multipart_upload(self, account_id, Bucket, Key, UploadId, **kwargs):
+        with self.lock:
+            self.get_upload(UploadId)
+            del self.uploads[UploadId]
+        return {}
+
+    def delete_objects(self, account_id, Bucket, Delete, **kwargs):
+        with self.lock:
+            bucket = self.get_bucket(Bucket)
+            for deleted in Delete.get("Objects", []):
+                bucket.pop(deleted["Key"], None)
+        if Delete.get("Quiet"):
+            return {}
+        return {"Deleted": [{"Key": deleted["Key"]} for deleted in Delete.get("Objects", [])]}
+
+    def count_objects(self, bucket_name):
+        with self.lock:
+            return len(self.get_bucket(bucket_name))
+
+
+class LocalDynamoDB:
+    # Tables belong to an account and are created with the names of their key attributes. Items are stored in
+    # the low-level attribute value format the client sends.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def add_table(self, account_id, table_name, key_names):
+        with self.lock:
+            self.tables.setdefault((account_id, table_name), {"key_names": tuple(key_names), "items": {}})
+
+    def get_table(self, account_id, table_name):
+        table = self.tables.get((account_id, table_name))
+        if table is None:
+            raise LocalServiceError("ResourceNotFoundException", "Requested resource not found")
+        return table
+
+    @staticmethod
+    def get_key(table, item):
+        try:
+            return tuple(json.dumps(item[key_name], sort_keys=True) for key_name in table["key_names"])
+        except KeyError:
+            raise LocalServiceError("ValidationException", "The provided key element does not match the schema")
+
+    @staticmethod
+    def project(item, projection_expression, expression_attribute_names):
+        if not projection_expression:
+            return json.loads(json.dumps(item))
+        names = [(expression_attribute_names or {}).get(name.strip(), name.strip())
+                 for name in projection_expression.split(",")]
+        return json.loads(json.dumps({name: item[name] for name in names if name in item}))
+
+    def count_items(self, account_id, table_name):
+        with self.lock:
+            return len(self.get_table(account_id, table_name)["items"])
+
+    def put_item(self, account_id, TableName, Item, **kwargs):
+        with self.lock:
+            table = self.get_table(account_id, TableName)
+            table["items"][self.get_key(table, Item)] = json.loads(json.dumps(Item))
+        return {}
+
+    def get_item(self, account_id, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        with self.lock:
+            table = self.get_table(account_id, TableName)
+            item = table["items"].get(self.get_key(table, Key))
+            if item is None:
+                return {}
+            return {"Item": self.project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def delete_item(self, account_id, TableName, Key, **kwargs):
+        with self.lock:
+            table = self.get_table(account_id, TableName)
+            table["items"].pop(self.get_key(table, Key), None)
+        return {}
+
+    def batch_write_item(self, account_id, RequestItems, **kwargs):
+        if sum(len(requests) for requests in RequestItems.values()) > 25:
+            raise LocalServiceError("ValidationException", "Too many items requested for the BatchWriteItem call")
+        with self.lock:
+            for table_name, requests in RequestItems.items():
+                table = self.get_table(account_id, table_name)
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = request["PutRequest"]["Item"]
+                        table["items"][self.get_key(table, item)] = json.loads(json.dumps(item))
+                    else:
+                        table["items"].pop(self.get_key(table, request["DeleteRequest"]["Key"]), None)
+        return {"UnprocessedItems": {}}
+
+    def batch_get_item(self, account_id, RequestItems, **kwargs):
+        if sum(len(request["Keys"]) for request in RequestItems.values()) > 100:
+            raise LocalServiceError("ValidationException", "Too many items requested for the BatchGetItem call")
+        responses = {}
+        with self.lock:
+            for table_name, request in RequestItems.items():
+                table = self.get_table(account_id, table_name)
+                items = (table["items"].get(self.get_key(table, key)) for key in request["Keys"])
+                responses[table_name] = [
+                    self.project(item, request.get("ProjectionExpression"), request.get("ExpressionAttributeNames"))
+                    for item in items if item is not None
+                ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
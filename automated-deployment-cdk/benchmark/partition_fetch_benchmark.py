@@ -0,0 +1,73 @@
+"""
+Measures wall-clock time of GlueUtil.get_partitions for a range of segment counts against a local Glue stub
+that sleeps for a fixed latency on every GetPartitions page.
+
+Usage:
+    python3 benchmark/partition_fetch_benchmark.py --partitions 50000 --latency-ms 150 --segments 1 2 4 8 10
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "target-account", "lambda", "ImportLargeTable"))
+
+from util.glue_util import GlueUtil
+
+
+class StubPartitionPaginator:
+    def __init__(self, partitions, page_size, latency):
+        self.partitions = partitions
+        self.page_size = page_size
+        self.latency = latency
+
+    def paginate(self, **kwargs):
+        segment = kwargs.get("Segment", {"SegmentNumber": 0, "TotalSegments": 1})
+        segment_partitions = self.partitions[segment["SegmentNumber"]::segment["TotalSegments"]]
+        for i in range(0, len(segment_partitions), self.page_size):
+            time.sleep(self.latency)
+            yield {"Partitions": segment_partitions[i:i + self.page_size]}
+
+
+class StubGlueClient:
+    def __init__(self, num_partitions, page_size, latency):
+        self.partitions = [
+            {
+                "Values": [str(i)],
+                "DatabaseName": "benchmark_db",
+                "TableName": "benchmark_table",
+                "StorageDescriptor": {"Location": f"s3://benchmark-bucket/benchmark_table/part={i}/"}
+            }
+            for i in range(num_partitions)
+        ]
+        self.page_size = page_size
+        self.latency = latency
+
+    def get_paginator(self, operation_name):
+        return StubPartitionPaginator(self.partitions, self.page_size, self.latency)
+
+
+def run_benchmark(num_partitions, page_size, latency_ms, segment_counts):
+    glue = StubGlueClient(num_partitions, page_size, latency_ms / 1000)
+    glue_util = GlueUtil()
+    baseline = None
+
+    print(f"Partitions: {num_partitions}, page size: {page_size}, latency per page: {latency_ms} ms")
+    for total_segments in segment_counts:
+        start = time.perf_counter()
+        partitions = glue_util.get_partitions(glue, "123456789012", "benchmark_db", "benchmark_table", total_segments)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        assert len(partitions) == num_partitions
+        print(f"Segments: {total_segments:>2}, wall-clock: {elapsed:7.3f} s, speed-up: {baseline / elapsed:5.2f}x, "
+              f"partitions/s: {num_partitions / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GetPartitions segment scaling benchmark")
+    parser.add_argument("--partitions", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 2, 4, 8, 10])
+    args = parser.parse_args()
+    run_benchmark(args.partitions, args.page_size, args.latency_ms, args.segments)
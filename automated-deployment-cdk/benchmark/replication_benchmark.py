@@ -0,0 +1,366 @@
+"""
+Runs a full replication in one process: GDCReplicationPlanner, ExportLambda, ExportLargeTable, ImportDatabaseOrTable,
+ImportLargeTable and DLQImportDatabaseOrTable are wired together through the local stand-in of Glue, SNS, SQS, S3
+and DynamoDB (local_aws.py), and the replication of a synthetic source catalog (synthetic_catalog.py) is timed end to end.
+
+Topics invoke their subscribed function once per message and queues are polled like an event source mapping, with
+the batch sizes of the templates; up to --concurrency invocations run at the same time. Handler output is discarded
+unless --verbose is given. Reports tables/s, partitions/s, invocations per function, calls per API and the stage
+metrics the handlers print as CloudWatch Embedded Metric Format documents, summed per function.
+
+Usage:
+    python3 benchmark/replication_benchmark.py --databases 5 --tables 40 --partitions 0 2000 --latency-ms 20 --concurrency 10
+    python3 benchmark/replication_benchmark.py --preset small --latency-ms 5
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from local_aws import LocalAWS
+from synthetic_catalog import PRESETS, SyntheticCatalog, TableProfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+REGION = "us-east-1"
+SOURCE_ACCOUNT_ID = "111111111111"
+TARGET_ACCOUNT_ID = "222222222222"
+REPLICATION_PLANNER_TOPIC_ARN = f"arn:aws:sns:{REGION}:{SOURCE_ACCOUNT_ID}:ReplicationPlannerSNSTopic"
+SCHEMA_DISTRIBUTION_TOPIC_ARN = f"arn:aws:sns:{REGION}:{SOURCE_ACCOUNT_ID}:SchemaDistributionSNSTopic"
+SOURCE_LARGE_TABLE_QUEUE_URL = f"https://sqs.{REGION}.amazonaws.com/{SOURCE_ACCOUNT_ID}/LargeTableSQSQueue"
+TARGET_LARGE_TABLE_QUEUE_URL = f"https://sqs.{REGION}.amazonaws.com/{TARGET_ACCOUNT_ID}/LargeTableSQSQueue"
+DEAD_LETTER_QUEUE_URL = f"https://sqs.{REGION}.amazonaws.com/{TARGET_ACCOUNT_ID}/DeadLetterQueue"
+IMPORT_SCHEMA_QUEUE_URL = f"https://sqs.{REGION}.amazonaws.com/{TARGET_ACCOUNT_ID}/ImportSchemaSQSQueue"
+EXPORT_BUCKET_NAME = "gdc-replication-export-bucket"
+LARGE_TABLE_SCHEMA_BUCKET_NAME = "gdc-replication-large-table-schema-bucket"
+
+# Environment variables are process-wide. ExportLambda and ImportDatabaseOrTable read theirs when they are loaded, so
+# FUNCTION_ENVIRONMENT is applied while each function is loaded; the other functions read ENVIRONMENT on every
+# invocation and therefore share one value per variable, as set in the templates where they agree.
+ENVIRONMENT = {
+    "region": REGION,
+    "source_glue_catalog_id": SOURCE_ACCOUNT_ID,
+    "target_glue_catalog_id": TARGET_ACCOUNT_ID,
+    "database_prefix_list": "",
+    "separator": "|",
+    "sns_topic_arn_gdc_replication_planner": REPLICATION_PLANNER_TOPIC_ARN,
+    "ddb_name_gdc_replication_planner": "glue_database_export_task",
+    "sns_topic_arn_export_dbs_tables": SCHEMA_DISTRIBUTION_TOPIC_ARN,
+    "sns_topic_arn_table_list": REPLICATION_PLANNER_TOPIC_ARN,
+    "ddb_name_db_export_status": "db_status",
+    "ddb_name_table_export_status": "table_status",
+    "s3_bucket_name": EXPORT_BUCKET_NAME,
+    "s3_large_table_schema": LARGE_TABLE_SCHEMA_BUCKET_NAME,
+    "skip_unchanged_tables": "true",
+    "unchanged_table_max_age_hours": "168",
+    "partition_segments": "4",
+    "partition_object_format": "manifest",
+    "partitions_per_part": "20000",
+    "publish_parts": "true",
+    "ddb_name_db_import_status": "db_status",
+    "ddb_name_table_import_status": "table_status",
+    "skip_archive": "true",
+    "sqs_queue_url_large_tables": TARGET_LARGE_TABLE_QUEUE_URL,
+    "dlq_url_sqs": DEAD_LETTER_QUEUE_URL,
+    "partition_batch_workers": "5",
+    "partition_delete_rate_limit": "0",
+    "import_deadline_reserve_ms": "30000",
+    "max_import_continuations": "100",
+    "record_workers": "1",
+}
+FUNCTION_ENVIRONMENT = {
+    "ExportLambda": {"sqs_queue_url_large_tables": SOURCE_LARGE_TABLE_QUEUE_URL},
+    "ImportLambda": {"record_workers": "10"},
+}
+# DynamoDB tables of each account and their key attributes, as in the templates.
+DYNAMODB_TABLES = {
+    SOURCE_ACCOUNT_ID: {
+        "glue_database_export_task": ("db_id", "export_run_id"),
+        "db_status": ("db_id", "export_run_id"),
+        "table_status": ("table_id", "export_run_id"),
+    },
+    TARGET_ACCOUNT_ID: {
+        "db_status": ("db_id", "import_run_id"),
+        "table_status": ("table_id", "import_run_id"),
+    },
+}
+
+
+class LocalContext:
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self.deadline - time.monotonic()) * 1000), 0)
+
+    def log(self, message):
+        print(message)
+
+
+class LocalFunction:
+    def __init__(self, name, code_path, module_name, session, timeout_seconds):
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self.handler = load_handler(code_path, module_name, session, FUNCTION_ENVIRONMENT.get(name, {}))
+        self.lock = threading.Lock()
+        self.invocations = 0
+        self.errors = 0
+        self.duration = 0.0
+
+    def invoke(self, event):
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.handler(event, LocalContext(self.name, self.timeout_seconds))
+            failed = False
+            return response
+        finally:
+            with self.lock:
+                self.invocations += 1
+                self.errors += failed
+                self.duration += time.perf_counter() - start
+
+
+def load_handler(code_path, module_name, session, environment):
+    # Every function has its own util package, so it is imported on its own and dropped from sys.modules once the
+    # handler holds on to it. The clients of the function are created from session.
+    def unload_util():
+        for name in [name for name in sys.modules if name == "util" or name.startswith("util.")]:
+            del sys.modules[name]
+
+    unload_util()
+    saved_environment = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    sys.path.insert(0, code_path)
+    try:
+        importlib.import_module("util.client_registry").session = session
+        return importlib.import_module(module_name).lambda_handler
+    finally:
+        sys.path.remove(code_path)
+        unload_util()
+        for name, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class LocalPipeline:
+    # Delivers SNS messages and SQS batches to the functions and runs the invocations on a thread pool until no
+    # message is left to deliver or the time limit is reached.
+    def __init__(self, local_aws, concurrency):
+        self.local_aws = local_aws
+        self.concurrency = concurrency
+        self.deliveries = deque()
+        self.event_sources = []
+
+    def subscribe(self, topic_arn, function):
+        self.local_aws.sns.add_topic(topic_arn)
+        self.local_aws.sns.add_subscriber(topic_arn, lambda record: self.deliveries.append((function, [record], None)))
+
+    def subscribe_queue(self, topic_arn, queue_url):
+        # The notification envelope is delivered as the message body, as for a subscription without raw message delivery.
+        self.local_aws.sns.add_topic(topic_arn)
+        self.local_aws.sqs.add_queue(queue_url)
+        self.local_aws.sns.add_subscriber(topic_arn, lambda record: self.local_aws.sqs.send_notification(queue_url, record["Sns"]))
+
+    def add_event_source(self, queue_url, function, batch_size):
+        self.local_aws.sqs.add_queue(queue_url)
+        self.event_sources.append((queue_url, function, batch_size))
+
+    def next_invocation(self):
+        try:
+            return self.deliveries.popleft()
+        except IndexError:
+            pass
+        for queue_url, function, batch_size in self.event_sources:
+            records = self.local_aws.sqs.receive_batch(queue_url, batch_size)
+            if records:
+                return function, records, queue_url
+        return None
+
+    def invoke(self, function, records, queue_url):
+        failed_message_ids = set()
+        try:
+            response = function.invoke({"Records": records})
+            if isinstance(response, dict):
+                failed_message_ids = {failure["itemIdentifier"] for failure in response.get("batchItemFailures", [])}
+        except Exception as e:
+            failed_message_ids = {record.get("messageId") for record in records}
+            print(f"{function.name} failed: {e!r}", file=sys.stderr)
+        if queue_url:
+            self.local_aws.sqs.complete_batch(queue_url, records, failed_message_ids)
+
+    def run(self, time_limit):
+        deadline = time.monotonic() + time_limit
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            running = set()
+            while True:
+                while len(running) < self.concurrency and time.monotonic() < deadline:
+                    invocation = self.next_invocation()
+                    if invocation is None:
+                        break
+                    running.add(executor.submit(self.invoke, *invocation))
+                if not running:
+                    return time.monotonic() < deadline
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+
+
+class MetricsCollector(io.TextIOBase):
+    # Replaces stdout while the handlers run. Embedded Metric Format documents, which the handlers print on a single
+    # line, are summed per function; everything else is passed on to stream, or discarded without one.
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.metrics = defaultdict(Counter)
+        self.units = {}
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        if text.startswith('{"_aws"'):
+            document = json.loads(text)
+            with self.lock:
+                for directive in document["_aws"]["CloudWatchMetrics"]:
+                    for metric in directive["Metrics"]:
+                        self.metrics[document["FunctionName"]][metric["Name"]] += document[metric["Name"]]
+                        self.units[metric["Name"]] = metric["Unit"]
+        if self.stream:
+            self.stream.write(text)
+        return len(text)
+
+    def flush(self):
+        if self.stream:
+            self.stream.flush()
+
+
+def create_pipeline(local_aws, concurrency):
+    for account_id, tables in DYNAMODB_TABLES.items():
+        for table_name, key_names in tables.items():
+            local_aws.dynamodb.add_table(account_id, table_name, key_names)
+    local_aws.s3.add_bucket(EXPORT_BUCKET_NAME)
+    local_aws.s3.add_bucket(LARGE_TABLE_SCHEMA_BUCKET_NAME)
+    os.environ.update(ENVIRONMENT)
+
+    source_session = local_aws.create_session(SOURCE_ACCOUNT_ID, REGION)
+    target_session = local_aws.create_session(TARGET_ACCOUNT_ID, REGION)
+    source_lambda = os.path.join(ROOT, "source-account", "lambda")
+    target_lambda = os.path.join(ROOT, "target-account", "lambda")
+    functions = {
+        "GDCReplicationPlanner": LocalFunction("GDCReplicationPlanner", os.path.join(source_lambda, "GDCReplicationPlanner"),
+                                               "GDCReplicationPlanner", source_session, 600),
+        "ExportLambda": LocalFunction("ExportLambda", os.path.join(source_lambda, "ExportLambda"),
+                                      "ExportLambda", source_session, 600),
+        "ExportLargeTable": LocalFunction("ExportLargeTable", os.path.join(source_lambda, "ExportLargeTable"),
+                                          "ExportLargeTable", source_session, 195),
+        "ImportLambda": LocalFunction("ImportLambda", os.path.join(target_lambda, "ImportLambda"),
+                                      "ImportDatabaseOrTable", target_session, 600),
+        "ImportLargeTable": LocalFunction("ImportLargeTable", os.path.join(target_lambda, "ImportLargeTable"),
+                                          "ImportLargeTable", target_session, 195),
+        "DLQProcessorLambda": LocalFunction("DLQProcessorLambda", os.path.join(target_lambda, "DLQProcessorLambda"),
+                                            "DLQImportDatabaseOrTable", target_session, 180),
+    }
+
+    pipeline = LocalPipeline(local_aws, concurrency)
+    pipeline.subscribe(REPLICATION_PLANNER_TOPIC_ARN, functions["ExportLambda"])
+    pipeline.subscribe_queue(SCHEMA_DISTRIBUTION_TOPIC_ARN, IMPORT_SCHEMA_QUEUE_URL)
+    pipeline.add_event_source(IMPORT_SCHEMA_QUEUE_URL, functions["ImportLambda"], 10)
+    pipeline.add_event_source(SOURCE_LARGE_TABLE_QUEUE_URL, functions["ExportLargeTable"], 1)
+    pipeline.add_event_source(TARGET_LARGE_TABLE_QUEUE_URL, functions["ImportLargeTable"], 1)
+    pipeline.add_event_source(DEAD_LETTER_QUEUE_URL, functions["DLQProcessorLambda"], 10)
+    return pipeline, functions
+
+
+def count_replicated(glue):
+    # A table counts as replicated once it has all of its source partitions in the target catalog.
+    replicated_tables = 0
+    replicated_partitions = 0
+    for database_name, database in glue.get_catalog(SOURCE_ACCOUNT_ID).items():
+        target_database = glue.get_catalog(TARGET_ACCOUNT_ID).get(database_name, {"tables": {}})
+        for table_name, table in database["tables"].items():
+            target_table = target_database["tables"].get(table_name)
+            if target_table is None:
+                continue
+            replicated_partitions += min(target_table.num_partitions, table.num_partitions)
+            replicated_tables += target_table.partition_index.keys() >= table.partition_index.keys()
+    return replicated_tables, replicated_partitions
+
+
+def run_benchmark(args):
+    local_aws = LocalAWS(latency_ms=args.latency_ms, throttle_rates={"*": args.throttle_rate} if args.throttle_rate else {},
+                         request_quotas={"glue": args.glue_quota} if args.glue_quota else {}, seed=args.seed)
+    if args.preset:
+        catalog = SyntheticCatalog.from_preset(SOURCE_ACCOUNT_ID, args.preset, args.seed or 0)
+    else:
+        catalog = SyntheticCatalog(SOURCE_ACCOUNT_ID, args.databases, args.tables,
+                                   [TableProfile(tuple(args.partitions), tuple(args.columns), tuple(args.partition_keys))],
+                                   args.seed or 0)
+    catalog.load(local_aws.glue)
+    num_tables = local_aws.glue.count_tables(SOURCE_ACCOUNT_ID)
+    num_partitions = local_aws.glue.count_partitions(SOURCE_ACCOUNT_ID)
+    print(f"Source catalog: {catalog.num_databases} databases, {num_tables} tables, {num_partitions} partitions")
+    print(f"Latency per call: {args.latency_ms} ms, throttle rate: {args.throttle_rate}, "
+          f"Glue quota: {args.glue_quota or 'none'} requests/s per API, concurrency: {args.concurrency}")
+
+    collector = MetricsCollector(sys.stdout if args.verbose else None)
+    with contextlib.redirect_stdout(collector):
+        pipeline, functions = create_pipeline(local_aws, args.concurrency)
+        local_aws.reset_call_counts()
+        start = time.perf_counter()
+        functions["GDCReplicationPlanner"].invoke({})
+        completed = pipeline.run(args.time_limit)
+        elapsed = time.perf_counter() - start
+
+    replicated_tables, replicated_partitions = count_replicated(local_aws.glue)
+    print(f"{'Completed' if completed else 'Stopped at the time limit'} in {elapsed:.2f} s: "
+          f"{replicated_tables}/{num_tables} tables and {replicated_partitions}/{num_partitions} partitions replicated")
+    print(f"Throughput: {replicated_tables / elapsed:,.1f} tables/s, {replicated_partitions / elapsed:,.0f} partitions/s")
+
+    print("Invocations:")
+    for function in functions.values():
+        print(f"  {function.name:<22} {function.invocations:>6} invocations, {function.errors:>4} errors, "
+              f"{function.duration:8.2f} s")
+    for queue_url, function, batch_size in pipeline.event_sources:
+        left = local_aws.sqs.count_messages(queue_url)
+        dead_letters = local_aws.sqs.count_dead_letters(queue_url)
+        if left or dead_letters:
+            print(f"  {queue_url}: {left} messages left, {dead_letters} messages dropped after repeated failures")
+
+    calls, throttled = local_aws.get_call_counts()
+    print(f"API calls: {sum(calls.values())}, throttled: {sum(throttled.values())}")
+    for api_name, count in sorted(calls.items()):
+        print(f"  {api_name:<36} {count:>8} {throttled[api_name]:>8} throttled")
+
+    print("Stage metrics:")
+    for function_name, metrics in sorted(collector.metrics.items()):
+        print(f"  {function_name}")
+        for name, value in sorted(metrics.items()):
+            unit = collector.units[name]
+            value = f"{value / 1000:12.2f} s" if unit == "Milliseconds" else f"{value:>12,} {unit.lower()}"
+            print(f"    {name:<34} {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end replication benchmark against local AWS services")
+    parser.add_argument("--preset", choices=sorted(PRESETS), help="synthetic catalog preset, overrides the catalog shape")
+    parser.add_argument("--databases", type=int, default=3)
+    parser.add_argument("--tables", type=int, default=20, help="tables per database")
+    parser.add_argument("--partitions", type=int, nargs=2, default=[100, 100], metavar=("MIN", "MAX"),
+                        help="partitions per table")
+    parser.add_argument("--columns", type=int, nargs=2, default=[10, 10], metavar=("MIN", "MAX"))
+    parser.add_argument("--partition-keys", type=int, nargs=2, default=[1, 1], metavar=("MIN", "MAX"))
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability of any call being throttled")
+    parser.add_argument("--glue-quota", type=float, default=0, help="requests per second per Glue API, 0 for no quota")
+    parser.add_argument("--concurrency", type=int, default=10, help="invocations running at the same time")
+    parser.add_argument("--time-limit", type=float, default=600, help="seconds before delivery stops")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="show the output of the handlers")
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,305 @@
+"""
+Generates synthetic Glue catalogs of configurable shape: number of databases and tables, and per table profile the
+number of columns, partition keys and partitions. Profiles make skewed catalogs possible, e.g. a few tables with
+500,000 partitions among thousands of tables with a handful. Databases, tables and partitions are returned in the
+shape GlueUtil.get_databases, GlueUtil.get_tables and GlueUtil.get_partitions return them (timestamps as strings),
+generated deterministically from a seed. Partitions are generated lazily, one table at a time.
+
+Run as a script, prints how ExportLambda would classify the tables of a preset or custom catalog.
+
+Usage:
+    python3 benchmark/synthetic_catalog.py --preset skewed
+    python3 benchmark/synthetic_catalog.py --databases 10 --tables 200 --partitions 0 50 --columns 5 40
+"""
+import argparse
+import json
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+COLUMN_TYPES = ["string", "bigint", "int", "double", "boolean", "timestamp", "date", "decimal(18,4)", "array<string>",
+                "map<string,string>", "struct<id:bigint,name:string>"]
+PARTITION_KEYS = [("dt", "date"), ("region", "string"), ("hour", "int"), ("source", "string"), ("bucket", "int")]
+STORAGE_FORMATS = {
+    "parquet": ("org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"),
+    "orc": ("org.apache.hadoop.hive.ql.io.orc.OrcInputFormat",
+            "org.apache.hadoop.hive.ql.io.orc.OrcOutputFormat",
+            "org.apache.hadoop.hive.ql.io.orc.OrcSerde"),
+    "csv": ("org.apache.hadoop.mapred.TextInputFormat",
+            "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+            "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe"),
+    "json": ("org.apache.hadoop.mapred.TextInputFormat",
+             "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+             "org.openx.data.jsonserde.JsonSerDe"),
+}
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# ExportLambda's partition_threshold and table_partitions_threshold, used by the summary.
+PARTITION_THRESHOLD = 10
+TABLE_PARTITIONS_THRESHOLD = 245000
+
+
+class TableProfile:
+    # Shape of a group of tables. Ranges are (min, max) and inclusive; partition counts are drawn log-uniformly so
+    # that a wide range still yields mostly small tables. count fixes the number of tables with this profile; the
+    # tables left are shared out between the profiles without a count in proportion to their weight.
+    def __init__(self, partitions=(0, 100), columns=(5, 30), partition_keys=(1, 3), count=None, weight=1.0,
+                 formats=("parquet", "orc", "csv", "json")):
+        self.partitions = partitions
+        self.columns = columns
+        self.partition_keys = partition_keys
+        self.count = count
+        self.weight = weight
+        self.formats = formats
+
+
+PRESETS = {
+    "uniform": {"databases": 3, "tables_per_database": 20,
+                "profiles": [TableProfile(partitions=(100, 100), columns=(10, 10), partition_keys=(1, 1))]},
+    "small": {"databases": 5, "tables_per_database": 50, "profiles": [TableProfile(partitions=(0, 200))]},
+    "skewed": {"databases": 20, "tables_per_database": 200,
+               "profiles": [TableProfile(partitions=(500000, 500000), count=3),
+                            TableProfile(partitions=(10000, 100000), count=30),
+                            TableProfile(partitions=(0, 20))]},
+    "wide": {"databases": 2, "tables_per_database": 50,
+             "profiles": [TableProfile(partitions=(0, 10), columns=(500, 2000), partition_keys=(1, 1), weight=1),
+                          TableProfile(partitions=(11, 1000), columns=(200, 800), weight=1)]},
+}
+
+
+class SyntheticTable:
+    # Everything needed to generate a table and, later, its partitions.
+    def __init__(self, database_name, table_name, num_partitions, num_columns, num_partition_keys, storage_format, seed):
+        self.database_name = database_name
+        self.table_name = table_name
+        self.num_partitions = num_partitions
+        self.num_columns = num_columns
+        self.num_partition_keys = num_partition_keys
+        self.storage_format = storage_format
+        self.seed = seed
+
+
+class SyntheticCatalog:
+    def __init__(self, catalog_id, num_databases, tables_per_database, profiles=None, seed=0):
+        self.catalog_id = catalog_id
+        self.num_databases = num_databases
+        self.tables_per_database = tables_per_database
+        self.seed = seed
+        self.tables = self.plan_tables(profiles or [TableProfile()])
+        self.tables_by_name = {(table.database_name, table.table_name): table for table in self.tables}
+
+    @classmethod
+    def from_preset(cls, catalog_id, preset, seed=0):
+        return cls(catalog_id, PRESETS[preset]["databases"], PRESETS[preset]["tables_per_database"],
+                   PRESETS[preset]["profiles"], seed)
+
+    def plan_tables(self, profiles):
+        rng = random.Random(self.seed)
+        num_tables = self.num_databases * self.tables_per_database
+        positions = list(range(num_tables))
+        rng.shuffle(positions)
+        assigned = {}
+        for profile in profiles:
+            for position in positions[len(assigned):len(assigned) + (profile.count or 0)]:
+                assigned[position] = profile
+        weighted = [profile for profile in profiles if profile.count is None]
+        for position in positions[len(assigned):]:
+            if not weighted:
+                raise ValueError(f"Profiles with a count cover {len(assigned)} of {num_tables} tables and none has a weight.")
+            assigned[position] = rng.choices(weighted, [profile.weight for profile in weighted])[0]
+
+        tables = []
+        for position in range(num_tables):
+            profile = assigned[position]
+            database_name = f"synthetic_db_{position // self.tables_per_database:04d}"
+            tables.append(SyntheticTable(
+                database_name, f"synthetic_table_{position % self.tables_per_database:05d}",
+                self.draw_log_uniform(rng, *profile.partitions), rng.randint(*profile.columns),
+                min(rng.randint(*profile.partition_keys), len(PARTITION_KEYS)), rng.choice(profile.formats),
+                rng.getrandbits(32)
+            ))
+        return tables
+
+    @staticmethod
+    def draw_log_uniform(rng, low, high):
+        return min(high, max(low, int(math.exp(rng.uniform(math.log(low + 1), math.log(high + 1)))) - 1))
+
+    def get_databases(self):
+        return [
+            {
+                "Name": f"synthetic_db_{d:04d}",
+                "Description": "Synthetic database",
+                "LocationUri": f"s3://synthetic-data/synthetic_db_{d:04d}/",
+                "Parameters": {},
+                "CreateTime": str(BASE_TIME),
+                "CreateTableDefaultPermissions": [
+                    {"Principal": {"DataLakePrincipalIdentifier": "IAM_ALLOWED_PRINCIPALS"}, "Permissions": ["ALL"]}
+                ],
+                "CatalogId": self.catalog_id
+            }
+            for d in range(self.num_databases)
+        ]
+
+    def get_tables(self, database_name=None):
+        return [self.create_table(table) for table in self.tables
+                if database_name is None or table.database_name == database_name]
+
+    def create_table(self, synthetic_table):
+        rng = random.Random(synthetic_table.seed)
+        created = BASE_TIME + timedelta(seconds=rng.randint(0, 180 * 86400))
+        location = f"s3://synthetic-data/{synthetic_table.database_name}/{synthetic_table.table_name}/"
+        columns = [
+            dict({"Name": f"column_{c:04d}", "Type": rng.choice(COLUMN_TYPES)},
+                 **({"Comment": f"Synthetic column {c}"} if rng.random() < 0.3 else {}))
+            for c in range(synthetic_table.num_columns)
+        ]
+        return {
+            "Name": synthetic_table.table_name,
+            "DatabaseName": synthetic_table.database_name,
+            "Owner": "hadoop",
+            "CreateTime": str(created),
+            "UpdateTime": str(created),
+            "LastAccessTime": str(created),
+            "Retention": 0,
+            "StorageDescriptor": self.create_storage_descriptor(synthetic_table.storage_format, columns, location),
+            "PartitionKeys": [{"Name": name, "Type": key_type}
+                              for name, key_type in PARTITION_KEYS[:synthetic_table.num_partition_keys]],
+            "TableType": "EXTERNAL_TABLE",
+            "Parameters": {"classification": synthetic_table.storage_format, "EXTERNAL": "TRUE"},
+            "CreatedBy": "arn:aws:iam::123456789012:role/synthetic",
+            "IsRegisteredWithLakeFormation": False,
+            "CatalogId": self.catalog_id,
+            "VersionId": "0"
+        }
+
+    @staticmethod
+    def create_storage_descriptor(storage_format, columns, location):
+        input_format, output_format, serialization_library = STORAGE_FORMATS[storage_format]
+        return {
+            "Columns": columns,
+            "Location": location,
+            "InputFormat": input_format,
+            "OutputFormat": output_format,
+            "Compressed": False,
+            "NumberOfBuckets": -1,
+            "SerdeInfo": {"SerializationLibrary": serialization_library, "Parameters": {"serialization.format": "1"}},
+            "BucketColumns": [],
+            "SortColumns": [],
+            "Parameters": {},
+            "StoredAsSubDirectories": False
+        }
+
+    def iter_partitions(self, table):
+        # Partition values enumerate every key with the same radix, which keeps the values of a table unique.
+        synthetic_table = self.tables_by_name[(table["DatabaseName"], table["Name"])]
+        num_keys = max(len(table["PartitionKeys"]), 1)
+        radix = max(math.ceil(synthetic_table.num_partitions ** (1 / num_keys)), 1)
+        created = datetime.strptime(table["CreateTime"], "%Y-%m-%d %H:%M:%S%z")
+        for p in range(synthetic_table.num_partitions):
+            values = []
+            remainder = p
+            for key in reversed(table["PartitionKeys"]):
+                values.append(self.format_partition_value(key["Name"], key["Type"], remainder % radix))
+                remainder //= radix
+            values.reverse()
+            location = table["StorageDescriptor"]["Location"] + "/".join(
+                f"{key['Name']}={value}" for key, value in zip(table["PartitionKeys"], values)) + "/"
+            partition_time = str(created + timedelta(hours=p))
+            yield {
+                "Values": values,
+                "DatabaseName": table["DatabaseName"],
+                "TableName": table["Name"],
+                "CreationTime": partition_time,
+                "LastAccessTime": partition_time,
+                "StorageDescriptor": self.copy_storage_descriptor(table["StorageDescriptor"], location),
+                "Parameters": {},
+                "CatalogId": self.catalog_id
+            }
+
+    @staticmethod
+    def copy_storage_descriptor(storage_descriptor, location):
+        # Partitions get their own copy, as Glue returns them, so a partition can be modified on its own.
+        return dict(storage_descriptor, Location=location,
+                    Columns=[dict(column) for column in storage_descriptor["Columns"]],
+                    SerdeInfo=dict(storage_descriptor["SerdeInfo"], Parameters=dict(storage_descriptor["SerdeInfo"]["Parameters"])),
+                    BucketColumns=[], SortColumns=[], Parameters={})
+
+    @staticmethod
+    def format_partition_value(name, key_type, index):
+        if key_type == "date":
+            return (BASE_TIME + timedelta(days=index)).strftime("%Y-%m-%d")
+        if key_type == "int":
+            return str(index)
+        return f"{name}_{index:05d}"
+
+    def get_partitions(self, table):
+        return list(self.iter_partitions(table))
+
+    def load(self, glue):
+        # Loads the catalog into a local_aws.LocalGlue.
+        for database in self.get_databases():
+            glue.load_database(self.catalog_id, database)
+        for table in self.get_tables():
+            glue.load_table(self.catalog_id, table, self.iter_partitions(table))
+
+
+def summarize(catalog, partition_threshold=PARTITION_THRESHOLD, table_partitions_threshold=TABLE_PARTITIONS_THRESHOLD):
+    # Classifies every table the way ExportLambda does: at most partition_threshold partitions and a serialized size
+    # (table and partitions) below table_partitions_threshold is a small table (case 1); more partitions with a
+    # table definition below the threshold is a large table (case 2); anything else goes through S3 (case 3).
+    cases = {"case 1": [], "case 2": [], "case 3": []}
+    definition_sizes = []
+    for table in catalog.get_tables():
+        table_size = len(json.dumps(table).encode("utf-8"))
+        definition_sizes.append(table_size)
+        size = table_size
+        num_partitions = 0
+        case = None
+        for partition in catalog.iter_partitions(table):
+            num_partitions += 1
+            size += len(json.dumps(partition).encode("utf-8"))
+            if num_partitions > partition_threshold and table_size < table_partitions_threshold:
+                case = "case 2"
+                break
+        if case is None:
+            case = "case 1" if size < table_partitions_threshold else "case 3"
+        cases[case].append(catalog.tables_by_name[(table["DatabaseName"], table["Name"])].num_partitions)
+
+    partition_counts = sorted(table.num_partitions for table in catalog.tables)
+    definition_sizes.sort()
+    print(f"Databases: {catalog.num_databases}, tables: {len(catalog.tables)}, "
+          f"partitions: {sum(partition_counts):,}")
+    print("Partitions per table: " + ", ".join(
+        f"p{q}={percentile(partition_counts, q):,}" for q in (50, 90, 99, 100)))
+    print("Table definition size (bytes): " + ", ".join(
+        f"p{q}={percentile(definition_sizes, q):,}" for q in (50, 90, 99, 100)))
+    for case, counts in cases.items():
+        print(f"{case}: {len(counts)} tables, {sum(counts):,} partitions")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic Glue catalog generator")
+    parser.add_argument("--preset", choices=sorted(PRESETS))
+    parser.add_argument("--databases", type=int, default=3)
+    parser.add_argument("--tables", type=int, default=20, help="tables per database")
+    parser.add_argument("--partitions", type=int, nargs=2, default=[0, 100], metavar=("MIN", "MAX"))
+    parser.add_argument("--columns", type=int, nargs=2, default=[5, 30], metavar=("MIN", "MAX"))
+    parser.add_argument("--partition-keys", type=int, nargs=2, default=[1, 3], metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--partition-threshold", type=int, default=PARTITION_THRESHOLD)
+    parser.add_argument("--table-partitions-threshold", type=int, default=TABLE_PARTITIONS_THRESHOLD)
+    args = parser.parse_args()
+    if args.preset:
+        catalog = SyntheticCatalog.from_preset("123456789012", args.preset, args.seed)
+    else:
+        catalog = SyntheticCatalog("123456789012", args.databases, args.tables,
+                                   [TableProfile(tuple(args.partitions), tuple(args.columns), tuple(args.partition_keys))],
+                                   args.seed)
+    summarize(catalog, args.partition_threshold, args.table_partitions_threshold)
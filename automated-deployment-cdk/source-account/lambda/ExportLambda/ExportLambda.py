@@ -4,15 +4,22 @@ import time
 import sys
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from typing import List, Dict
-import boto3
-from botocore.config import Config
 from botocore.exceptions import ClientError
 
-from util.ddb_util import DDBUtil
+from util.api_call_metrics import api_call_metrics
+from util.client_registry import get_client
+from util.ddb_util import DDBUtil, FINGERPRINT_EXPORT_RUN_ID
+from util.glue_rate_limiter import glue_rate_limiter
 from util.glue_util import GlueUtil
+from util.logger import logger
 from util.sns_util import SNSUtil
+from util.sns_batch_publisher import SNSBatchPublisher
 from util.sqs_util import SQSUtil
+from util.sqs_batch_sender import SQSBatchSender
+from util.stage_metrics import stage_metrics
+from util.table_size_estimator import TableSizeEstimator
 from util.s3_util import S3Util
 
 region = os.environ.get("region", "us-east-1")
@@ -25,11 +32,15 @@ sqs_queue_4_large_tables = os.environ.get("sqs_queue_url_large_tables", "")
 s3_large_table_schema = os.environ.get("s3_large_table_schema", "")
 partition_threshold = 10
 table_partitions_threshold = 245000
+skip_unchanged_tables = os.environ.get("skip_unchanged_tables", "true").lower() == "true"
+unchanged_table_max_age_hours = float(os.environ.get("unchanged_table_max_age_hours", "168"))
+table_chunk_cost_budget_ms = int(os.environ.get("table_chunk_cost_budget_ms", "120000"))
+table_workers = int(os.environ.get("table_workers", "4"))
+table_deadline_reserve_ms = int(os.environ.get("table_deadline_reserve_ms", "60000"))
 
-config = Config(retries={"max_attempts": 10})
-glue = boto3.client("glue", region_name=region)
-sns = boto3.client("sns", region_name=region)
-sqs = boto3.client("sqs", region_name=region, config=config)
+glue = get_client("glue", region_name=region)
+sns = get_client("sns", region_name=region)
+sqs = get_client("sqs", region_name=region, retries={"max_attempts": 10})
 
 def process_sns_event(sns_records: List[Dict], ddb_util: DDBUtil, sns_util: SNSUtil, glue_util: GlueUtil, sqs_util: SQSUtil):
     export_run_id = int(time.time() * 1000)
@@ -38,20 +49,20 @@ def process_sns_event(sns_records: List[Dict], ddb_util: DDBUtil, sns_util: SNSU
         is_database_type = False
 
         database_ddl = sns_record["Sns"]["Message"]
-        print(f"SNS Message Payload: {database_ddl}")
+        logger.debug("SNS Message Payload: {}", database_ddl)
         msg_attribute_map = sns_record["Sns"]["MessageAttributes"]
         msg_attr_message_type = msg_attribute_map["message_type"]["Value"]
         msg_attr_export_batch_id = msg_attribute_map["export_batch_id"]["Value"]
 
-        print(f"Message Attribute value: {msg_attr_message_type}")
+        logger.debug(f"Message Attribute value: {msg_attr_message_type}")
 
         try:
             if msg_attr_message_type.lower() == "database":
                 db = json.loads(database_ddl)
                 is_database_type = True
         except json.JSONDecodeError as e:
-            print("Cannot parse SNS message to Glue Database Type.")
-            print(e)
+            logger.error("Cannot parse SNS message to Glue Database Type.")
+            logger.error(e)
 
         if is_database_type:
             database = glue_util.get_database_if_exist(glue, source_glue_catalog_id, db)
@@ -59,7 +70,7 @@ def process_sns_event(sns_records: List[Dict], ddb_util: DDBUtil, sns_util: SNSU
                 publish_db_response = sns_util.publish_database_schema_to_sns(sns, topic_arn, database_ddl,
                                                                                 source_glue_catalog_id, msg_attr_export_batch_id)
                 if publish_db_response["MessageId"]:
-                    print(f"Database schema published to SNS Topic. Message_Id: {publish_db_response['MessageId']}")
+                    logger.debug(f"Database schema published to SNS Topic. Message_Id: {publish_db_response['MessageId']}")
                     ddb_util.track_database_export_status(ddb_tbl_name_for_db_status_tracking, db["Name"], database_ddl,
                                                             publish_db_response["MessageId"], source_glue_catalog_id,
                                                             export_run_id, msg_attr_export_batch_id, True)
@@ -68,127 +79,239 @@ def process_sns_event(sns_records: List[Dict], ddb_util: DDBUtil, sns_util: SNSU
                                                             "", source_glue_catalog_id, export_run_id, msg_attr_export_batch_id, False)
 
                 #Hoy en día esa función retorna una lista con la totalidad de tablas para empezar a recorrer y obtener las particiones
-                glue_util.get_tables(glue, source_glue_catalog_id, database["Name"], sns_util, sns, export_run_id, msg_attr_export_batch_id, topic_table_list_arn)
+                glue_util.get_tables(glue, source_glue_catalog_id, database["Name"], sns_util, sns, export_run_id, msg_attr_export_batch_id, topic_table_list_arn,
+                                     ddb_util, ddb_tbl_name_for_table_status_tracking, table_chunk_cost_budget_ms)
 
             else:
-                print(f"There is no Database with name '{db['Name']}' exist in Glue Data Catalog. Tables cannot be retrieved.")
+                logger.error(f"There is no Database with name '{db['Name']}' exist in Glue Data Catalog. Tables cannot be retrieved.")
         else:
-            print("Message received from SNS Topic seems to be invalid. It could not be converted to Glue Database Type.")
+            logger.error("Message received from SNS Topic seems to be invalid. It could not be converted to Glue Database Type.")
 
 #Funcion encargada de recibir un listado de N tablas, obtener las particiones y hacer que el proceso siga común y corriente
-def process_sns_table_event(db_table_list: List[Dict], ddb_util: DDBUtil, sns_util: SNSUtil, glue_util: GlueUtil, sqs_util: SQSUtil, export_run_id, msg_attr_export_batch_id, s3_util):
+def process_sns_table_event(db_table_list: List[Dict], ddb_util: DDBUtil, sns_util: SNSUtil, glue_util: GlueUtil, sqs_util: SQSUtil, export_run_id, msg_attr_export_batch_id, s3_util,
+                            context=None):
 
     number_of_tables_exported = 0
+    number_of_tables_unchanged = 0
     item_list = []
     table_lt = json.loads(db_table_list)
     db_name = table_lt[0]['DatabaseName']
 
-    for table in table_lt:
-        partition_list = glue_util.get_partitions(glue, source_glue_catalog_id, table["DatabaseName"], table["Name"])
-
-        print(f"Database: {table['DatabaseName']}, Table: {table['Name']}, num_partitions: {len(partition_list)}")
-
-        table_with_parts = {
-            "PartitionList": partition_list,
-            "Table": table
+    last_fingerprints = {}
+    if skip_unchanged_tables:
+        last_fingerprints = ddb_util.get_table_export_fingerprints(
+            ddb_tbl_name_for_table_status_tracking, [f"{table['Name']}|{table['DatabaseName']}" for table in table_lt],
+            unchanged_table_max_age_hours)
+
+    # Small tables are published with PublishBatch; their status is tracked once the batches are flushed.
+    table_publisher = SNSBatchPublisher(sns, topic_arn)
+    table_message_attributes = sns_util.get_table_message_attributes(source_glue_catalog_id, msg_attr_export_batch_id)
+    # Large tables are sent to SQS with SendMessageBatch and flushed before the invocation ends.
+    large_table_sender = SQSBatchSender(sqs, sqs_queue_4_large_tables)
+    large_table_message_attributes = sqs_util.get_large_table_message_attributes(msg_attr_export_batch_id, source_glue_catalog_id)
+
+    def process_table_export_result(result):
+        nonlocal number_of_tables_unchanged
+        table = result["table"]
+        if result["case"] == "unchanged":
+            number_of_tables_unchanged += 1
+        elif result["case"] == "small":
+            table_publisher.publish(result["table_ddl"], table_message_attributes,
+                                    (table, result["table_ddl"], result["fingerprint"], result["export_duration_ms"]))
+        elif result["case"] == "large":
+            with stage_metrics.time_stage("Serialize"):
+                large_table_json = json.dumps(result["large_table"])
+            large_table_sender.send(large_table_json, large_table_message_attributes, table)
+        elif result["publish_response"]:
+            ddb_util.track_table_export_status(
+                ddb_tbl_name_for_table_status_tracking,
+                table["DatabaseName"], table["Name"], result["table_ddl"],
+                result["publish_response"]["MessageId"], source_glue_catalog_id, int(export_run_id), msg_attr_export_batch_id,
+                True, True, s3_large_table_schema, result["object_key"]
+            )
+            ddb_util.track_table_export_fingerprint(
+                ddb_tbl_name_for_table_status_tracking, table["DatabaseName"], table["Name"], result["fingerprint"],
+                source_glue_catalog_id, export_run_id, result["export_duration_ms"]
+            )
+        else:
+            ddb_util.track_table_export_status(
+                ddb_tbl_name_for_table_status_tracking,
+                table["DatabaseName"], table["Name"], result["table_ddl"],
+                "", source_glue_catalog_id, int(export_run_id), msg_attr_export_batch_id,
+                False, True, None, None
+            )
+
+    # Tables are exported on worker threads. Results are handled on this thread, so the batch senders and the
+    # DynamoDB resource are never shared. No new table is started once the remaining time drops below the reserve;
+    # the tables left are published again as a new table list.
+    remaining_tables = []
+    with ThreadPoolExecutor(max_workers=table_workers) as executor:
+        running = set()
+        for i, table in enumerate(table_lt):
+            while len(running) >= table_workers:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    process_table_export_result(future.result())
+            if context and context.get_remaining_time_in_millis() < table_deadline_reserve_ms:
+                remaining_tables = table_lt[i:]
+                logger.warning(f"Remaining time is below {table_deadline_reserve_ms} ms. {len(remaining_tables)} tables will be re-enqueued.")
+                break
+            running.add(executor.submit(export_table, table, glue_util, sns_util, s3_util, last_fingerprints,
+                                        msg_attr_export_batch_id))
+        for future in as_completed(running):
+            process_table_export_result(future.result())
+
+    for (table, table_ddl, fingerprint, export_duration_ms), message_id in table_publisher.flush():
+        item = {
+            "table_id": {"S" : f"{table['Name']}|{table['DatabaseName']}"},
+            "export_run_id": {"N" : str(export_run_id)},
+            "export_batch_id": {"S" : msg_attr_export_batch_id},
+            "source_glue_catalog_id": {"S" : source_glue_catalog_id},
+            "table_schema": {"S" : table_ddl},
+            "is_large_table": {"S" : "false"}
         }
 
-        size = get_json_size(table_with_parts) / 1024
-        print(f"Table size {table['Name']}: {size} KB")
-
-        if len(partition_list) <= partition_threshold and get_json_size(table_with_parts) < table_partitions_threshold:
-            print(f"Table {table['Name']} Case 1. Num Partitions <= Threshold and size < {size}kb")
-
-            table_ddl = json.dumps(table_with_parts)
-            publish_table_response = sns_util.publish_table_schema_to_sns(sns, topic_arn, table, table_ddl,
-                                                                            source_glue_catalog_id, msg_attr_export_batch_id)
-
-            item = {
+        if message_id:
+            logger.debug(f"Table schema for Table '{table['Name']}' of database '{table['DatabaseName']}' published to SNS Topic. Message_Id: {message_id}")
+            item["sns_msg_id"] = {"S" : message_id}
+            item["is_exported"] = {"S" : "true"}
+            number_of_tables_exported += 1
+            item_list.append({"PutRequest": {"Item": {
                 "table_id": {"S" : f"{table['Name']}|{table['DatabaseName']}"},
-                "export_run_id": {"N" : str(export_run_id)},
-                "export_batch_id": {"S" : msg_attr_export_batch_id},
+                "export_run_id": {"N" : str(FINGERPRINT_EXPORT_RUN_ID)},
+                "last_export_run_id": {"N" : str(export_run_id)},
                 "source_glue_catalog_id": {"S" : source_glue_catalog_id},
-                "table_schema": {"S" : table_ddl},
-                "is_large_table": {"S" : "false"}
-            }
-
-            if publish_table_response["MessageId"]:
-                item["sns_msg_id"] = {"S" : publish_table_response["MessageId"]}
-                item["is_exported"] = {"S" : "true"}
-                number_of_tables_exported += 1
-            else:
-                item["sns_msg_id"] = {"S" : ""}
-                item["is_exported"] = {"S" : "false"}
-
-            item_list.append({"PutRequest": {"Item": item}})
-        elif len(partition_list) > partition_threshold and get_json_size(table) < table_partitions_threshold:
-            print(f"Table {table['Name']} Case 2. Num Partitions > Threshold and size < {size}kb")
-
-            large_table = {
-                "Table": table,
-                "LargeTable": True,
-                "NumberOfPartitions": len(partition_list),
-                "CatalogId": source_glue_catalog_id
-            }
-
-            print(f"Database: {table['DatabaseName']}, Table: {table['Name']}, num_partitions: {len(partition_list)}")
-            print("This will be sent to SQS Queue for further processing.")
-
-            sqs_util.send_table_schema_to_sqs_queue(sqs, sqs_queue_4_large_tables, large_table,
-                                                    msg_attr_export_batch_id, source_glue_catalog_id)
+                "fingerprint": {"S" : fingerprint},
+                "export_duration_ms": {"N" : str(export_duration_ms)}
+            }}})
+        else:
+            logger.error(f"Table schema for Table '{table['Name']}' of database '{table['DatabaseName']}' could not be published to SNS Topic. This will be tracked in DynamoDB table.")
+            item["sns_msg_id"] = {"S" : ""}
+            item["is_exported"] = {"S" : "false"}
 
-        elif get_json_size(table_with_parts) >= table_partitions_threshold:
-            print(f"Table {table['Name']} Case 3. (Table + Partitions) size >= {size}kb")
+        item_list.append({"PutRequest": {"Item": item}})
+    logger.info(f"Number of SNS PublishBatch calls for table schemas: {table_publisher.number_of_calls}")
 
-            date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-            object_key = f"{date_str}_{int(time.time() * 1000)}_{source_glue_catalog_id}_{table['DatabaseName']}_{table['Name']}.txt"
+    for table, message_id in large_table_sender.flush():
+        if message_id:
+            logger.debug(f"Table details for table '{table['Name']}' of database '{table['DatabaseName']}' sent to SQS.")
+        else:
+            logger.error(f"Table details for table '{table['Name']}' of database '{table['DatabaseName']}' could not be sent to SQS.")
+    logger.info(f"Number of SQS SendMessageBatch calls for large tables: {large_table_sender.number_of_calls}")
 
-            object_created = s3_util.create_s3_object(region, s3_large_table_schema, object_key, json.dumps(table_with_parts))
+    logger.debug(f"Inserting Table statistics to DynamoDB for database: {db_name}")
+    ddb_util.insert_into_dynamodb(item_list, ddb_tbl_name_for_table_status_tracking)
+    logger.info(f"Table export statistics: number of tables exported to SNS in this event = {len(table_lt) - number_of_tables_unchanged - len(remaining_tables)}")
+    logger.info(f"Table export statistics: number of unchanged tables skipped in this event = {number_of_tables_unchanged}")
+
+    if remaining_tables:
+        publish_response = sns_util.publish_table_list_to_sns(sns, topic_table_list_arn, json.dumps(remaining_tables), str(export_run_id),
+                                                              source_glue_catalog_id, msg_attr_export_batch_id)
+        if not publish_response:
+            logger.error(f"{len(remaining_tables)} tables of database '{db_name}' could not be re-enqueued. The table list will be retried again.")
+            raise RuntimeError()
+        logger.info(f"Table export statistics: number of tables re-enqueued in this event = {len(remaining_tables)}")
+
+def export_table(table, glue_util: GlueUtil, sns_util: SNSUtil, s3_util, last_fingerprints, msg_attr_export_batch_id):
+    # Runs on a worker thread: only thread-safe clients are used here. Returns what the handler thread needs to
+    # publish the table or track its status.
+    # Partitions are serialized once while they are paged in. As soon as a table has more partitions than the
+    # threshold and a small definition it is a large table (case 2), so the remaining partitions are not fetched;
+    # ExportLargeTable pages them in itself.
+    table_start_time = time.time()
+    size_estimator = TableSizeEstimator(table)
+    partitions_hash = 0
+    is_large_table = False
+    for partition in glue_util.iter_partitions(glue, source_glue_catalog_id, table["DatabaseName"], table["Name"]):
+        size_estimator.add_partition(partition)
+        partitions_hash = glue_util.add_partition_fingerprint(partitions_hash, partition)
+        if size_estimator.num_partitions > partition_threshold and size_estimator.table_size < table_partitions_threshold:
+            is_large_table = True
+            break
+
+    result = {"table": table}
+    if is_large_table:
+        logger.debug(f"Database: {table['DatabaseName']}, Table: {table['Name']}, num_partitions: > {partition_threshold}")
+        fingerprint = None
+    else:
+        logger.debug(f"Database: {table['DatabaseName']}, Table: {table['Name']}, num_partitions: {size_estimator.num_partitions}")
+        fingerprint = glue_util.format_table_fingerprint(table, size_estimator.num_partitions, partitions_hash)
+        if last_fingerprints.get(f"{table['Name']}|{table['DatabaseName']}") == fingerprint:
+            logger.debug(f"Table {table['Name']} has not changed since its last successful export. Skipping it.")
+            result["case"] = "unchanged"
+            stage_metrics.add("TablesUnchanged", 1)
+            return result
+
+    size = size_estimator.size / 1024
+    logger.debug(f"Table size {table['Name']}: {size} KB")
+
+    if not is_large_table and size_estimator.size < table_partitions_threshold:
+        logger.debug(f"Table {table['Name']} Case 1. Num Partitions <= Threshold and size < {size}kb")
+
+        result["case"] = "small"
+        with stage_metrics.time_stage("Serialize"):
+            result["table_ddl"] = size_estimator.to_json()
+    elif is_large_table:
+        logger.debug(f"Table {table['Name']} Case 2. Num Partitions > Threshold and size < {size}kb")
+
+        # The fingerprint needs every partition, so ExportLargeTable computes and checks it while exporting.
+        result["case"] = "large"
+        result["large_table"] = {
+            "Table": table,
+            "LargeTable": True,
+            "NumberOfPartitions": size_estimator.num_partitions,
+            "CatalogId": source_glue_catalog_id
+        }
 
-            msg = {"bucket_name":s3_large_table_schema, "object_key":object_key}
+        logger.debug(f"Database: {table['DatabaseName']}, Table: {table['Name']}, num_partitions: > {partition_threshold}")
+        logger.debug("This will be sent to SQS Queue for further processing.")
+    else:
+        logger.debug(f"Table {table['Name']} Case 3. (Table + Partitions) size >= {size}kb")
 
-            publish_response = sns_util.publish_large_table_schema_to_sns(
-                sns, topic_arn, region, s3_large_table_schema, str(msg),
-                source_glue_catalog_id, msg_attr_export_batch_id, "table")
+        date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+        object_key = f"{date_str}_{int(time.time() * 1000)}_{source_glue_catalog_id}_{table['DatabaseName']}_{table['Name']}.txt"
 
-            if publish_response:
-                ddb_util.track_table_export_status(
-                    ddb_tbl_name_for_table_status_tracking,
-                    table["DatabaseName"], table["Name"], table_with_parts,
-                    publish_response["MessageId"], source_glue_catalog_id, int(export_run_id), msg_attr_export_batch_id,
-                    True, True, s3_large_table_schema, object_key
-                )
-            else:
-                ddb_util.track_table_export_status(
-                    ddb_tbl_name_for_table_status_tracking,
-                    table["DatabaseName"], table["Name"], table_with_parts,
-                    "", source_glue_catalog_id, int(export_run_id), msg_attr_export_batch_id,
-                    False, True, None, None
-                )
+        with stage_metrics.time_stage("Serialize"):
+            table_ddl = size_estimator.to_json()
+        with stage_metrics.time_stage("WriteObject"):
+            object_created = s3_util.create_s3_object(region, s3_large_table_schema, object_key, table_ddl)
 
+        msg = {"bucket_name":s3_large_table_schema, "object_key":object_key}
 
-    print(f"Inserting Table statistics to DynamoDB for database: {db_name}")
-    ddb_util.insert_into_dynamodb(item_list, ddb_tbl_name_for_table_status_tracking)
-    print(f"Table export statistics: number of tables exported to SNS in this event = {len(table_lt)}")
+        publish_response = sns_util.publish_large_table_schema_to_sns(
+            sns, topic_arn, region, s3_large_table_schema, str(msg),
+            source_glue_catalog_id, msg_attr_export_batch_id, "table")
 
-def get_json_size(json_dict):
-    json_string = json.dumps(json_dict)
-    json_size = len(json_string.encode('utf-8'))
+        result["case"] = "s3"
+        result["table_ddl"] = table_ddl
+        result["object_key"] = object_key
+        result["publish_response"] = publish_response
 
-    return json_size
+    result["fingerprint"] = fingerprint
+    result["export_duration_ms"] = int((time.time() - table_start_time) * 1000)
+    if is_large_table:
+        stage_metrics.add("LargeTablesEnqueued", 1)
+    else:
+        stage_metrics.add("TablesExported", 1)
+        stage_metrics.add("PartitionsExported", size_estimator.num_partitions)
+        stage_metrics.add("PayloadBytes", size_estimator.size, "Bytes")
+    return result
 
 def lambda_handler(event, context):
 
-    print(F"event: {event}")
-    print(f"Source Catalog Id: {source_glue_catalog_id}")
-    print(f"SNS Topic Arn: {topic_arn}")
-    print(f"DynamoDB Table for DB Export Auditing: {ddb_tbl_name_for_db_status_tracking}")
-    print(f"DynamoDB Table for Table Export Auditing: {ddb_tbl_name_for_table_status_tracking}")
-    print(f"SQS queue for large tables: {sqs_queue_4_large_tables}")
+    logger.debug("event: {}", event)
+    logger.info(f"Source Catalog Id: {source_glue_catalog_id}")
+    logger.info(f"SNS Topic Arn: {topic_arn}")
+    logger.info(f"DynamoDB Table for DB Export Auditing: {ddb_tbl_name_for_db_status_tracking}")
+    logger.info(f"DynamoDB Table for Table Export Auditing: {ddb_tbl_name_for_table_status_tracking}")
+    logger.info(f"SQS queue for large tables: {sqs_queue_4_large_tables}")
+    logger.info(f"Skip unchanged tables: {skip_unchanged_tables}, for up to {unchanged_table_max_age_hours} hours")
+    logger.info(f"Table chunk cost budget (ms): {table_chunk_cost_budget_ms}")
+    logger.info(f"Table workers: {table_workers}, deadline reserve (ms): {table_deadline_reserve_ms}")
 
     sns_records = event["Records"]
 
-    print(f"Number of messages in SNS Event: {len(sns_records)}")
+    logger.info(f"Number of messages in SNS Event: {len(sns_records)}")
 
     ddb_util = DDBUtil()
     sns_util = SNSUtil()
@@ -202,9 +325,13 @@ def lambda_handler(event, context):
         msg_attr_export_batch_id = sns_records[0]['Sns']['MessageAttributes']['msg_attr_export_batch_id']['Value']
 
         #Funcion nueva que se encargará de procesar cada uno de los chunks
-        process_sns_table_event(sns_records[0]['Sns']['Message'], ddb_util, sns_util, glue_util, sqs_util, export_run_id, msg_attr_export_batch_id, s3_util)
+        process_sns_table_event(sns_records[0]['Sns']['Message'], ddb_util, sns_util, glue_util, sqs_util, export_run_id, msg_attr_export_batch_id, s3_util,
+                                context)
     else:
         #Funcion original que se encargará de obtener el listado de tablas y enviar los SNS por chunks
         process_sns_event(sns_records, ddb_util, sns_util, glue_util, sqs_util)
 
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("ExportLambda")
     return "Message from SNS Topic was processed successfully!"
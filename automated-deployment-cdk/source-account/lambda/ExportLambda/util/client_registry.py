@@ -0,0 +1,49 @@
+import json
+import threading
+
+import boto3
+from botocore.config import Config
+
+from util.api_call_metrics import api_call_metrics
+from util.glue_rate_limiter import glue_rate_limiter
+
+# boto3 clients and resources keyed by service, region and config options. The registry lives at module level, so
+# each one is created once per Lambda container and reused across warm invocations. Clients are thread-safe and can
+# be shared by worker threads; resources are not and should only be used from the handler thread. Every client is
+# registered with api_call_metrics, which counts its calls, and Glue clients with the shared glue_rate_limiter, which
+# paces every Glue API call made by the container.
+lock = threading.Lock()
+session = None
+clients = {}
+resources = {}
+
+def get_session():
+    global session
+    with lock:
+        if session is None:
+            session = boto3.session.Session()
+        return session
+
+def get_client(service_name, region_name=None, **config_options):
+    key = (service_name, region_name, json.dumps(config_options, sort_keys=True))
+    client = clients.get(key)
+    if client is None:
+        client = get_session().client(service_name, region_name=region_name, config=Config(**config_options))
+        with lock:
+            if key not in clients:
+                api_call_metrics.register(client)
+                if service_name == "glue":
+                    glue_rate_limiter.register(client)
+            client = clients.setdefault(key, client)
+    return client
+
+def get_resource(service_name, region_name=None, **config_options):
+    key = (service_name, region_name, json.dumps(config_options, sort_keys=True))
+    resource = resources.get(key)
+    if resource is None:
+        resource = get_session().resource(service_name, region_name=region_name, config=Config(**config_options))
+        with lock:
+            if key not in resources:
+                api_call_metrics.register(resource.meta.client)
+            resource = resources.setdefault(key, resource)
+    return resource
@@ -1,11 +1,45 @@
 import boto3
+import hashlib
+import queue
+import threading
 import time
+import itertools
 import json
 
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from util.adaptive_backoff import AdaptiveBackoff
 from util.db_replication_status import DBReplicationStatus
+from util.logger import logger
+from util.partition_batch_result import PartitionBatchResult
+from util.partition_diff import PartitionDiff
+from util.stage_metrics import stage_metrics
 from util.table_replication_status import TableReplicationStatus
 
+# Upper bound for TotalSegments accepted by the GetPartitions API.
+MAX_PARTITION_SEGMENTS = 10
+# Number of partition batches sent to Glue concurrently and how often a failed batch is retried.
+DEFAULT_PARTITION_BATCH_WORKERS = 5
+MAX_PARTITION_BATCH_RETRIES = 8
+# Error codes worth retrying, for a whole partition batch request or for single partitions of a batch. Requests that
+# fail without a response (connection errors, timeouts) are reported as ConnectionError.
+RETRYABLE_PARTITION_ERROR_CODES = ('ThrottlingException', 'InternalServiceException', 'OperationTimeoutException',
+                                   'ConcurrentModificationException', 'ConnectionError')
+# botocore retry settings of the Glue client passed to the partition batch methods (add, update and delete). They
+# retry failed requests themselves with a backoff shared by every worker, so botocore must not retry the same
+# requests again: a batch is sent at most MAX_PARTITION_BATCH_RETRIES + 1 times.
+PARTITION_BATCH_CLIENT_RETRIES = {"total_max_attempts": 1}
+# Table list chunking: the estimated export work and the SNS message size a single table list may reach. Without
+# export history, a table costs a fixed overhead plus a share per KB of definition and, when it is partitioned, per
+# partition of an assumed UNKNOWN_TABLE_PARTITIONS; its first export then records the actual duration.
+DEFAULT_TABLE_CHUNK_COST_MS = 120000
+MAX_TABLE_LIST_MESSAGE_BYTES = 250000
+TABLE_BASE_COST_MS = 200
+TABLE_COST_MS_PER_DEFINITION_KB = 2
+TABLE_COST_MS_PER_PARTITION = 20
+UNKNOWN_TABLE_PARTITIONS = 10
+
 class GlueUtil:
 
     def get_database_if_exist(self, glue, target_catalog_id, db):
@@ -13,7 +47,7 @@ class GlueUtil:
         try:
             database = glue.get_database(CatalogId=target_catalog_id, Name=db['Name'])['Database']
         except glue.exceptions.EntityNotFoundException:
-            print(f"Database '{db['Name']}' not found.")
+            logger.warning(f"Database '{db['Name']}' not found.")
         return database
 
     def get_databases(self, glue, source_glue_catalog_id):
@@ -21,7 +55,7 @@ class GlueUtil:
         page_iterator = paginator.paginate(CatalogId=source_glue_catalog_id)
     
         master_db_list = []
-        for page in page_iterator:
+        for page in stage_metrics.time_iterator("ListDatabases", page_iterator):
             for db in page['DatabaseList']:
                 if 'CreateTime' in db:
                     db['CreateTime'] = str(db['CreateTime'])
@@ -31,24 +65,25 @@ class GlueUtil:
                     db['LastAccessTime'] = str(db['LastAccessTime'])
                 master_db_list.append(db)
     
-        print(f"Total number of databases fetched: {len(master_db_list)}")
+        logger.info(f"Total number of databases fetched: {len(master_db_list)}")
         return master_db_list
 
     def create_glue_databases(self, glue, target_glue_catalog_id, db_name, db_description):
         db_status = DBReplicationStatus()
         try:
-            glue.create_database(
-                CatalogId=target_glue_catalog_id,
-                DatabaseInput={
-                    'Name': db_name,
-                    'Description': db_description
-                }
-            )
-            print(f"Database created successfully. Database name: '{db_name}'.")
+            with stage_metrics.time_stage("CreateDatabase"):
+                glue.create_database(
+                    CatalogId=target_glue_catalog_id,
+                    DatabaseInput={
+                        'Name': db_name,
+                        'Description': db_description
+                    }
+                )
+            logger.debug("Database created successfully. Database name: '{}'.", db_name)
             db_status.created = True
             db_status.error = False
         except Exception as e:
-            print(f"Exception thrown while creating Glue Database: {e}")
+            logger.error(f"Exception thrown while creating Glue Database: {e}")
             db_status.db_name = db_name
             db_status.error = True
         return db_status
@@ -56,20 +91,21 @@ class GlueUtil:
     def create_glue_database(self, glue, target_glue_catalog_id, db):
         db_status = DBReplicationStatus()
         try:
-            glue.create_database(
-                CatalogId=target_glue_catalog_id,
-                DatabaseInput={
-                    'Name': db['Name'],
-                    'Description': db.get('Description', "N/A"),
-                    'LocationUri': db.get('LocationUri', "N/A"),
-                    'Parameters': db.get('Parameters', {})
-                }
-            )
-            print(f"Database created successfully. Database name: '{db['Name']}'.")
+            with stage_metrics.time_stage("CreateDatabase"):
+                glue.create_database(
+                    CatalogId=target_glue_catalog_id,
+                    DatabaseInput={
+                        'Name': db['Name'],
+                        'Description': db.get('Description', "N/A"),
+                        'LocationUri': db.get('LocationUri', "N/A"),
+                        'Parameters': db.get('Parameters', {})
+                    }
+                )
+            logger.debug("Database created successfully. Database name: '{}'.", db['Name'])
             db_status.created = True
             db_status.error = False
         except Exception as e:
-            print(f"Exception in creating Database with name: '{db['Name']}'. {e}")
+            logger.error(f"Exception in creating Database with name: '{db['Name']}'. {e}")
             db_status.db_name = db['Name']
             db_status.error = True
         return db_status
@@ -105,8 +141,9 @@ class GlueUtil:
                 table_input['Parameters'] = storage_descriptor['Parameters']
         return table_input
 
-    def get_tables(self, glue, glue_catalog_id, database_name, sns_util, sns, export_run_id, msg_attr_export_batch_id, topic_table_list_arn):
-        print(f"Start - Fetching table list for Database {database_name}")
+    def get_tables(self, glue, glue_catalog_id, database_name, sns_util, sns, export_run_id, msg_attr_export_batch_id, topic_table_list_arn,
+                   ddb_util=None, ddb_tbl_name=None, max_chunk_cost_ms=DEFAULT_TABLE_CHUNK_COST_MS):
+        logger.debug("Start - Fetching table list for Database {}", database_name)
 
         message_number = 0
         max_group_tables = 50
@@ -114,7 +151,7 @@ class GlueUtil:
         page_iterator = paginator.paginate(CatalogId=glue_catalog_id, DatabaseName=database_name)
 
         master_table_list = []
-        for page in page_iterator:
+        for page in stage_metrics.time_iterator("ListTables", page_iterator):
             for db in page['TableList']:
                 if 'CreateTime' in db:
                     db['CreateTime'] = str(db['CreateTime'])
@@ -124,29 +161,76 @@ class GlueUtil:
                     db['LastAccessTime'] = str(db['LastAccessTime'])
                 master_table_list.append(db)
 
-        print(f"Database '{database_name}' has {len(master_table_list)} tables.")
-        print(f"End - Fetching table list for Database {database_name}")
+        logger.info(f"Database '{database_name}' has {len(master_table_list)} tables.")
+        logger.debug("End - Fetching table list for Database {}", database_name)
 
-        #Loops through AWS Glue catalog table list
-        chunks = [master_table_list[i : i + max_group_tables] for i in range(0, len(master_table_list), max_group_tables)]
+        #Packs tables into chunks by estimated export cost instead of a fixed number of tables
+        export_history = {}
+        if ddb_util and ddb_tbl_name:
+            export_history = ddb_util.get_table_export_history(
+                ddb_tbl_name, [f"{table['Name']}|{database_name}" for table in master_table_list])
+        table_costs = self.estimate_table_export_costs(master_table_list, export_history)
+        chunks = self.plan_table_chunks(master_table_list, table_costs, max_group_tables, max_chunk_cost_ms)
 
-        for i, chunk in enumerate(chunks, start=1):
+        first_pos = 1
+        for chunk_tables, chunk_cost in chunks:
             message_number += 1
-            first_pos = (i - 1) * max_group_tables + 1
-            last_pos = first_pos + len(chunk) - 1
+            last_pos = first_pos + len(chunk_tables) - 1
+            logger.info(f"Sending to SNS message number {message_number} with tables from {first_pos} to {last_pos}, estimated cost {chunk_cost} ms")
+            first_pos = last_pos + 1
+
+        #Sending SNS messages with lists of tables, up to 10 per PublishBatch call
+        with stage_metrics.time_stage("Serialize"):
+            table_lists = [json.dumps(chunk_tables) for chunk_tables, chunk_cost in chunks]
+        sns_util.publish_table_lists_to_sns(sns, topic_table_list_arn, table_lists, str(export_run_id), glue_catalog_id,
+                                            msg_attr_export_batch_id)
+        stage_metrics.add("TablesListed", len(master_table_list))
 
-            #Sending SNS message with list of tables
-            print(f"Sending to SNS message number {message_number} with tables from {first_pos} to {last_pos}")
-            sns_util.publish_table_list_to_sns(sns, topic_table_list_arn, json.dumps(chunk), str(export_run_id), glue_catalog_id, msg_attr_export_batch_id) #Validar estos parametrios!
-            print('Message send to SNS')
+        logger.info(f"End - Sending all {message_number} SNS messages for Database {database_name}")
 
-        print(f"End - Sending all {message_number} SNS messages for Database {database_name}")
+    def estimate_table_export_costs(self, table_list, export_history):
+        # Tables with a recorded export duration use it; the others are estimated from their definition, without
+        # calling Glue.
+        costs = []
+        for table in table_list:
+            history = export_history.get(f"{table['Name']}|{table['DatabaseName']}", {})
+            if "export_duration_ms" in history:
+                costs.append(max(history["export_duration_ms"], 1))
+            else:
+                costs.append(self.estimate_table_export_cost(table, UNKNOWN_TABLE_PARTITIONS if table.get('PartitionKeys') else 0))
+        return costs
+
+    def estimate_table_export_cost(self, table, num_partitions):
+        definition_kb = len(json.dumps(table).encode('utf-8')) / 1024
+        return int(TABLE_BASE_COST_MS + definition_kb * TABLE_COST_MS_PER_DEFINITION_KB + num_partitions * TABLE_COST_MS_PER_PARTITION)
+
+    def plan_table_chunks(self, table_list, table_costs, max_tables, max_chunk_cost_ms):
+        # Greedily fills each chunk in catalog order until the next table would exceed the cost budget, the table list
+        # message size or max_tables. A table over the budget on its own still gets a chunk.
+        chunks = []
+        chunk_tables = []
+        chunk_cost = 0
+        chunk_bytes = 2
+        for table, cost in zip(table_list, table_costs):
+            table_bytes = len(json.dumps(table).encode('utf-8')) + 2
+            if chunk_tables and (len(chunk_tables) == max_tables or chunk_cost + cost > max_chunk_cost_ms
+                                 or chunk_bytes + table_bytes > MAX_TABLE_LIST_MESSAGE_BYTES):
+                chunks.append((chunk_tables, chunk_cost))
+                chunk_tables = []
+                chunk_cost = 0
+                chunk_bytes = 2
+            chunk_tables.append(table)
+            chunk_cost += cost
+            chunk_bytes += table_bytes
+        if chunk_tables:
+            chunks.append((chunk_tables, chunk_cost))
+        return chunks
 
     def get_table(self, glue, glue_catalog_id, database_name, table_name):
         try:
             table = glue.get_table(CatalogId=glue_catalog_id, DatabaseName=database_name, Name=table_name)['Table']
         except glue.exceptions.EntityNotFoundException:
-            print(f"Table '{table_name}' not found.")
+            logger.warning(f"Table '{table_name}' not found.")
             table = None
         return table
 
@@ -163,118 +247,522 @@ class GlueUtil:
                 Name=source_table['Name']
             )['Table']
         except glue.exceptions.EntityNotFoundException:
-            print(f"Table '{source_table['Name']}' not found. It will be created.")
+            logger.debug("Table '{}' not found. It will be created.", source_table['Name'])
             target_table = None
         except Exception as e:
-            print(f"Exception in getting getTable: {e}")
+            logger.error(f"Exception in getting getTable: {e}")
             target_table = None
 
         table_input = self.create_table_input(source_table)
 
         if target_table:
-            print("Table exist. It will be updated")
+            logger.debug("Table exist. It will be updated")
             try:
-                glue.update_table(
-                    DatabaseName=source_table['DatabaseName'],
-                    TableInput=table_input,
-                    SkipArchive=skip_table_archive
-                )
+                with stage_metrics.time_stage("UpdateTable"):
+                    glue.update_table(
+                        DatabaseName=source_table['DatabaseName'],
+                        TableInput=table_input,
+                        SkipArchive=skip_table_archive
+                    )
                 table_status.updated = True
                 table_status.replicated = True
                 table_status.error = False
-                print(f"Table '{source_table['Name']}' updated successfully.")
+                logger.debug("Table '{}' updated successfully.", source_table['Name'])
             except glue.exceptions.EntityNotFoundException as e:
-                print(f"Exception thrown while updating table '{source_table['Name']}'. Reason: '{source_table['DatabaseName']}' does not exist already. {e}")
+                logger.error(f"Exception thrown while updating table '{source_table['Name']}'. Reason: '{source_table['DatabaseName']}' does not exist already. {e}")
                 table_status.replicated = False
                 table_status.db_not_found_error = True
                 table_status.error = True
             except Exception as e:
-                print(f"Exception thrown while updating table '{source_table['Name']}'. {e}")
+                logger.error(f"Exception thrown while updating table '{source_table['Name']}'. {e}")
                 table_status.replicated = False
                 table_status.error = True
         else:
             try:
-                glue.create_table(
-                    CatalogId=target_glue_catalog_id,
-                    DatabaseName=source_table['DatabaseName'],
-                    TableInput=table_input
-                )
+                with stage_metrics.time_stage("CreateTable"):
+                    glue.create_table(
+                        CatalogId=target_glue_catalog_id,
+                        DatabaseName=source_table['DatabaseName'],
+                        TableInput=table_input
+                    )
                 table_status.created = True
                 table_status.replicated = True
                 table_status.error = False
-                print(f"Table '{source_table['Name']}' created successfully.")
+                logger.debug("Table '{}' created successfully.", source_table['Name'])
             except glue.exceptions.EntityNotFoundException as e:
-                print(f"Exception thrown while creating table '{source_table['Name']}'. Reason: '{source_table['DatabaseName']}' does not exist already. {e}")
+                logger.error(f"Exception thrown while creating table '{source_table['Name']}'. Reason: '{source_table['DatabaseName']}' does not exist already. {e}")
                 table_status.replicated = False
                 table_status.db_not_found_error = True
+            except glue.exceptions.AlreadyExistsException:
+                # Created since it was looked up, by the import of another part of the same large table export.
+                logger.info(f"Table '{source_table['Name']}' was created by a concurrent import.")
+                table_status.replicated = True
+                table_status.error = False
             except Exception as e:
-                print(f"Exception thrown while creating table '{source_table['Name']}' {e}")
+                logger.error(f"Exception thrown while creating table '{source_table['Name']}' {e}")
                 table_status.replicated = False
                 table_status.error = True
         return table_status
 
-    def get_partitions(self, glue, catalog_id, database_name, table_name):
-        master_partition_list = []
+    def get_partitions(self, glue, catalog_id, database_name, table_name, total_segments=1):
+        return list(self.iter_partitions(glue, catalog_id, database_name, table_name, total_segments))
+
+    def iter_partitions(self, glue, catalog_id, database_name, table_name, total_segments=1):
+        if total_segments > 1:
+            yield from self.iter_partitions_parallel(glue, catalog_id, database_name, table_name, total_segments)
+            return
+
         paginator = glue.get_paginator('get_partitions')
         page_iterator = paginator.paginate(DatabaseName=database_name, CatalogId=catalog_id, TableName=table_name)
-        for page in page_iterator:
+        for page in stage_metrics.time_iterator("FetchPartitions", page_iterator):
             for partition in page["Partitions"]:
-                if "CreationTime" in partition:
-                    partition["CreationTime"] = str(partition["CreationTime"])
-                if "UpdateTime" in partition:
-                    partition["UpdateTime"] = str(partition["UpdateTime"])
-                master_partition_list.append(partition)
-                if "LastAccessTime" in partition:
-                    partition["LastAccessTime"] = str(partition["LastAccessTime"])
-        return master_partition_list
-        
-    def add_partitions(self, glue, partitions_to_add, catalog_id, database_name, table_name):
-            num_partitions_added = 0
-            partitions_added = False
-            batch_create_partition_request = {
-                'CatalogId': catalog_id,
-                'DatabaseName': database_name,
-                'TableName': table_name
-            }
-    
-            partition_input_list = []
+                yield self.convert_partition_timestamps(partition)
+
+    def iter_partitions_parallel(self, glue, catalog_id, database_name, table_name, total_segments):
+        # Each segment is paged on its own thread; pages are handed over through a bounded queue so partitions
+        # are yielded as they arrive instead of being merged in memory. Partition order is not preserved.
+        total_segments = min(total_segments, MAX_PARTITION_SEGMENTS)
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def fetch_segment(segment_number):
+            try:
+                paginator = glue.get_paginator('get_partitions')
+                page_iterator = paginator.paginate(
+                    DatabaseName=database_name, CatalogId=catalog_id, TableName=table_name,
+                    Segment={'SegmentNumber': segment_number, 'TotalSegments': total_segments}
+                )
+                for page in stage_metrics.time_iterator("FetchPartitions", page_iterator):
+                    if stop.is_set():
+                        return
+                    put(page["Partitions"])
+                put(None)
+            except Exception as e:
+                put(e)
+
+        logger.info(f"Fetching partitions of table '{table_name}' of database '{database_name}' using {total_segments} segments.")
+        with ThreadPoolExecutor(max_workers=total_segments) as executor:
+            for segment_number in range(total_segments):
+                executor.submit(fetch_segment, segment_number)
+            segments_completed = 0
+            try:
+                while segments_completed < total_segments:
+                    item = pages.get()
+                    if item is None:
+                        segments_completed += 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        for partition in item:
+                            yield self.convert_partition_timestamps(partition)
+            finally:
+                stop.set()
+
+    def iter_partition_pages(self, glue, catalog_id, database_name, table_name, segment_number=0, total_segments=1,
+                             next_token=None):
+        # Yields (partitions, next_token) for each GetPartitions page of one segment, starting at next_token. The
+        # token of the last page is None; passing a yielded token back in resumes right after that page.
+        while True:
+            request = {'CatalogId': catalog_id, 'DatabaseName': database_name, 'TableName': table_name}
+            if total_segments > 1:
+                request['Segment'] = {'SegmentNumber': segment_number, 'TotalSegments': total_segments}
+            if next_token:
+                request['NextToken'] = next_token
+            with stage_metrics.time_stage("FetchPartitions"):
+                response = glue.get_partitions(**request)
+            next_token = response.get('NextToken')
+            yield [self.convert_partition_timestamps(partition) for partition in response['Partitions']], next_token
+            if not next_token:
+                return
+
+    @staticmethod
+    def convert_partition_timestamps(partition):
+        if "CreationTime" in partition:
+            partition["CreationTime"] = str(partition["CreationTime"])
+        if "UpdateTime" in partition:
+            partition["UpdateTime"] = str(partition["UpdateTime"])
+        if "LastAccessTime" in partition:
+            partition["LastAccessTime"] = str(partition["LastAccessTime"])
+        return partition
+
+    def add_partitions(self, glue, partitions_to_add, catalog_id, database_name, table_name,
+                       max_workers=DEFAULT_PARTITION_BATCH_WORKERS, should_stop=None):
+        # partitions_to_add may be any iterable: batches of 100 are submitted as soon as they fill up, and the number
+        # of batches waiting for a worker is bounded so a streamed input is never pulled fully into memory.
+        # should_stop is checked after each submitted batch; once it returns True no more partitions are read and
+        # the batches already submitted are completed.
+        result = PartitionBatchResult()
+        backoff = AdaptiveBackoff()
+        pending_batches = threading.BoundedSemaphore(max_workers * 2)
+        futures = []
+        num_partitions = 0
+
+        def submit(part_input_list):
+            pending_batches.acquire()
+            future = executor.submit(self.create_partition_batch, glue, catalog_id, database_name, table_name,
+                                     part_input_list, backoff)
+            future.add_done_callback(lambda f: pending_batches.release())
+            futures.append(future)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            part_input_list = []
             for partition in partitions_to_add:
-                partition_input = {
+                part_input_list.append({
+                    'StorageDescriptor': partition.get('StorageDescriptor'),
+                    'Values': partition['Values']
+                })
+                num_partitions += 1
+                if len(part_input_list) == 100:
+                    submit(part_input_list)
+                    part_input_list = []
+                    if should_stop and should_stop():
+                        logger.warning(f"Deadline reached. No more partitions will be added to table '{table_name}' in this invocation.")
+                        result.stopped = True
+                        break
+            if part_input_list:
+                submit(part_input_list)
+
+            logger.info(f"Partition Input List Size: {num_partitions}, sent in {len(futures)} batches with up to {max_workers} concurrent requests.")
+            for future in as_completed(futures):
+                result.merge(future.result())
+
+        logger.info(f"Total partitions added: {result.num_partitions_succeeded}, failed: {result.num_partitions_failed}, "
+                    f"retried: {result.num_partitions_retried}")
+        for error in result.errors:
+            logger.warning("Partition error. Values: {}, Error Code: {}, Message: {}", error['Values'], error['ErrorCode'],
+                           error['ErrorMessage'], sampled=True)
+        return result
+
+    def create_partition_batch(self, glue, catalog_id, database_name, table_name, part_input_list, backoff):
+        # Like update_partition_batch, only the partitions Glue reports back as failed with a retryable error are
+        # sent again.
+        batch_result = PartitionBatchResult()
+        pending = part_input_list
+
+        for attempt in range(MAX_PARTITION_BATCH_RETRIES + 1):
+            backoff.wait()
+            try:
+                result = glue.batch_create_partition(
+                    CatalogId=catalog_id,
+                    DatabaseName=database_name,
+                    TableName=table_name,
+                    PartitionInputList=pending
+                )
+            except (ClientError, BotocoreConnectionError, HTTPClientError) as e:
+                error_code = self.get_batch_error_code(e)
+                if error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                    backoff.throttled()
+                    batch_result.num_partitions_retried += len(pending)
+                    continue
+                logger.error(f"Exception in adding partitions: {e}")
+                batch_result.num_partitions_failed += len(pending)
+                batch_result.errors.extend(
+                    {'Values': partition_input['Values'], 'ErrorCode': error_code, 'ErrorMessage': str(e)}
+                    for partition_input in pending
+                )
+                return batch_result
+
+            backoff.succeeded()
+            retry_list, num_failed = self.collect_create_errors(result.get('Errors', []), pending, attempt, batch_result)
+            batch_result.num_partitions_failed += num_failed
+            batch_result.num_partitions_succeeded += len(pending) - len(retry_list) - num_failed
+            if not retry_list:
+                return batch_result
+            backoff.throttled()
+            batch_result.num_partitions_retried += len(retry_list)
+            pending = retry_list
+
+        return batch_result
+
+    @staticmethod
+    def collect_create_errors(part_errors, part_input_list, attempt, batch_result):
+        # Returns the partition inputs of a BatchCreatePartition request to send again and the number of partitions
+        # that failed for good, whose errors are added to batch_result.
+        part_inputs_by_values = {tuple(part_input['Values']): part_input for part_input in part_input_list}
+        retry_list = []
+        num_failed = 0
+        for part_error in part_errors:
+            error_code = part_error['ErrorDetail'].get('ErrorCode', '')
+            if error_code == 'AlreadyExistsException':
+                # A partition added since the diff was computed, e.g. by the import of another part of the same
+                # export, is already there.
+                continue
+            values = part_error.get('PartitionValues', [])
+            part_input = part_inputs_by_values.get(tuple(values))
+            if part_input and error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                retry_list.append(part_input)
+                continue
+            num_failed += 1
+            batch_result.errors.append({
+                'Values': values,
+                'ErrorCode': error_code,
+                'ErrorMessage': part_error['ErrorDetail'].get('ErrorMessage', '')
+            })
+        return retry_list, num_failed
+
+    def get_table_fingerprint(self, table, partition_list):
+        # Changes whenever the table definition (including UpdateTime) or any partition changes. Partition hashes are
+        # summed so the fingerprint does not depend on the order partitions were fetched in.
+        partitions_hash = 0
+        for partition in partition_list:
+            partitions_hash = self.add_partition_fingerprint(partitions_hash, partition)
+        return self.format_table_fingerprint(table, len(partition_list), partitions_hash)
+
+    def add_partition_fingerprint(self, partitions_hash, partition):
+        # Lets callers that stream partitions build the same fingerprint as get_table_fingerprint one partition at a time.
+        partition_definition = {key: value for key, value in partition.items() if key != 'LastAccessTime'}
+        partition_hash = hashlib.md5(json.dumps(partition_definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return (partitions_hash + int(partition_hash, 16)) % (1 << 128)
+
+    def format_table_fingerprint(self, table, num_partitions, partitions_hash):
+        return f"{self.get_table_definition_hash(table)}:{num_partitions}:{partitions_hash:032x}"
+
+    def get_table_definition_hash(self, table):
+        # The first field of a table fingerprint. It lets a table be compared with its last export before its
+        # partitions are paged.
+        table_definition = {key: value for key, value in table.items() if key != 'LastAccessTime'}
+        return hashlib.md5(json.dumps(table_definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_storage_descriptor_hash(self, partition):
+        storage_descriptor = partition.get('StorageDescriptor', {})
+        return hashlib.md5(json.dumps(storage_descriptor, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_partition_diff(self, partitions_from_export, partitions_b4_replication):
+        partition_diff = self.get_streaming_partition_diff(partitions_from_export, partitions_b4_replication)
+        partition_diff.partitions_to_add = list(partition_diff.partitions_to_add)
+        return partition_diff
+
+    def get_streaming_partition_diff(self, partitions_from_export, partitions_b4_replication, skip_partitions=0):
+        # Only the Values and StorageDescriptor hash of the target partitions are kept in memory. The export is
+        # read lazily through partition_diff.partitions_to_add, which yields the partitions missing from the target.
+        # The first skip_partitions export partitions were committed by an earlier invocation: they are only
+        # matched so they are not deleted.
+        partition_diff = PartitionDiff()
+        with stage_metrics.time_stage("DiffPartitions"):
+            target_partition_hashes = {
+                tuple(partition['Values']): self.get_storage_descriptor_hash(partition) for partition in partitions_b4_replication
+            }
+        logger.info(f"Number of partitions before replication: {len(target_partition_hashes)}")
+        partition_diff.partitions_to_add = self.iter_partitions_to_add(partitions_from_export, target_partition_hashes,
+                                                                       partition_diff, skip_partitions)
+        return partition_diff
+
+    def iter_partitions_to_add(self, partitions_from_export, target_partition_hashes, partition_diff, skip_partitions=0):
+        for partition in partitions_from_export:
+            target_hash = target_partition_hashes.pop(tuple(partition['Values']), None)
+            if self.match_partition(partition, target_hash, partition_diff, skip_partitions):
+                yield partition
+
+        partition_diff.partitions_to_delete = [{'Values': list(values)} for values in target_partition_hashes]
+        partition_diff.completed = True
+        self.log_partition_diff(partition_diff)
+
+    def match_partition(self, partition, target_hash, partition_diff, skip_partitions=0):
+        # Partitions are matched on their Values; a matched partition is only rewritten when its StorageDescriptor
+        # differs. Returns whether the partition is missing from the target and must be added.
+        partition_diff.num_partitions_consumed += 1
+        if partition_diff.num_partitions_consumed <= skip_partitions:
+            partition_diff.num_partitions_skipped += 1
+        elif target_hash is None:
+            partition_diff.num_partitions_to_add += 1
+            return True
+        elif self.get_storage_descriptor_hash(partition) != target_hash:
+            partition_diff.partitions_to_update.append(partition)
+        else:
+            partition_diff.num_partitions_unchanged += 1
+        return False
+
+    @staticmethod
+    def log_partition_diff(partition_diff):
+        logger.info(f"Partition diff: {partition_diff.num_partitions_to_add} to add, {len(partition_diff.partitions_to_update)} to update, "
+                    f"{len(partition_diff.partitions_to_delete)} to delete, {partition_diff.num_partitions_unchanged} unchanged, "
+                    f"{partition_diff.num_partitions_skipped} committed earlier.")
+
+    def get_keyed_partition_diff(self, glue, catalog_id, database_name, table_name, partitions_from_export, skip_partitions=0):
+        # Diff of one part of an export that is still being written. The part's partitions are looked up in the target
+        # with BatchGetPartition, so the work is proportional to the part instead of the whole target table. Nothing
+        # is deleted: a target partition missing from the part may be in another part.
+        partition_diff = PartitionDiff()
+        partition_diff.partitions_to_add = self.iter_keyed_partitions_to_add(glue, catalog_id, database_name, table_name,
+                                                                             partitions_from_export, partition_diff,
+                                                                             skip_partitions)
+        return partition_diff
+
+    def iter_keyed_partitions_to_add(self, glue, catalog_id, database_name, table_name, partitions_from_export,
+                                     partition_diff, skip_partitions=0):
+        partitions = iter(partitions_from_export)
+        while True:
+            chunk = list(itertools.islice(partitions, 100))
+            if not chunk:
+                break
+            values_to_get = [partition['Values'] for partition in chunk]
+            if partition_diff.num_partitions_consumed + len(chunk) <= skip_partitions:
+                values_to_get = []
+            target_partition_hashes = {
+                tuple(partition['Values']): self.get_storage_descriptor_hash(partition)
+                for partition in self.batch_get_partitions(glue, catalog_id, database_name, table_name, values_to_get)
+            }
+            for partition in chunk:
+                target_hash = target_partition_hashes.get(tuple(partition['Values']))
+                if self.match_partition(partition, target_hash, partition_diff, skip_partitions):
+                    yield partition
+
+        partition_diff.completed = True
+        self.log_partition_diff(partition_diff)
+
+    def batch_get_partitions(self, glue, catalog_id, database_name, table_name, partition_values):
+        # Returns the partitions among partition_values that exist. Keys Glue leaves unprocessed are requested again.
+        partitions = []
+        backoff = AdaptiveBackoff()
+        pending = [{'Values': values} for values in partition_values]
+        while pending:
+            backoff.wait()
+            with stage_metrics.time_stage("FetchPartitions"):
+                response = glue.batch_get_partition(CatalogId=catalog_id, DatabaseName=database_name,
+                                                    TableName=table_name, PartitionsToGet=pending)
+            partitions.extend(response.get('Partitions', []))
+            pending = response.get('UnprocessedKeys', [])
+            backoff.throttled()
+        return partitions
+
+    def update_partitions(self, glue, partitions_to_update, catalog_id, database_name, table_name):
+        result = PartitionBatchResult()
+        backoff = AdaptiveBackoff()
+
+        entries = []
+        for partition in partitions_to_update:
+            entries.append({
+                'PartitionValueList': partition['Values'],
+                'PartitionInput': {
                     'StorageDescriptor': partition.get('StorageDescriptor'),
                     'Values': partition['Values']
                 }
-                partition_input_list.append(partition_input)
-    
-            print(f"Partition Input List Size: {len(partition_input_list)}")
-            if len(partition_input_list) > 100:
-                print("The input has more than 100 partitions, it will be sliced into smaller lists with 100 partitions each.")
-    
-            smaller_lists = [partition_input_list[i:i+100] for i in range(0, len(partition_input_list), 100)]
-            for part_input_list in smaller_lists:
-                batch_create_partition_request['PartitionInputList'] = part_input_list
-                try:
-                    result = glue.batch_create_partition(**batch_create_partition_request)
-                    status_code = result['ResponseMetadata']['HTTPStatusCode']
-                    part_errors = result.get('Errors', [])
-                    if status_code == 200 and not part_errors:
-                        print(f"{len(part_input_list)} partitions were added to table '{table_name}' of database '{database_name}'.")
-                        partitions_added = True
-                        num_partitions_added += len(part_input_list)
-                        print(f"{num_partitions_added} of {len(partition_input_list)} partitions added so far.")
-                    else:
-                        print(f"Not all partitions were added. Status Code: {status_code}, Number of partition errors: {len(part_errors)}")
-                        for part_error in part_errors:
-                            print(f"Partition Error Message: {part_error['ErrorDetail']['ErrorMessage']}")
-                            for value in part_error['PartitionValue']:
-                                print(f"Partition error value: {value}")
-                except ClientError as e:
-                    print(f"Exception in adding partitions: {e}")
-                    print(f"{num_partitions_added} of {len(partition_input_list)} partitions added so far.")
-                    # TODO - what to do when there are exceptions here?
-    
-            print(f"Total partitions added: {num_partitions_added}")
-            return partitions_added
-    
+            })
+
+        logger.info(f"Partition Update List Size: {len(entries)}")
+
+        smaller_lists = [entries[i:i+100] for i in range(0, len(entries), 100)]
+        for entry_list in smaller_lists:
+            result.merge(self.update_partition_batch(glue, catalog_id, database_name, table_name, entry_list, backoff))
+            logger.debug("{} of {} partitions updated so far.", result.num_partitions_succeeded, len(entries))
+
+        logger.info(f"Total partitions updated: {result.num_partitions_succeeded}, failed: {result.num_partitions_failed}, "
+                    f"retried: {result.num_partitions_retried}")
+        for error in result.errors:
+            logger.warning("Partition error. Values: {}, Error Code: {}, Message: {}", error['Values'], error['ErrorCode'],
+                           error['ErrorMessage'], sampled=True)
+        return result.succeeded
+
+    def update_partition_batch(self, glue, catalog_id, database_name, table_name, entries, backoff):
+        # Like delete_partition_batch, only the entries Glue reports back as failed with a retryable error are sent again.
+        batch_result = PartitionBatchResult()
+        pending = entries
+
+        for attempt in range(MAX_PARTITION_BATCH_RETRIES + 1):
+            backoff.wait()
+            try:
+                result = glue.batch_update_partition(
+                    CatalogId=catalog_id,
+                    DatabaseName=database_name,
+                    TableName=table_name,
+                    Entries=pending
+                )
+            except (ClientError, BotocoreConnectionError, HTTPClientError) as e:
+                error_code = self.get_batch_error_code(e)
+                if error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                    backoff.throttled()
+                    batch_result.num_partitions_retried += len(pending)
+                    continue
+                logger.error(f"Exception in updating partitions: {e}")
+                batch_result.num_partitions_failed += len(pending)
+                batch_result.errors.extend(
+                    {'Values': entry['PartitionValueList'], 'ErrorCode': error_code, 'ErrorMessage': str(e)}
+                    for entry in pending
+                )
+                return batch_result
+
+            backoff.succeeded()
+            retry_list, num_failed = self.collect_update_errors(result.get('Errors', []), pending, attempt, batch_result)
+            batch_result.num_partitions_failed += num_failed
+            batch_result.num_partitions_succeeded += len(pending) - len(retry_list) - num_failed
+            if not retry_list:
+                return batch_result
+            backoff.throttled()
+            batch_result.num_partitions_retried += len(retry_list)
+            pending = retry_list
+
+        return batch_result
+
+    @staticmethod
+    def collect_update_errors(part_errors, entries, attempt, batch_result):
+        # Returns the entries of a BatchUpdatePartition request to send again and the number of entries that failed
+        # for good, whose errors are added to batch_result.
+        entries_by_values = {tuple(entry['PartitionValueList']): entry for entry in entries}
+        retry_list = []
+        num_failed = 0
+        for part_error in part_errors:
+            error_code = part_error['ErrorDetail'].get('ErrorCode', '')
+            values = part_error.get('PartitionValueList', [])
+            entry = entries_by_values.get(tuple(values))
+            if entry and error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                retry_list.append(entry)
+                continue
+            num_failed += 1
+            batch_result.errors.append({
+                'Values': values,
+                'ErrorCode': error_code,
+                'ErrorMessage': part_error['ErrorDetail'].get('ErrorMessage', '')
+            })
+        return retry_list, num_failed
+
+    @staticmethod
+    def get_batch_error_code(e):
+        # Error code of a partition batch request that raised. A request that got no response has no code of its own.
+        if isinstance(e, ClientError):
+            return e.response['Error']['Code']
+        return 'ConnectionError'
+
+    def apply_partition_diff(self, glue, partition_diff, catalog_id, database_name, table_name,
+                             max_workers=DEFAULT_PARTITION_BATCH_WORKERS, should_stop=None):
+        # glue should be a client created with PARTITION_BATCH_CLIENT_RETRIES. Partitions are added first so a streamed
+        # diff is complete before updates and deletes are issued.
+        # When should_stop ends the adds early, the updates found so far are still applied so that every export
+        # partition read (partition_diff.num_partitions_consumed) is committed, and partition_diff.stopped is set.
+        with stage_metrics.time_stage("AddPartitions"):
+            add_result = self.add_partitions(glue, partition_diff.partitions_to_add, catalog_id,
+                                             database_name, table_name, max_workers, should_stop)
+        stage_metrics.add("PartitionsAdded", add_result.num_partitions_succeeded)
+        partitions_added = add_result.succeeded
+        partitions_updated = True
+        partitions_deleted = True
+
+        if partition_diff.partitions_to_update:
+            with stage_metrics.time_stage("UpdatePartitions"):
+                partitions_updated = self.update_partitions(glue, partition_diff.partitions_to_update, catalog_id,
+                                                            database_name, table_name)
+        if add_result.stopped:
+            partition_diff.stopped = True
+            return partitions_added and partitions_updated
+        if partition_diff.partitions_to_delete:
+            with stage_metrics.time_stage("DeletePartitions"):
+                delete_result = self.delete_partitions(glue, catalog_id, database_name, table_name,
+                                                       partition_diff.partitions_to_delete, max_workers, should_stop)
+            stage_metrics.add("PartitionsDeleted", delete_result.num_partitions_succeeded)
+            partitions_deleted = delete_result.succeeded
+            partition_diff.stopped = delete_result.stopped
+        if partition_diff.is_empty():
+            logger.info(f"Partitions of table '{table_name}' of database '{database_name}' are already in sync with the export.")
+
+        return partitions_added and partitions_updated and partitions_deleted
+
     def delete_partition(self, glue, catalog_id, database_name, table_name, partition):
         partition_deleted = False
         delete_partition_request = {
@@ -288,42 +776,99 @@ class GlueUtil:
             result = glue.delete_partition(**delete_partition_request)
             status_code = result['ResponseMetadata']['HTTPStatusCode']
             if status_code == 200:
-                print(f"Partition deleted from table '{table_name}' of database '{database_name}'")
+                logger.debug("Partition deleted from table '{}' of database '{}'", table_name, database_name)
                 partition_deleted = True
         except ClientError as e:
-            print(f"Exception in deleting partition: {e}")
+            logger.error(f"Exception in deleting partition: {e}")
 
         return partition_deleted
 
-    def delete_partitions(self, glue, catalog_id, database_name, table_name, partitions_to_delete):
-        partitions_deleted = False
-
-        batch_delete_partition_request = {
-            'CatalogId': catalog_id,
-            'DatabaseName': database_name,
-            'TableName': table_name
-        }
+    def delete_partitions(self, glue, catalog_id, database_name, table_name, partitions_to_delete,
+                          max_workers=DEFAULT_PARTITION_BATCH_WORKERS, should_stop=None):
+        result = PartitionBatchResult()
 
         partition_value_list = [{'Values': partition['Values']} for partition in partitions_to_delete]
-        print(f"Size of List of PartitionValueList: {len(partition_value_list)}")
+        logger.info(f"Size of List of PartitionValueList: {len(partition_value_list)}")
 
+        backoff = AdaptiveBackoff()
+
+        # BatchDeletePartition accepts at most 25 partitions per request.
         smaller_lists = [partition_value_list[i:i+25] for i in range(0, len(partition_value_list), 25)]
-        for smaller_list in smaller_lists:
-            batch_delete_partition_request['PartitionsToDelete'] = smaller_list
+        # Batches are submitted as workers free up, so should_stop can end the deletes between batches.
+        pending_batches = threading.BoundedSemaphore(max_workers * 2)
+        futures = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for smaller_list in smaller_lists:
+                if should_stop and should_stop():
+                    logger.warning(f"Deadline reached. No more partitions will be deleted from table '{table_name}' in this invocation.")
+                    result.stopped = True
+                    break
+                pending_batches.acquire()
+                future = executor.submit(self.delete_partition_batch, glue, catalog_id, database_name, table_name, smaller_list, backoff)
+                future.add_done_callback(lambda f: pending_batches.release())
+                futures.append(future)
+            for future in as_completed(futures):
+                result.merge(future.result())
+
+        logger.info(f"Total partitions deleted from table '{table_name}' of database '{database_name}': {result.num_partitions_succeeded}, "
+                    f"failed: {result.num_partitions_failed}, retried: {result.num_partitions_retried}")
+        for error in result.errors:
+            logger.warning("Partition error. Values: {}, Error Code: {}, Message: {}", error['Values'], error['ErrorCode'],
+                           error['ErrorMessage'], sampled=True)
+        return result
+
+    def delete_partition_batch(self, glue, catalog_id, database_name, table_name, partition_values, backoff):
+        # Only the entries Glue reports back as failed with a retryable error are sent again.
+        batch_result = PartitionBatchResult()
+        pending = partition_values
+
+        for attempt in range(MAX_PARTITION_BATCH_RETRIES + 1):
+            backoff.wait()
             try:
-                result = glue.batch_delete_partition(**batch_delete_partition_request)
-                status_code = result['ResponseMetadata']['HTTPStatusCode']
-                part_errors = result.get('Errors', [])
-                if status_code == 200 and not part_errors:
-                    print(f"{len(smaller_list)} partitions from table '{table_name}' of database '{database_name}' were deleted.")
-                    partitions_deleted = True
-                else:
-                    print(f"Not all partitions were deleted. Status Code: {status_code}, Number of partition errors: {len(part_errors)}")
-                    for part_error in part_errors:
-                        print(f"Partition Error Message: {part_error['ErrorDetail']['ErrorMessage']}")
-                        for value in part_error['PartitionValue']:
-                            print(f"Partition value: {value}")
-            except ClientError as e:
-                print(f"Exception in deleting partitions: {e}")
-
-        return partitions_deleted
+                result = glue.batch_delete_partition(
+                    CatalogId=catalog_id,
+                    DatabaseName=database_name,
+                    TableName=table_name,
+                    PartitionsToDelete=pending
+                )
+            except (ClientError, BotocoreConnectionError, HTTPClientError) as e:
+                error_code = self.get_batch_error_code(e)
+                if error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                    backoff.throttled()
+                    batch_result.num_partitions_retried += len(pending)
+                    continue
+                logger.error(f"Exception in deleting partitions: {e}")
+                batch_result.num_partitions_failed += len(pending)
+                batch_result.errors.extend(
+                    {'Values': partition_value['Values'], 'ErrorCode': error_code, 'ErrorMessage': str(e)}
+                    for partition_value in pending
+                )
+                return batch_result
+
+            backoff.succeeded()
+            retry_list = []
+            num_failed = 0
+            for part_error in result.get('Errors', []):
+                error_code = part_error['ErrorDetail'].get('ErrorCode', '')
+                if error_code == 'EntityNotFoundException':
+                    # Partition is already gone, which is the outcome we wanted.
+                    continue
+                if error_code in RETRYABLE_PARTITION_ERROR_CODES and attempt < MAX_PARTITION_BATCH_RETRIES:
+                    retry_list.append({'Values': part_error['PartitionValues']})
+                    continue
+                num_failed += 1
+                batch_result.errors.append({
+                    'Values': part_error.get('PartitionValues', []),
+                    'ErrorCode': error_code,
+                    'ErrorMessage': part_error['ErrorDetail'].get('ErrorMessage', '')
+                })
+
+            batch_result.num_partitions_failed += num_failed
+            batch_result.num_partitions_succeeded += len(pending) - len(retry_list) - num_failed
+            if not retry_list:
+                return batch_result
+            backoff.throttled()
+            batch_result.num_partitions_retried += len(retry_list)
+            pending = retry_list
+
+        return batch_result
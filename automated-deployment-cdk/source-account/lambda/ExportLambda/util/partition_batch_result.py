@@ -0,0 +1,19 @@
+class PartitionBatchResult:
+    def __init__(self):
+        self.num_partitions_succeeded = 0
+        self.num_partitions_failed = 0
+        self.num_partitions_retried = 0
+        self.errors = []
+        # Set when the operation stopped before submitting every batch because its deadline was reached.
+        self.stopped = False
+
+    @property
+    def succeeded(self):
+        return self.num_partitions_failed == 0
+
+    def merge(self, batch_result):
+        self.num_partitions_succeeded += batch_result.num_partitions_succeeded
+        self.num_partitions_failed += batch_result.num_partitions_failed
+        self.num_partitions_retried += batch_result.num_partitions_retried
+        self.errors.extend(batch_result.errors)
+        self.stopped = self.stopped or batch_result.stopped
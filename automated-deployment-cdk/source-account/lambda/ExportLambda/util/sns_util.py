@@ -4,6 +4,9 @@ import time
 from typing import List
 from boto3 import client
 from util.ddb_util import DDBUtil
+from util.logger import logger
+from util.sns_batch_publisher import SNSBatchPublisher
+from util.stage_metrics import stage_metrics
 
 class SNSUtil:
 
@@ -33,16 +36,19 @@ class SNSUtil:
         }
 
         try:
-            publish_response = sns_client.publish(
-                TopicArn=topic_arn,
-                Message=message,
-                MessageAttributes=message_attributes
-            )
+            with stage_metrics.time_stage("Publish"):
+                publish_response = sns_client.publish(
+                    TopicArn=topic_arn,
+                    Message=message,
+                    MessageAttributes=message_attributes
+                )
+            stage_metrics.add("MessagesPublished", 1)
+            stage_metrics.add("PublishedBytes", len(message.encode('utf-8')), "Bytes")
             return publish_response
         except Exception as e:
-            print(f"Large Table message could not be published to SNS Topic. Topic ARN: {topic_arn}")
-            print(f"Message to be published: {message}")
-            print(e)
+            logger.error(f"Large Table message could not be published to SNS Topic. Topic ARN: {topic_arn}")
+            logger.debug("Message to be published: {}", message)
+            logger.error(e)
 
     def publish_database_schema_to_sns(self, sns_client, topic_arn, database_ddl,
                                        source_glue_catalog_id, export_batch_id):
@@ -62,19 +68,19 @@ class SNSUtil:
         }
 
         try:
-            
-            print("database_ddldatabase_ddldatabase_ddl")
-            print(database_ddl)
-             
-            publish_response = sns_client.publish(
-                TopicArn=topic_arn,
-                Message=database_ddl,
-                MessageAttributes=message_attributes
-            )
+            logger.debug("Database schema to be published: {}", database_ddl)
+            with stage_metrics.time_stage("Publish"):
+                publish_response = sns_client.publish(
+                    TopicArn=topic_arn,
+                    Message=database_ddl,
+                    MessageAttributes=message_attributes
+                )
+            stage_metrics.add("MessagesPublished", 1)
+            stage_metrics.add("PublishedBytes", len(database_ddl.encode('utf-8')), "Bytes")
             return publish_response
         except Exception as e:
-            print("Database schema could not be published to SNS Topic.")
-            print(e)
+            logger.error("Database schema could not be published to SNS Topic.")
+            logger.error(e)
 
     def publish_database_schemas_to_sns(self, sns_client, master_db_list: List[dict], sns_topic_arn: str,
                                         ddb_util: DDBUtil, ddb_tbl_name: str, source_glue_catalog_id: str) -> int:
@@ -86,38 +92,55 @@ class SNSUtil:
         export_batch_id_ma = {"DataType": "String", "StringValue": export_batch_id}
 
         number_of_databases_exported = 0
+        publisher = SNSBatchPublisher(sns_client, sns_topic_arn)
+
+        message_attributes = {
+            "source_catalog_id": source_catalog_id_ma,
+            "message_type": msg_type_ma,
+            "export_batch_id": export_batch_id_ma
+        }
 
         for db in master_db_list:
             database_ddl = json.dumps(db, default=lambda obj: obj.__dict__)
-            
-            message_attributes = {
-                "source_catalog_id": source_catalog_id_ma,
-                "message_type": msg_type_ma,
-                "export_batch_id": export_batch_id_ma
-            }
+            publisher.publish(database_ddl, message_attributes, (db['Name'], database_ddl))
 
-            try:
-                publish_response = sns_client.publish(
-                    TopicArn=sns_topic_arn,
-                    Message=database_ddl,
-                    MessageAttributes=message_attributes
-                )
+        for (db_name, database_ddl), message_id in publisher.flush():
+            if message_id:
                 number_of_databases_exported += 1
-                print(f"Schema for Database '{db['Name']}' published to SNS Topic. Message_Id: {publish_response['MessageId']}")
-                ddb_util.track_database_export_status(ddb_tbl_name, db['Name'], database_ddl, publish_response['MessageId'],
+                logger.debug("Schema for Database '{}' published to SNS Topic. Message_Id: {}", db_name, message_id)
+                ddb_util.track_database_export_status(ddb_tbl_name, db_name, database_ddl, message_id,
                                                       source_glue_catalog_id, int(export_run_id), export_batch_id, True)
-            except Exception as e:
-                print(f"Schema for Database '{db['Name']}' could not be published to SNS Topic. It will be audited in DynamoDB table.")
-                print(e)
-                ddb_util.track_database_export_status(ddb_tbl_name, db['Name'], database_ddl, "", source_glue_catalog_id,
+            else:
+                logger.error(f"Schema for Database '{db_name}' could not be published to SNS Topic. It will be audited in DynamoDB table.")
+                ddb_util.track_database_export_status(ddb_tbl_name, db_name, database_ddl, "", source_glue_catalog_id,
                                                       int(export_run_id), export_batch_id, False)
 
-        print(f"Number of databases exported to SNS: {number_of_databases_exported}")
+        logger.info(f"Number of SNS PublishBatch calls: {publisher.number_of_calls}")
+        logger.info(f"Number of databases exported to SNS: {number_of_databases_exported}")
         return number_of_databases_exported
 
     def publish_table_schema_to_sns(self, sns_client, topic_arn, table, table_ddl,
                                     source_glue_catalog_id, export_batch_id):
-        message_attributes = {
+        message_attributes = self.get_table_message_attributes(source_glue_catalog_id, export_batch_id)
+
+        try:
+            with stage_metrics.time_stage("Publish"):
+                publish_response = sns_client.publish(
+                    TopicArn=topic_arn,
+                    Message=table_ddl,
+                    MessageAttributes=message_attributes
+                )
+            stage_metrics.add("MessagesPublished", 1)
+            stage_metrics.add("PublishedBytes", len(table_ddl.encode('utf-8')), "Bytes")
+            logger.debug("Table schema for Table '{}' of database '{}' published to SNS Topic. Message_Id: {}",
+                         table['Name'], table['DatabaseName'], publish_response['MessageId'])
+            return publish_response
+        except Exception as e:
+            logger.error(f"Table schema for Table '{table['Name']}' of database '{table['DatabaseName']}' could not be published to SNS Topic. This will be tracked in DynamoDB table.")
+            logger.error(e)
+
+    def get_table_message_attributes(self, source_glue_catalog_id, export_batch_id):
+        return {
             "source_catalog_id": {
                 "DataType": "String",
                 "StringValue": source_glue_catalog_id
@@ -132,20 +155,44 @@ class SNSUtil:
             }
         }
 
+    def publish_table_list_to_sns(self, sns_client, topic_arn, table_list, export_run_id, source_glue_catalog_id, export_batch_id):
+        message_attributes = self.get_table_list_message_attributes(export_run_id, source_glue_catalog_id, export_batch_id)
+
         try:
-            publish_response = sns_client.publish(
-                TopicArn=topic_arn,
-                Message=table_ddl,
-                MessageAttributes=message_attributes
-            )
-            print(f"Table schema for Table '{table['Name']}' of database '{table['DatabaseName']}' published to SNS Topic. Message_Id: {publish_response['MessageId']}")
+            with stage_metrics.time_stage("Publish"):
+                publish_response = sns_client.publish(
+                    TopicArn=topic_arn,
+                    Message=table_list,
+                    MessageAttributes=message_attributes
+                )
+            stage_metrics.add("MessagesPublished", 1)
+            stage_metrics.add("PublishedBytes", len(table_list.encode('utf-8')), "Bytes")
+            logger.debug("Table list published to SNS Topic. Message_Id: {}", publish_response['MessageId'])
             return publish_response
         except Exception as e:
-            print(f"Table schema for Table '{table['Name']}' of database '{table['DatabaseName']}' could not be published to SNS Topic. This will be tracked in DynamoDB table.")
-            print(e)
-
-    def publish_table_list_to_sns(self, sns_client, topic_arn, table_list, export_run_id, source_glue_catalog_id, export_batch_id):
-        message_attributes = {
+            logger.error(f"Table list could not be published to SNS Topic. This will be tracked in DynamoDB table.")
+            logger.error(e)
+
+    def publish_table_lists_to_sns(self, sns_client, topic_arn, table_lists: List[str], export_run_id, source_glue_catalog_id,
+                                   export_batch_id) -> int:
+        message_attributes = self.get_table_list_message_attributes(export_run_id, source_glue_catalog_id, export_batch_id)
+        publisher = SNSBatchPublisher(sns_client, topic_arn)
+        for message_number, table_list in enumerate(table_lists, start=1):
+            publisher.publish(table_list, message_attributes, message_number)
+
+        number_of_table_lists_published = 0
+        for message_number, message_id in publisher.flush():
+            if message_id:
+                number_of_table_lists_published += 1
+                logger.debug("Table list message number {} published to SNS Topic. Message_Id: {}",
+                             message_number, message_id)
+            else:
+                logger.error(f"Table list message number {message_number} could not be published to SNS Topic.")
+        logger.info(f"Number of SNS PublishBatch calls: {publisher.number_of_calls}")
+        return number_of_table_lists_published
+
+    def get_table_list_message_attributes(self, export_run_id, source_glue_catalog_id, export_batch_id):
+        return {
             "source_catalog_id": {
                 "DataType": "String",
                 "StringValue": source_glue_catalog_id
@@ -163,15 +210,3 @@ class SNSUtil:
                 "StringValue": export_run_id
             }
         }
-
-        try:
-            publish_response = sns_client.publish(
-                TopicArn=topic_arn,
-                Message=table_list,
-                MessageAttributes=message_attributes
-            )
-            print(f"Table list published to SNS Topic. Message_Id: {publish_response['MessageId']}")
-            return publish_response
-        except Exception as e:
-            print(f"Table list could not be published to SNS Topic. This will be tracked in DynamoDB table.")
-            print(e)
@@ -0,0 +1,23 @@
+from util.batch_sender import BatchSender, MAX_BATCH_RETRIES
+
+RETRYABLE_SEND_ERROR_CODES = ("ThrottlingException", "RequestThrottled", "AWS.SimpleQueueService.Throttling",
+                              "InternalError", "InternalFailure", "ServiceUnavailable")
+
+class SQSBatchSender(BatchSender):
+    # Buffers messages for one queue and sends them with SendMessageBatch.
+    body_field = "MessageBody"
+    retryable_error_codes = RETRYABLE_SEND_ERROR_CODES
+    operation_name = "SendMessageBatch"
+    stage_name = "Enqueue"
+    messages_metric = "MessagesEnqueued"
+    bytes_metric = "EnqueuedBytes"
+
+    def __init__(self, sqs_client, queue_url, max_retries=MAX_BATCH_RETRIES):
+        super().__init__(sqs_client, queue_url, max_retries)
+        self.queue_url = queue_url
+
+    def send(self, message_body, message_attributes, context=None):
+        self.add(message_body, message_attributes, context)
+
+    def call_batch(self, entries):
+        return self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
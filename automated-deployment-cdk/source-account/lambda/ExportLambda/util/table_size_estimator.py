@@ -0,0 +1,32 @@
+import json
+
+# Byte size of json.dumps({"PartitionList": [...], "Table": {...}}) without the partitions and the table.
+TABLE_WITH_PARTS_OVERHEAD = len(json.dumps({"PartitionList": [], "Table": None}).encode('utf-8')) - len(b"null")
+PARTITION_SEPARATOR = ", "
+
+class TableSizeEstimator:
+    # Accumulates the serialized size of a table and its partitions while partitions are paged in. Every partition
+    # is serialized once; to_json joins the pieces into the same document json.dumps(table_with_parts) would return.
+    def __init__(self, table):
+        self.table_json = json.dumps(table)
+        self.table_size = len(self.table_json.encode('utf-8'))
+        self.partition_jsons = []
+        self.partitions_size = 0
+
+    def add_partition(self, partition):
+        partition_json = json.dumps(partition)
+        if self.partition_jsons:
+            self.partitions_size += len(PARTITION_SEPARATOR)
+        self.partitions_size += len(partition_json.encode('utf-8'))
+        self.partition_jsons.append(partition_json)
+
+    @property
+    def num_partitions(self):
+        return len(self.partition_jsons)
+
+    @property
+    def size(self):
+        return TABLE_WITH_PARTS_OVERHEAD + self.table_size + self.partitions_size
+
+    def to_json(self):
+        return f'{{"PartitionList": [{PARTITION_SEPARATOR.join(self.partition_jsons)}], "Table": {self.table_json}}}'
@@ -1,28 +1,38 @@
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List
 
-import boto3
-from botocore.config import Config
 from botocore.exceptions import ClientError
 
+from util.api_call_metrics import api_call_metrics
+from util.client_registry import get_client
 from util.ddb_util import DDBUtil
-from util.glue_util import GlueUtil
+from util.glue_rate_limiter import glue_rate_limiter
+from util.glue_util import GlueUtil, MAX_PARTITION_SEGMENTS
 from util.large_table import LargeTable
+from util.logger import logger
 from util.s3_util import S3Util
 from util.sns_util import SNSUtil
+from util.stage_metrics import stage_metrics
 
 def lambda_handler(event, context):
     region = os.environ.get("region", "us-east-1")
     topic_arn = os.environ.get("sns_topic_arn_export_dbs_tables", "arn:aws:sns:us-east-1:1234567890:GlueExportSNSTopic")
     bucket_name = os.environ.get("s3_bucket_name", "")
     ddb_tbl_name_for_table_status_tracking = os.environ.get("ddb_name_table_export_status", "ddb_name_table_export_status")
+    partition_segments = int(os.environ.get("partition_segments", "4"))
+    partition_object_format = os.environ.get("partition_object_format", "manifest")
+    skip_unchanged_tables = os.environ.get("skip_unchanged_tables", "true").lower() == "true"
+    unchanged_table_max_age_hours = float(os.environ.get("unchanged_table_max_age_hours", "168"))
+    partitions_per_part = int(os.environ.get("partitions_per_part", "20000"))
+    publish_parts = os.environ.get("publish_parts", "true").lower() == "true"
 
-    config = Config(retries={"max_attempts": 10})
-    glue = boto3.client("glue", region_name=region, config=config)
-    sns = boto3.client("sns", region_name=region)
+    glue = get_client("glue", region_name=region, retries={"max_attempts": 10})
+    sns = get_client("sns", region_name=region)
 
     ddb_util = DDBUtil()
     glue_util = GlueUtil()
@@ -34,8 +44,8 @@ def lambda_handler(event, context):
     record_processed = False
     object_created = False
 
-    print(f"Number of messages in SQS Event: {len(event['Records'])}")
-    print(event["Records"])
+    logger.info(f"Number of messages in SQS Event: {len(event['Records'])}")
+    logger.debug("Records: {}", event["Records"])
 
     for record in event["Records"]:
         payload = json.loads(record["body"])
@@ -48,13 +58,13 @@ def lambda_handler(event, context):
         for key, value in record["messageAttributes"].items():
             if key.lower() == "exportbatchid":
                 export_batch_id = value["stringValue"]
-                print(f"Export Batch Id: {export_batch_id}")
+                logger.debug(f"Export Batch Id: {export_batch_id}")
             elif key.lower() == "sourcegluedatacatalogid":
                 source_glue_catalog_id = value["stringValue"]
-                print(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
+                logger.debug(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
             elif key.lower() == "schematype":
                 message_type = value["stringValue"] 
-                print(f"Message Type: {message_type}")
+                logger.debug(f"Message Type: {message_type}")
 
         if message_type.lower() == "largetable":
             large_table = LargeTable()
@@ -64,37 +74,83 @@ def lambda_handler(event, context):
             large_table.table = payload.get("Table")
             large_table.s3_object_key = payload.get("s3ObjectKey", "")
             large_table.s3_bucket_name = payload.get("s3BucketName", bucket_name)
+            partition_fingerprint = {"num_partitions": 0, "partitions_hash": 0}
+            table_unchanged = False
+            table_id = f"{large_table.table['Name']}|{large_table.table['DatabaseName']}"
 
-            if large_table.large_table:
-                date_str = datetime.now().strftime("%Y-%m-%d")
-                object_key = f"{date_str}_{int(time.time() * 1000)}_{source_glue_catalog_id}_{large_table.table['DatabaseName']}_{large_table.table['Name']}.txt"
+            # ExportLambda stops paging partitions once it knows a table is large, so the table is compared with its
+            # last successful export using the fingerprint of the export pass itself. Only a table whose definition is
+            # unchanged can be unchanged as a whole: its parts are not published until the comparison is made.
+            last_fingerprint = None
+            if large_table.large_table and skip_unchanged_tables:
+                last_fingerprint = ddb_util.get_table_export_fingerprints(ddb_tbl_name_for_table_status_tracking, [table_id],
+                                                                          unchanged_table_max_age_hours).get(table_id)
+                if last_fingerprint and last_fingerprint.split(":")[0] != glue_util.get_table_definition_hash(large_table.table):
+                    last_fingerprint = None
 
-                content = get_partitions_and_create_object_content(context, glue, glue_util, source_glue_catalog_id, large_table, export_batch_id)
-                object_created = s3_util.create_s3_object(region, bucket_name, object_key, content)
+            if large_table.large_table:
+                publish_part = None
+                if publish_parts and not last_fingerprint:
+                    publish_part = lambda part_key, num_partitions: publish_export_part(
+                        sns_util, sns, topic_arn, region, bucket_name, large_table, part_key, num_partitions,
+                        source_glue_catalog_id, export_batch_id, message_type)
+                export_result = export_partitions_in_parts(glue, glue_util, s3_util, ddb_util, region, bucket_name,
+                                                           source_glue_catalog_id, large_table, record["messageId"],
+                                                           ddb_tbl_name_for_table_status_tracking, partition_segments,
+                                                           partition_object_format, partitions_per_part, publish_part)
+                object_key = export_result["object_prefix"]
+                object_created = True
+                large_table.s3_object_keys = export_result["part_keys"]
+                partition_fingerprint["num_partitions"] = export_result["num_partitions"]
+                partition_fingerprint["partitions_hash"] = export_result["partitions_hash"]
 
             publish_response = None
             large_table_json = ""
 
-            if object_created and object_key:
+            if object_created:
+                large_table.number_of_partitions = partition_fingerprint["num_partitions"]
+                fingerprint = glue_util.format_table_fingerprint(large_table.table, partition_fingerprint["num_partitions"],
+                                                                 partition_fingerprint["partitions_hash"])
+                if last_fingerprint == fingerprint:
+                    logger.info(f"Table {large_table.table['Name']} has not changed since its last successful export. It will not be published.")
+                    s3_util.delete_objects(region, bucket_name, large_table.s3_object_keys)
+                    ddb_util.delete_table_export_checkpoint(ddb_tbl_name_for_table_status_tracking,
+                                                            large_table.table["DatabaseName"], large_table.table["Name"])
+                    table_unchanged = True
+                    record_processed = True
+                    stage_metrics.add("TablesUnchanged", 1)
+
+            if object_created and object_key and not table_unchanged:
                 large_table.s3_object_key = object_key
                 large_table.s3_bucket_name = bucket_name
-                large_table_json = json.dumps(large_table.__dict__)
-                print(f"Large Table JSON: {large_table_json}")
+                with stage_metrics.time_stage("Serialize"):
+                    large_table_json = json.dumps(large_table.__dict__)
+                logger.debug("Large Table JSON: {}", large_table_json)
                 publish_response = sns_util.publish_large_table_schema_to_sns(
                     sns, topic_arn, region, bucket_name, large_table_json,
                     source_glue_catalog_id, export_batch_id, message_type
                 )
                 if publish_response:
-                    print(f"Large Table Schema Published to SNS Topic. Message Id: {publish_response['MessageId']}")
+                    logger.info(f"Large Table Schema Published to SNS Topic. Message Id: {publish_response['MessageId']}")
+                    ddb_util.delete_table_export_checkpoint(ddb_tbl_name_for_table_status_tracking,
+                                                            large_table.table["DatabaseName"], large_table.table["Name"])
                     record_processed = True
 
-            if publish_response:
+            if table_unchanged:
+                continue
+            elif publish_response:
+                stage_metrics.add("TablesExported", 1)
+                stage_metrics.add("PayloadBytes", len(large_table_json.encode('utf-8')), "Bytes")
                 ddb_util.track_table_export_status(
                     ddb_tbl_name_for_table_status_tracking,
                     large_table.table["DatabaseName"], large_table.table["Name"], large_table_json,
                     publish_response["MessageId"], source_glue_catalog_id, export_run_id, export_batch_id,
                     True, True, bucket_name, object_key
                 )
+                ddb_util.track_table_export_fingerprint(
+                    ddb_tbl_name_for_table_status_tracking, large_table.table["DatabaseName"],
+                    large_table.table["Name"], fingerprint, source_glue_catalog_id, export_run_id
+                )
             else:
                 ddb_util.track_table_export_status(
                     ddb_tbl_name_for_table_status_tracking,
@@ -103,20 +159,129 @@ def lambda_handler(event, context):
                     False, True, None, None
                 )
 
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("ExportLargeTable")
     if not record_processed:
-        print(f"Schema for table '{large_table.table['Name']}' of database '{large_table.table['DatabaseName']}' could not be exported. This is an exception. It will be retried again.")
+        logger.error(f"Schema for table '{large_table.table['Name']}' of database '{large_table.table['DatabaseName']}' could not be exported. This is an exception. It will be retried again.")
         raise RuntimeError()
 
     return "Success"
 
-def get_partitions_and_create_object_content(context, glue, glue_util, source_glue_catalog_id, large_table, export_batch_id):
-    content = []
-    table = glue_util.get_table(glue, source_glue_catalog_id, large_table.table["DatabaseName"], large_table.table["Name"])
-    if table:
-        partition_list = glue_util.get_partitions(glue, source_glue_catalog_id, large_table.table["DatabaseName"], large_table.table["Name"])
-        for i, partition in enumerate(partition_list, start=1):
-            partition_ddl = json.dumps(partition)
-            content.append(partition_ddl)
-            print(f"Partition #: {i}, schema: {partition_ddl}.")
-
-    return "\n".join(content)
+def publish_export_part(sns_util, sns, topic_arn, region, bucket_name, large_table, part_key, num_partitions,
+                        source_glue_catalog_id, export_batch_id, message_type):
+    # Lets the importer add and update the partitions of a part while later parts are still being written. A part
+    # that cannot be published is imported with the message completing the export.
+    part_message = dict(large_table.__dict__, s3_object_key=part_key, s3_bucket_name=bucket_name, s3_object_keys=[part_key],
+                        number_of_partitions=num_partitions, export_complete=False)
+    if not sns_util.publish_large_table_schema_to_sns(sns, topic_arn, region, bucket_name, json.dumps(part_message),
+                                                      source_glue_catalog_id, export_batch_id, message_type):
+        logger.warning(f"Part '{part_key}' could not be published. It will be imported with the complete export.")
+
+def export_partitions_in_parts(glue, glue_util, s3_util, ddb_util, region, bucket_name, source_glue_catalog_id, large_table,
+                               message_id, ddb_tbl_name, partition_segments=1, partition_object_format="manifest",
+                               partitions_per_part=20000, publish_part=None):
+    # Each segment is paged on its own thread and written as numbered part objects of about partitions_per_part
+    # partitions. A part is streamed from the Glue pages to S3 as it is read, so a segment holds one page and one
+    # multipart upload part in memory whatever the part size. After every part but the last of a segment,
+    # publish_part(part_key, num_partitions) is called. After every part the Glue NextToken of the segment is
+    # checkpointed in DynamoDB, so when the same SQS message is delivered again the export resumes after the last
+    # part written instead of starting over.
+    database_name = large_table.table["DatabaseName"]
+    table_name = large_table.table["Name"]
+    total_segments = min(max(partition_segments, 1), MAX_PARTITION_SEGMENTS)
+    suffix = ".jsonl.gz" if partition_object_format.lower() == "manifest" else ".txt"
+
+    checkpoint = ddb_util.get_table_export_checkpoint(ddb_tbl_name, database_name, table_name)
+    if checkpoint and checkpoint["message_id"] == message_id and checkpoint["total_segments"] == total_segments:
+        logger.info(f"Resuming export of table '{table_name}' from checkpoint. Object prefix: {checkpoint['object_prefix']}")
+    else:
+        date_str = datetime.now().strftime("%Y-%m-%d")
+        checkpoint = {
+            "message_id": message_id,
+            "object_prefix": f"{date_str}_{int(time.time() * 1000)}_{source_glue_catalog_id}_{database_name}_{table_name}",
+            "total_segments": total_segments,
+            "segments": {
+                str(segment_number): {"next_token": None, "parts": [], "num_partitions": 0, "partitions_hash": "0", "done": False}
+                for segment_number in range(total_segments)
+            }
+        }
+        # A table deleted since it was listed is exported without partitions, like an empty table.
+        if not glue_util.get_table(glue, source_glue_catalog_id, database_name, table_name):
+            for state in checkpoint["segments"].values():
+                state["done"] = True
+
+    checkpoint_lock = threading.Lock()
+
+    def read_part(page, pages, progress):
+        # Yields the partitions of one part: the given page, then the following pages until the part holds
+        # partitions_per_part partitions or the segment ends. progress keeps the count, hash and NextToken read so far.
+        while True:
+            partitions, next_token = page
+            for partition in partitions:
+                progress["partitions_hash"] = glue_util.add_partition_fingerprint(progress["partitions_hash"], partition)
+                yield partition
+            progress["num_partitions"] += len(partitions)
+            progress["next_token"] = next_token
+            if not next_token or progress["num_partitions"] >= partitions_per_part:
+                return
+            page = next(pages)
+
+    def export_segment(segment_number):
+        state = checkpoint["segments"][str(segment_number)]
+        if state["done"]:
+            return
+        part_keys = list(state["parts"])
+        num_partitions = state["num_partitions"]
+        progress = {"num_partitions": 0, "partitions_hash": int(state["partitions_hash"], 16), "next_token": None}
+
+        pages = glue_util.iter_partition_pages(glue, source_glue_catalog_id, database_name, table_name, segment_number,
+                                               total_segments, state["next_token"])
+        for page in pages:
+            progress.update(num_partitions=0, next_token=page[1])
+            if page[0]:
+                part_key = f"{checkpoint['object_prefix']}/part-{segment_number:02d}-{len(part_keys):05d}{suffix}"
+                partitions = read_part(page, pages, progress)
+                with stage_metrics.time_stage("WritePartitions"):
+                    if suffix == ".jsonl.gz":
+                        object_created = s3_util.create_partition_manifest_object(region, bucket_name, part_key, partitions)
+                    else:
+                        object_created = s3_util.create_s3_object_from_lines(region, bucket_name, part_key,
+                                                                             (json.dumps(partition) for partition in partitions))
+                if not object_created:
+                    raise RuntimeError(f"Part object '{part_key}' could not be written to S3.")
+                part_keys.append(part_key)
+                num_partitions += progress["num_partitions"]
+                stage_metrics.add("PartitionsExported", progress["num_partitions"])
+                logger.debug("Segment {}: part {} with {} partitions written. Object key: {}", segment_number, len(part_keys),
+                             progress["num_partitions"], part_key)
+                # The last part of a segment is imported with the message completing the export, so a table whose
+                # segments fit in one part each is not imported twice.
+                if publish_part and progress["next_token"]:
+                    publish_part(part_key, progress["num_partitions"])
+
+            with checkpoint_lock:
+                state.update({
+                    "next_token": progress["next_token"],
+                    "parts": part_keys,
+                    "num_partitions": num_partitions,
+                    "partitions_hash": f"{progress['partitions_hash']:032x}",
+                    "done": progress["next_token"] is None
+                })
+                ddb_util.track_table_export_checkpoint(ddb_tbl_name, database_name, table_name, checkpoint)
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [executor.submit(export_segment, segment_number) for segment_number in range(total_segments)]
+        for future in futures:
+            future.result()
+
+    segments = [checkpoint["segments"][str(segment_number)] for segment_number in range(total_segments)]
+    partitions_hash = sum(int(state["partitions_hash"], 16) for state in segments) % (1 << 128)
+    export_result = {
+        "object_prefix": checkpoint["object_prefix"],
+        "part_keys": [part_key for state in segments for part_key in state["parts"]],
+        "num_partitions": sum(state["num_partitions"] for state in segments),
+        "partitions_hash": partitions_hash
+    }
+    logger.info(f"Exported {export_result['num_partitions']} partitions of table '{table_name}' in {len(export_result['part_keys'])} part objects.")
+    return export_result
@@ -0,0 +1,23 @@
+class PartitionDiff:
+    def __init__(self):
+        # A list, or a generator when the diff is streamed; partitions_to_update and partitions_to_delete are
+        # only complete once a streamed partitions_to_add has been consumed.
+        self.partitions_to_add = []
+        self.partitions_to_update = []
+        self.partitions_to_delete = []
+        self.num_partitions_to_add = 0
+        self.num_partitions_unchanged = 0
+        # Export partitions read so far, and those at the start of the export that an earlier invocation already
+        # committed. completed is set once the whole export has been read; stopped when applying the diff hit its deadline.
+        self.num_partitions_consumed = 0
+        self.num_partitions_skipped = 0
+        self.completed = False
+        self.stopped = False
+
+    @property
+    def num_partitions_in_export(self):
+        return (self.num_partitions_to_add + len(self.partitions_to_update) + self.num_partitions_unchanged
+                + self.num_partitions_skipped)
+
+    def is_empty(self):
+        return not (self.num_partitions_to_add or self.partitions_to_update or self.partitions_to_delete)
@@ -0,0 +1,26 @@
+import threading
+import time
+
+class RateLimiter:
+    # Token bucket shared between threads: allows `rate` requests per second with bursts of up to `burst` requests.
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def reserve(self):
+        # Takes a token and returns how long the caller must wait before using it. Tokens may go negative, so
+        # concurrent callers are served in the order they reserved.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
@@ -1,16 +1,18 @@
 import os
-import logging
 from typing import Optional, List
-from boto3 import client
-from boto3.session import Session
 
+from util.api_call_metrics import api_call_metrics
+from util.client_registry import get_client
 from util.ddb_util import DDBUtil
+from util.glue_rate_limiter import glue_rate_limiter
 from util.glue_util import GlueUtil
+from util.logger import logger
 from util.sns_util import SNSUtil
+from util.stage_metrics import stage_metrics
 
 
 def lambda_handler(event, context):
-    print(f"event: {event}")
+    logger.debug("event: {}", event)
 
     region = os.environ.get("region", "us-east-1")
     source_glue_catalog_id = os.environ.get("source_glue_catalog_id", "1234567890")
@@ -26,8 +28,8 @@ def lambda_handler(event, context):
                         database_prefix_list, separator)
 
     # Create clients for Glue and SNS
-    glue = client("glue", region_name=region)
-    sns = client("sns", region_name=region)
+    glue = get_client("glue", region_name=region)
+    sns = get_client("sns", region_name=region)
 
     # Create instances of utility classes
     ddb_util = DDBUtil()
@@ -53,18 +55,22 @@ def lambda_handler(event, context):
             sns, dbs_to_export, topic_arn, ddb_util, ddb_tbl_name_for_db_status_tracking, source_glue_catalog_id
         )
 
-    print(f"Database export statistics: number of databases exist = {len(db_list)}, "
-          f"number of databases exported to SNS = {num_databases_exported}.")
+    logger.info(f"Database export statistics: number of databases exist = {len(db_list)}, "
+                f"number of databases exported to SNS = {num_databases_exported}.")
+    stage_metrics.add("DatabasesExported", num_databases_exported)
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("GDCReplicationPlanner")
 
     return "Lambda function to get a list of Databases completed successfully!"
 
 def print_env_variables(source_glue_catalog_id, topic_arn, ddb_tbl_name_for_db_status_tracking,
                         database_prefix_list, separator):
-    print(f"source_glue_catalog_id: {source_glue_catalog_id}")
-    print(f"topic_arn: {topic_arn}")
-    print(f"ddb_tbl_name_for_db_status_tracking: {ddb_tbl_name_for_db_status_tracking}")
-    print(f"database_prefix_list: {database_prefix_list}")
-    print(f"separator: {separator}")
+    logger.info(f"source_glue_catalog_id: {source_glue_catalog_id}")
+    logger.info(f"topic_arn: {topic_arn}")
+    logger.info(f"ddb_tbl_name_for_db_status_tracking: {ddb_tbl_name_for_db_status_tracking}")
+    logger.info(f"database_prefix_list: {database_prefix_list}")
+    logger.info(f"separator: {separator}")
 
 def tokenize_database_prefix_string(database_prefix_string: str, separator: str) -> List[str]:
     return [prefix.strip() for prefix in database_prefix_string.split(separator) if prefix.strip()]
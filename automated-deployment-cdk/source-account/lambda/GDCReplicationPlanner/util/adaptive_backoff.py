@@ -0,0 +1,29 @@
+import random
+import threading
+import time
+
+class AdaptiveBackoff:
+    # Delay shared by every worker of a batch operation, so one throttled call slows down all of them.
+    # The delay doubles on each throttled call and halves on each successful one.
+    def __init__(self, base_delay=0.1, max_delay=20.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        delay = self.next_delay()
+        if delay:
+            time.sleep(delay)
+
+    def next_delay(self):
+        delay = self.delay
+        return random.uniform(delay / 2, delay) if delay else 0.0
+
+    def throttled(self):
+        with self.lock:
+            self.delay = min(max(self.delay * 2, self.base_delay), self.max_delay)
+
+    def succeeded(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.base_delay else 0.0
@@ -0,0 +1,89 @@
+import time
+from collections import deque
+
+from util.rate_limiter import RateLimiter
+
+class AdaptiveRateLimiter(RateLimiter):
+    # Token bucket whose rate follows the capacity the service grants. Requests are not paced until the first decrease,
+    # unless max_rate is set; the rate then starts at `decrease` times the rate requests were sent at in the last
+    # second. Each decrease multiplies the rate by `decrease`; while requests wait for tokens, the rate
+    # doubles every second until it is back at the rate of the last decrease, then grows by `increase` requests per
+    # second. Throttled calls within `cooldown` seconds of a decrease were already in flight and do not decrease it.
+    # Without max_rate, requests are no longer paced after `recovery` seconds without a decrease.
+    def __init__(self, max_rate=None, min_rate=1.0, decrease=0.7, increase=1.0, cooldown=1.0, recovery=30.0):
+        super().__init__(max_rate or min_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.cooldown = cooldown
+        self.recovery = recovery
+        self.limited = max_rate is not None
+        self.rate_before_decrease = self.rate
+        self.decreased_at = 0.0
+        self.throttled_at = 0.0
+        # Send times of the requests of the last second, to measure the rate Glue throttled.
+        self.sent_at = deque()
+        self.reset_metrics()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.first_request_at is None:
+                self.first_request_at = now
+            self.num_requests += 1
+            self.sent_at.append(now)
+            while self.sent_at[0] < now - 1:
+                self.sent_at.popleft()
+            if self.limited and self.max_rate is None and now - self.throttled_at >= self.recovery:
+                self.limited = False
+            limited = self.limited
+        return super().reserve() if limited else 0.0
+
+    def succeeded(self):
+        with self.lock:
+            # The rate only grows while requests are waiting for tokens, so an idle API does not build up a burst.
+            if not self.limited or self.tokens >= 1:
+                return
+            step = 1.0 if self.rate < self.rate_before_decrease else self.increase / self.rate
+            self.set_rate(min(self.rate + step, self.max_rate or float('inf')))
+
+    def throttled(self, decrease=True):
+        # Returns whether the rate was lowered. A throttled call with decrease=False is only counted.
+        with self.lock:
+            self.num_throttled += 1
+            if not decrease:
+                return False
+            now = time.monotonic()
+            self.throttled_at = now
+            if now - self.decreased_at < self.cooldown:
+                return False
+            self.decreased_at = now
+            if not self.limited:
+                self.limited = True
+                self.rate = max(len(self.sent_at), self.min_rate)
+                self.tokens = 0.0
+                self.updated_at = now
+            self.rate_before_decrease = self.rate
+            self.set_rate(max(self.rate * self.decrease, self.min_rate))
+            return True
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def reset_metrics(self):
+        self.first_request_at = None
+        self.num_requests = 0
+        self.num_throttled = 0
+
+    def get_metrics(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.first_request_at if self.first_request_at is not None else 0.0
+            return {
+                "requests": self.num_requests,
+                "throttled": self.num_throttled,
+                "achieved_rate": self.num_requests / elapsed if elapsed > 1 else float(self.num_requests),
+                "allowed_rate": self.rate if self.limited else None
+            }
@@ -0,0 +1,119 @@
+from botocore.exceptions import ClientError
+
+from util.adaptive_backoff import AdaptiveBackoff
+from util.logger import logger
+from util.stage_metrics import stage_metrics
+
+# Limits shared by SNS PublishBatch and SQS SendMessageBatch: 10 messages per call and 256 KB for the messages and
+# attributes of a call combined.
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_PAYLOAD_BYTES = 262144
+MAX_BATCH_RETRIES = 3
+
+class BatchSender:
+    # Buffers messages for one destination and sends them in batch calls. Entries that fail on the service side are
+    # retried on their own; entries rejected as sender faults are not. Every message is reported once in the list
+    # returned by flush as (context, MessageId), with MessageId None when the message could not be sent.
+    # Subclasses set the name of the message field of an entry, the error codes worth retrying and the names used
+    # for metrics and logs, and implement call_batch for their client.
+    body_field = "Message"
+    retryable_error_codes = ()
+    operation_name = ""
+    stage_name = ""
+    messages_metric = ""
+    bytes_metric = ""
+
+    def __init__(self, client, destination, max_retries=MAX_BATCH_RETRIES):
+        self.client = client
+        self.destination = destination
+        self.max_retries = max_retries
+        self.backoff = AdaptiveBackoff()
+        self.entries = []
+        self.entries_size = 0
+        self.results = []
+        self.number_of_calls = 0
+
+    def call_batch(self, entries):
+        raise NotImplementedError
+
+    def add(self, body, message_attributes, context=None):
+        entry = {self.body_field: body, "MessageAttributes": message_attributes}
+        entry_size = self.get_entry_size(entry)
+        if self.entries and (len(self.entries) == MAX_BATCH_ENTRIES or self.entries_size + entry_size > MAX_BATCH_PAYLOAD_BYTES):
+            self.send_batch()
+        self.entries.append((entry, context))
+        self.entries_size += entry_size
+
+    def flush(self):
+        if self.entries:
+            self.send_batch()
+        results = self.results
+        self.results = []
+        return results
+
+    def get_entry_size(self, entry):
+        size = len(entry[self.body_field].encode('utf-8'))
+        for name, attribute in entry["MessageAttributes"].items():
+            size += len(name.encode('utf-8')) + len(attribute["DataType"].encode('utf-8'))
+            size += len(attribute.get("StringValue", "").encode('utf-8'))
+        return size
+
+    def take_batch(self):
+        pending = {str(i): item for i, item in enumerate(self.entries)}
+        self.entries = []
+        self.entries_size = 0
+        return pending
+
+    def send_batch(self):
+        pending = self.take_batch()
+
+        for attempt in range(self.max_retries + 1):
+            self.backoff.wait()
+            try:
+                self.number_of_calls += 1
+                with stage_metrics.time_stage(self.stage_name):
+                    response = self.call_batch([dict(entry, Id=entry_id) for entry_id, (entry, context) in pending.items()])
+            except Exception as e:
+                if self.is_retryable(e, attempt, pending):
+                    continue
+                break
+
+            if self.handle_response(pending, response, attempt):
+                return
+
+        self.fail_pending(pending)
+
+    def is_retryable(self, e, attempt, pending):
+        # Decides whether a batch call that raised is sent again, and logs the error when it is not.
+        if isinstance(e, ClientError) and e.response['Error']['Code'] in self.retryable_error_codes and attempt < self.max_retries:
+            logger.warning("{} to {} was throttled. Retrying {} messages.", self.operation_name, self.destination,
+                           len(pending), sampled=True)
+            self.backoff.throttled()
+            return True
+        logger.error(f"Messages could not be sent with {self.operation_name} to {self.destination}. {e}")
+        return False
+
+    def handle_response(self, pending, response, attempt):
+        # Removes the entries sent or rejected for good from pending and returns whether none are left to retry.
+        for successful in response.get("Successful", []):
+            entry, context = pending.pop(successful["Id"])
+            self.results.append((context, successful["MessageId"]))
+            stage_metrics.add(self.messages_metric, 1)
+            stage_metrics.add(self.bytes_metric, self.get_entry_size(entry), "Bytes")
+
+        for failed in response.get("Failed", []):
+            if failed.get("SenderFault") or attempt == self.max_retries:
+                entry, context = pending.pop(failed["Id"])
+                logger.error("Message could not be sent with {} to {}. error: {} {}", self.operation_name, self.destination,
+                             failed.get('Code'), failed.get('Message', ''), sampled=True)
+                self.results.append((context, None))
+
+        if not pending:
+            self.backoff.succeeded()
+            return True
+        self.backoff.throttled()
+        return False
+
+    def fail_pending(self, pending):
+        for entry, context in pending.values():
+            self.results.append((context, None))
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from util.adaptive_rate_limiter import AdaptiveRateLimiter
+from util.logger import logger
+
+MIN_RATE = 1.0
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'Throttling', 'TooManyRequestsException')
+
+class GlueRateLimiter:
+    # One AdaptiveRateLimiter per Glue API, shared by every Glue client of the Lambda container. The limiter hooks
+    # into the client's events, so each attempt of each call (including botocore's own retries and paginator pages)
+    # takes a token before it is sent. A single ThrottlingException is left to the retries of the caller; the rate of
+    # an API is only lowered when a retried attempt is throttled again, so an API is not paced until Glue keeps
+    # throttling it, unless set_max_rate gave it a fixed limit. Clients without botocore retries (the partition batch
+    # clients, which back off themselves) therefore never lower the rate.
+    def __init__(self, min_rate=MIN_RATE):
+        self.min_rate = min_rate
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get_limiter(self, api_name):
+        limiter = self.limiters.get(api_name)
+        if limiter is None:
+            with self.lock:
+                limiter = self.limiters.setdefault(api_name, AdaptiveRateLimiter(min_rate=self.min_rate))
+        return limiter
+
+    def set_max_rate(self, api_name, max_rate):
+        # Limits api_name to max_rate requests per second; 0 removes the limit. Throttles still lower the rate below it.
+        with self.lock:
+            limiter = self.limiters.get(api_name)
+            if (limiter.max_rate if limiter else None) == (max_rate or None):
+                return
+            if max_rate > 0:
+                self.limiters[api_name] = AdaptiveRateLimiter(max_rate, min(self.min_rate, max_rate))
+            else:
+                self.limiters.pop(api_name, None)
+
+    def register(self, glue):
+        glue.meta.events.register('before-send.glue', self.before_send)
+        glue.meta.events.register('needs-retry.glue', self.after_attempt)
+
+    def before_send(self, event_name, **kwargs):
+        wait = self.get_limiter(event_name.split('.')[-1]).reserve()
+        if wait:
+            time.sleep(wait)
+
+    def after_attempt(self, event_name, response=None, attempts=1, **kwargs):
+        # Emitted after every attempt. Returns None so botocore's retry handler still decides whether to retry.
+        if response is None:
+            return None
+        api_name = event_name.split('.')[-1]
+        limiter = self.get_limiter(api_name)
+        http_response, parsed = response
+        if parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            if limiter.throttled(decrease=attempts > 1):
+                logger.warning("Glue {} was throttled. Request rate lowered to {:.1f} requests/s.", api_name, limiter.rate, sampled=True)
+        elif http_response.status_code < 400:
+            limiter.succeeded()
+        return None
+
+    def print_metrics(self, reset=True):
+        # Prints the requests sent to each Glue API since the last call, so warm invocations report their own rates.
+        for api_name, limiter in sorted(self.limiters.items()):
+            metrics = limiter.get_metrics()
+            if not metrics["requests"]:
+                continue
+            allowed_rate = f"{metrics['allowed_rate']:.1f} requests/s" if metrics['allowed_rate'] is not None else "unlimited"
+            logger.info(f"Glue {api_name}: {metrics['requests']} requests, {metrics['throttled']} throttled, "
+                        f"achieved {metrics['achieved_rate']:.1f} requests/s, allowed {allowed_rate}")
+            if reset:
+                with limiter.lock:
+                    limiter.reset_metrics()
+
+glue_rate_limiter = GlueRateLimiter()
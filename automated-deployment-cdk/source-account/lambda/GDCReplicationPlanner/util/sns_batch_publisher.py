@@ -0,0 +1,22 @@
+from util.batch_sender import BatchSender, MAX_BATCH_RETRIES
+
+RETRYABLE_PUBLISH_ERROR_CODES = ("Throttling", "ThrottlingException", "ThrottledException", "KMSThrottling",
+                                 "InternalError", "InternalFailure", "ServiceUnavailable")
+
+class SNSBatchPublisher(BatchSender):
+    # Buffers messages for one topic and publishes them with PublishBatch.
+    retryable_error_codes = RETRYABLE_PUBLISH_ERROR_CODES
+    operation_name = "PublishBatch"
+    stage_name = "Publish"
+    messages_metric = "MessagesPublished"
+    bytes_metric = "PublishedBytes"
+
+    def __init__(self, sns_client, topic_arn, max_retries=MAX_BATCH_RETRIES):
+        super().__init__(sns_client, topic_arn, max_retries)
+        self.topic_arn = topic_arn
+
+    def publish(self, message, message_attributes, context=None):
+        self.add(message, message_attributes, context)
+
+    def call_batch(self, entries):
+        return self.client.publish_batch(TopicArn=self.topic_arn, PublishBatchRequestEntries=entries)
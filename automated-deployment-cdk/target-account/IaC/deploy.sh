@@ -71,6 +71,7 @@ if ! aws cloudformation describe-stacks --profile $PROFILE --stack-name $STACK_N
   aws cloudformation create-stack \
     --stack-name $STACK_NAME \
     --template-body file://$DIRNAME/output/packaged-template.yaml \
+    --parameters ParameterKey=pSourceAccountId,ParameterValue=$SOURCE_ACCOUNT ParameterKey=pSourceRegion,ParameterValue=$SOURCE_REGION \
     --tags file://$DIRNAME/tags.json \
     --capabilities "CAPABILITY_NAMED_IAM" "CAPABILITY_AUTO_EXPAND" \
     --profile $PROFILE
@@ -86,6 +87,7 @@ else
     --profile $PROFILE \
     --stack-name $STACK_NAME \
     --template-body file://$DIRNAME/output/packaged-template.yaml \
+    --parameters ParameterKey=pSourceAccountId,ParameterValue=$SOURCE_ACCOUNT ParameterKey=pSourceRegion,ParameterValue=$SOURCE_REGION \
     --tags file://$DIRNAME/tags.json \
     --capabilities "CAPABILITY_NAMED_IAM" "CAPABILITY_AUTO_EXPAND" 2>&1)
   status=$?
@@ -109,12 +111,6 @@ else
   echo "Finished create/update successfully!"
 fi
 
-echo "Subscribing Lambda to Source SNS Schema Distribution topic..."
-aws lambda add-permission --function-name ImportLambda \
---source-arn arn:aws:sns:$SOURCE_REGION:$SOURCE_ACCOUNT:SchemaDistributionSNSTopic \
---statement-id sns-$SOURCE_ACCOUNT-account --action "lambda:InvokeFunction" \
---principal sns.amazonaws.com --profile ${PROFILE}
-
-aws sns subscribe --region $SOURCE_REGION --protocol lambda \
---topic-arn arn:aws:sns:$SOURCE_REGION:$SOURCE_ACCOUNT:SchemaDistributionSNSTopic \
---notification-endpoint arn:aws:lambda:$TARGET_REGION:$TARGET_ACCOUNT:function:ImportLambda --profile ${PROFILE}
+# ImportLambda receives the schema messages through ImportSchemaSQSQueue, which the stack subscribes to the source
+# SchemaDistributionSNSTopic. Subscriptions of the function itself made by earlier versions of this script should be removed.
+echo "ImportSchemaSQSQueue is subscribed to the Source SNS Schema Distribution topic by the stack."
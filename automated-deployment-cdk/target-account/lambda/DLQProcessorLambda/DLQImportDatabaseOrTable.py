@@ -2,20 +2,27 @@ import json
 import os
 from typing import Dict, List
 
-import boto3
-from botocore.config import Config
-
+from util.api_call_metrics import api_call_metrics
+from util.batch_processor import process_sqs_records
+from util.client_registry import get_client
+from util.ddb_status_writer import DDBStatusWriter
+from util.ddb_util import DDBUtil
 from util.gdc_util import GDCUtil
+from util.glue_rate_limiter import glue_rate_limiter
+from util.glue_util import PARTITION_BATCH_CLIENT_RETRIES
+from util.logger import logger
+from util.stage_metrics import stage_metrics
 from util.table_with_partitions import TableWithPartitions
 
 def print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_db_status_tracking,
-                        ddb_tbl_name_for_table_status_tracking, sqs_queue_url, region):
-    print(f"Target Catalog Id: {target_glue_catalog_id}")
-    print(f"Skip Table Archive: {skip_table_archive}")
-    print(f"DynamoDB Table for DB Import Auditing: {ddb_tbl_name_for_db_status_tracking}")
-    print(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
-    print(f"Dead Letter Queue URL: {sqs_queue_url}")
-    print(f"Region: {region}")
+                        ddb_tbl_name_for_table_status_tracking, sqs_queue_url, region, record_workers):
+    logger.info(f"Target Catalog Id: {target_glue_catalog_id}")
+    logger.info(f"Skip Table Archive: {skip_table_archive}")
+    logger.info(f"DynamoDB Table for DB Import Auditing: {ddb_tbl_name_for_db_status_tracking}")
+    logger.info(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
+    logger.info(f"Dead Letter Queue URL: {sqs_queue_url}")
+    logger.info(f"Region: {region}")
+    logger.info(f"Record Workers: {record_workers}")
 
 def lambda_handler(event, context):
     region = os.environ.get("region", "us-east-1")
@@ -24,17 +31,23 @@ def lambda_handler(event, context):
     ddb_tbl_name_for_db_status_tracking = os.environ.get("ddb_name_db_import_status", "ddb_name_db_import_status")
     ddb_tbl_name_for_table_status_tracking = os.environ.get("ddb_name_table_import_status", "ddb_name_table_import_status")
     sqs_queue_url = os.environ.get("dlq_url_sqs", "")
+    record_workers = int(os.environ.get("record_workers", "5"))
 
     print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_db_status_tracking,
-                        ddb_tbl_name_for_table_status_tracking, sqs_queue_url, region)
+                        ddb_tbl_name_for_table_status_tracking, sqs_queue_url, region, record_workers)
+
+    glue = get_client("glue", region_name=region, retries={"max_attempts": 10})
+    partition_glue = get_client("glue", region_name=region, retries=PARTITION_BATCH_CLIENT_RETRIES)
+    sqs = get_client("sqs", region_name=region, retries={"max_attempts": 10})
 
-    config = Config(retries={"max_attempts": 10})
-    glue = boto3.client("glue", region_name=region, config=config)
-    sqs = boto3.client("sqs", region_name=region, config=config)
+    logger.info(f"Number of messages in SQS Event: {len(event['Records'])}")
 
-    print(f"Number of messages in SQS Event: {len(event['Records'])}")
+    status_writer = DDBStatusWriter(get_client("dynamodb"))
+    ddb_util = DDBUtil(status_writer=status_writer)
 
-    for record in event["Records"]:
+    # A schema that cannot be imported is sent back to the dead letter queue by GDCUtil. A message is reported as a
+    # batch item failure when that fails too, when its partitions could not be replicated or when it raises.
+    def process_sqs_record(record):
         ddl = record["body"]
         export_batch_id = ""
         source_glue_catalog_id = ""
@@ -44,28 +57,36 @@ def lambda_handler(event, context):
         for key, value in record["messageAttributes"].items():
             if key.lower() == "exportbatchid":
                 export_batch_id = value["stringValue"]
-                print(f"Export Batch Id: {export_batch_id}")
+                logger.debug(f"Export Batch Id: {export_batch_id}")
             elif key.lower() == "sourcegluedatacatalogid":
                 source_glue_catalog_id = value["stringValue"]
-                print(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
+                logger.debug(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
             elif key.lower() == "schematype":
                 schema_type = value["stringValue"]
-                print(f"Message Schema Type {schema_type}")
+                logger.debug(f"Message Schema Type {schema_type}")
 
-        print(f"Schema: {ddl}")
+        logger.debug("Schema: {}", ddl)
 
         if schema_type.lower() == "table":
             is_table = True
 
-        process_record(context, glue, sqs, sqs_queue_url, target_glue_catalog_id, ddb_tbl_name_for_db_status_tracking,
-                       ddb_tbl_name_for_table_status_tracking, ddl, skip_table_archive, export_batch_id,
-                       source_glue_catalog_id, is_table)
+        return process_record(context, glue, partition_glue, sqs, sqs_queue_url, target_glue_catalog_id,
+                              ddb_tbl_name_for_db_status_tracking, ddb_tbl_name_for_table_status_tracking, ddl,
+                              skip_table_archive, export_batch_id, source_glue_catalog_id, is_table, ddb_util)
+
+    try:
+        batch_response = process_sqs_records(event["Records"], process_sqs_record, record_workers)
+    finally:
+        status_writer.flush()
 
-    return "Success"
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("DLQImportDatabaseOrTable")
+    return batch_response
 
-def process_record(context, glue, sqs, sqs_queue_url, target_glue_catalog_id, ddb_tbl_name_for_db_status_tracking,
-                   ddb_tbl_name_for_table_status_tracking, message, skip_table_archive, export_batch_id,
-                   source_glue_catalog_id, is_table):
+def process_record(context, glue, partition_glue, sqs, sqs_queue_url, target_glue_catalog_id,
+                   ddb_tbl_name_for_db_status_tracking, ddb_tbl_name_for_table_status_tracking, message, skip_table_archive,
+                   export_batch_id, source_glue_catalog_id, is_table, ddb_util=None):
     is_database_type = False
     is_table_type = False
 
@@ -78,22 +99,23 @@ def process_record(context, glue, sqs, sqs_queue_url, target_glue_catalog_id, dd
             table = TableWithPartitions(json.loads(message))
             is_table_type = True
         except json.JSONDecodeError as e:
-            print("Cannot parse SNS message to Glue Table Type.")
-            print(e)
+            logger.error("Cannot parse SNS message to Glue Table Type.")
+            logger.error(e)
     else:
         context.log("The input message is of type Glue Database.")
         try:
             db = json.loads(message)
             is_database_type = True
         except json.JSONDecodeError as e:
-            print("Cannot parse SNS message to Glue Database Type.")
-            print(e)
+            logger.error("Cannot parse SNS message to Glue Database Type.")
+            logger.error(e)
 
-    gdc_util = GDCUtil()
+    gdc_util = GDCUtil(ddb_util)
     if is_database_type:
-        gdc_util.process_database_schema(glue, sqs, target_glue_catalog_id, db, message, sqs_queue_url,
-                                         source_glue_catalog_id, export_batch_id, ddb_tbl_name_for_db_status_tracking)
+        return gdc_util.process_database_schema(glue, sqs, target_glue_catalog_id, db, message, sqs_queue_url,
+                                                source_glue_catalog_id, export_batch_id, ddb_tbl_name_for_db_status_tracking)
     elif is_table_type:
-        gdc_util.process_table_schema(glue, sqs, target_glue_catalog_id, source_glue_catalog_id, table, message,
-                                      ddb_tbl_name_for_table_status_tracking, sqs_queue_url, export_batch_id,
-                                      skip_table_archive)
+        return gdc_util.process_table_schema(glue, sqs, target_glue_catalog_id, source_glue_catalog_id, table, message,
+                                             ddb_tbl_name_for_table_status_tracking, sqs_queue_url, export_batch_id,
+                                             skip_table_archive, partition_glue)
+    return False
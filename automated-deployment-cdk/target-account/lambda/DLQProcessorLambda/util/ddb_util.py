@@ -1,12 +1,23 @@
-import boto3
-
+import json
+import time
+from boto3.dynamodb.types import TypeSerializer
 from botocore.exceptions import ClientError
 from typing import List, Optional
+from util.client_registry import get_client, get_resource
+from util.ddb_status_writer import DDBStatusWriter
+from util.logger import logger
+
+# Sort key of the item holding the fingerprint of the last successful export of a table in the table export status table.
+FINGERPRINT_EXPORT_RUN_ID = 0
+# Sort key of the item holding the progress of an unfinished large table export.
+EXPORT_CHECKPOINT_RUN_ID = 1
 
 class DDBUtil:
 
-    def __init__(self, region_name: str = "us-east-1"):
-        self.dynamodb = boto3.resource("dynamodb", region_name=region_name)
+    # With a status_writer, import statuses are buffered in it and written with BatchWriteItem when it is flushed.
+    def __init__(self, region_name: str = "us-east-1", status_writer: Optional[DDBStatusWriter] = None):
+        self.dynamodb = get_resource("dynamodb", region_name=region_name)
+        self.status_writer = status_writer
 
     def track_table_import_status(self, table_status, source_glue_catalog_id, target_glue_catalog_id,
                                   import_run_id, export_batch_id, ddb_tbl_name):
@@ -26,13 +37,18 @@ class DDBUtil:
             "partitions_updated": table_status.partitions_replicated
         }
 
+        if self.status_writer:
+            self.status_writer.put(ddb_tbl_name, self.serialize_item(item))
+            logger.debug("Table import status queued for DynamoDB table. Table name: {}", table_status.table_name)
+            return True
+
         try:
             table.put_item(Item=item)
-            print(f"Table item inserted to DynamoDB table. Table name: {table_status.table_name}")
+            logger.debug("Table item inserted to DynamoDB table. Table name: {}", table_status.table_name)
             return True
         except ClientError as e:
-            print(f"Could not insert a Table import status to DynamoDB table: {ddb_tbl_name}")
-            print(e)
+            logger.error(f"Could not insert a Table import status to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
             return False
 
     def track_database_import_status(self, source_glue_catalog_id, target_glue_catalog_id, ddb_tbl_name,
@@ -47,13 +63,18 @@ class DDBUtil:
             "is_created": is_created
         }
 
+        if self.status_writer:
+            self.status_writer.put(ddb_tbl_name, self.serialize_item(item))
+            logger.debug("Database import status queued for DynamoDB table. Database name: {}", database_name)
+            return True
+
         try:
             table.put_item(Item=item)
-            print(f"Database item inserted to DynamoDB table. Database name: {database_name}")
+            logger.debug("Database item inserted to DynamoDB table. Database name: {}", database_name)
             return True
         except ClientError as e:
-            print(f"Could not insert a Database import status to DynamoDB table: {ddb_tbl_name}")
-            print(e)
+            logger.error(f"Could not insert a Database import status to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
             return False
 
     def track_table_export_status(self, ddb_tbl_name, glue_db_name, glue_table_name, glue_table_schema,
@@ -77,11 +98,11 @@ class DDBUtil:
 
         try:
             table.put_item(Item=item)
-            print(f"Table item inserted to DynamoDB table. Table name: {glue_table_name}")
+            logger.debug("Table item inserted to DynamoDB table. Table name: {}", glue_table_name)
             return True
         except ClientError as e:
-            print(f"Could not insert a Table export status to DynamoDB table: {ddb_tbl_name}")
-            print(e)
+            logger.error(f"Could not insert a Table export status to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
             return False
 
     def track_database_export_status(self, ddb_tbl_name, glue_db_name, glue_db_schema, sns_msg_id,
@@ -99,26 +120,122 @@ class DDBUtil:
 
         try:
             table.put_item(Item=item)
-            print(f"Status inserted to DynamoDB table for Glue Database: {glue_db_name}")
+            logger.debug("Status inserted to DynamoDB table for Glue Database: {}", glue_db_name)
             return True
         except ClientError as e:
-            print(f"Could not insert a Database export status to DynamoDB table: {ddb_tbl_name}")
-            print(e)
+            logger.error(f"Could not insert a Database export status to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
             return False
 
-    def insert_into_dynamodb(self, item_list: List[dict], dynamodb_tbl_name: str):
-        print(f"Inserting {len(item_list)} items to DynamoDB using Batch API call.")
-        dynamodb = boto3.client("dynamodb")
-        batch_size = 25
-        for i in range(0, len(item_list), batch_size):
-            mini_batch = item_list[i:i + batch_size]
-            request_items = {dynamodb_tbl_name: [item for item in mini_batch]}
+    def track_table_export_fingerprint(self, ddb_tbl_name, glue_db_name, glue_table_name, fingerprint,
+                                       glue_catalog_id, export_run_id, export_duration_ms=None):
+        table = self.dynamodb.Table(ddb_tbl_name)
+        item = {
+            "table_id": f"{glue_table_name}|{glue_db_name}",
+            "export_run_id": FINGERPRINT_EXPORT_RUN_ID,
+            "last_export_run_id": int(export_run_id),
+            "source_glue_catalog_id": glue_catalog_id,
+            "fingerprint": fingerprint
+        }
+        if export_duration_ms is not None:
+            item["export_duration_ms"] = int(export_duration_ms)
+
+        try:
+            table.put_item(Item=item)
+            return True
+        except ClientError as e:
+            logger.error(f"Could not insert a Table export fingerprint to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
+            return False
+
+    def get_table_export_fingerprints(self, ddb_tbl_name, table_ids: List[str], max_age_hours=0) -> dict:
+        # A fingerprint is recorded when a table is published, not when the target account has imported it, so it
+        # is only returned for max_age_hours (0 for no limit). A table whose import failed is then published again
+        # at the latest once its fingerprint has expired.
+        export_history = self.get_table_export_history(ddb_tbl_name, table_ids)
+        oldest_export_run_id = int((time.time() - max_age_hours * 3600) * 1000) if max_age_hours > 0 else 0
+        return {table_id: history["fingerprint"] for table_id, history in export_history.items()
+                if history.get("last_export_run_id", 0) >= oldest_export_run_id}
+
+    def get_table_export_history(self, ddb_tbl_name, table_ids: List[str]) -> dict:
+        # Returns the fingerprint, the export run id and, when it was recorded, the export duration of the last
+        # successful export of each table, keyed by table_id.
+        export_history = {}
+        dynamodb = get_client("dynamodb")
+        batch_size = 100
+        for i in range(0, len(table_ids), batch_size):
+            keys = [{"table_id": {"S": table_id}, "export_run_id": {"N": str(FINGERPRINT_EXPORT_RUN_ID)}}
+                    for table_id in table_ids[i:i + batch_size]]
+            request_items = {ddb_tbl_name: {"Keys": keys, "ProjectionExpression": "table_id, fingerprint, last_export_run_id, export_duration_ms"}}
             try:
-                response = dynamodb.batch_write_item(RequestItems=request_items)
-                unprocessed_items = response.get("UnprocessedItems", {})
-                while unprocessed_items:
-                    response = dynamodb.batch_write_item(RequestItems=unprocessed_items)
-                    unprocessed_items = response.get("UnprocessedItems", {})
+                while request_items:
+                    response = dynamodb.batch_get_item(RequestItems=request_items)
+                    for item in response.get("Responses", {}).get(ddb_tbl_name, []):
+                        history = {"fingerprint": item["fingerprint"]["S"]}
+                        if "last_export_run_id" in item:
+                            history["last_export_run_id"] = int(item["last_export_run_id"]["N"])
+                        if "export_duration_ms" in item:
+                            history["export_duration_ms"] = int(item["export_duration_ms"]["N"])
+                        export_history[item["table_id"]["S"]] = history
+                    request_items = response.get("UnprocessedKeys", {})
             except ClientError as e:
-                print(f"Error inserting items to DynamoDB table: {dynamodb_tbl_name}")
-                print(e)
+                logger.error(f"Could not read Table export fingerprints from DynamoDB table: {ddb_tbl_name}")
+                logger.error(e)
+        return export_history
+
+    def get_table_export_checkpoint(self, ddb_tbl_name, glue_db_name, glue_table_name) -> Optional[dict]:
+        dynamodb = get_client("dynamodb")
+        try:
+            response = dynamodb.get_item(
+                TableName=ddb_tbl_name,
+                Key={"table_id": {"S": f"{glue_table_name}|{glue_db_name}"}, "export_run_id": {"N": str(EXPORT_CHECKPOINT_RUN_ID)}},
+                ConsistentRead=True
+            )
+        except ClientError as e:
+            logger.error(f"Could not read Table export checkpoint from DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
+            return None
+        if "Item" not in response:
+            return None
+        return json.loads(response["Item"]["checkpoint"]["S"])
+
+    def track_table_export_checkpoint(self, ddb_tbl_name, glue_db_name, glue_table_name, checkpoint: dict):
+        # Uses the low-level client, which unlike the resource may be called from the export worker threads.
+        dynamodb = get_client("dynamodb")
+        try:
+            dynamodb.put_item(
+                TableName=ddb_tbl_name,
+                Item={
+                    "table_id": {"S": f"{glue_table_name}|{glue_db_name}"},
+                    "export_run_id": {"N": str(EXPORT_CHECKPOINT_RUN_ID)},
+                    "checkpoint": {"S": json.dumps(checkpoint)}
+                }
+            )
+            return True
+        except ClientError as e:
+            logger.error(f"Could not insert a Table export checkpoint to DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
+            return False
+
+    def delete_table_export_checkpoint(self, ddb_tbl_name, glue_db_name, glue_table_name):
+        dynamodb = get_client("dynamodb")
+        try:
+            dynamodb.delete_item(
+                TableName=ddb_tbl_name,
+                Key={"table_id": {"S": f"{glue_table_name}|{glue_db_name}"}, "export_run_id": {"N": str(EXPORT_CHECKPOINT_RUN_ID)}}
+            )
+        except ClientError as e:
+            logger.error(f"Could not delete Table export checkpoint from DynamoDB table: {ddb_tbl_name}")
+            logger.error(e)
+
+    @staticmethod
+    def serialize_item(item: dict) -> dict:
+        serializer = TypeSerializer()
+        return {key: serializer.serialize(value) for key, value in item.items()}
+
+    def insert_into_dynamodb(self, item_list: List[dict], dynamodb_tbl_name: str):
+        logger.debug("Inserting {} items to DynamoDB using Batch API call.", len(item_list))
+        status_writer = DDBStatusWriter(get_client("dynamodb"))
+        for write_request in item_list:
+            status_writer.put(dynamodb_tbl_name, write_request["PutRequest"]["Item"])
+        status_writer.flush()
@@ -1,14 +1,21 @@
-import boto3
 import json
 import os
 
-from botocore.config import Config
 from botocore.exceptions import ClientError
 from typing import List, Dict
 
+from util.api_call_metrics import api_call_metrics
+from util.batch_processor import process_sqs_records
+from util.client_registry import get_client
+from util.ddb_status_writer import DDBStatusWriter
+from util.ddb_util import DDBUtil
 from util.gdc_util import GDCUtil
+from util.glue_rate_limiter import glue_rate_limiter
+from util.glue_util import PARTITION_BATCH_CLIENT_RETRIES
 from util.large_table import LargeTable
+from util.logger import logger
 from util.sqs_util import SQSUtil
+from util.stage_metrics import stage_metrics
 from util.table_with_partitions import TableWithPartitions
 
 
@@ -19,81 +26,113 @@ ddb_tbl_name_for_db_status_tracking = os.environ.get("ddb_name_db_import_status"
 ddb_tbl_name_for_table_status_tracking = os.environ.get("ddb_name_table_import_status", "ddb_name_table_import_status")
 sqs_queue_url = os.environ.get("dlq_url_sqs", "")
 sqs_queue_url_large_table = os.environ.get("sqs_queue_url_large_tables", "")
+record_workers = int(os.environ.get("record_workers", "10"))
 
-config = Config(retries={"max_attempts": 10})
-glue = boto3.client("glue", region_name=region, config = config)
-sqs = boto3.client("sqs", region_name=region, config = config)
+glue = get_client("glue", region_name=region, retries={"max_attempts": 10})
+partition_glue = get_client("glue", region_name=region, retries=PARTITION_BATCH_CLIENT_RETRIES)
+sqs = get_client("sqs", region_name=region, retries={"max_attempts": 10})
 
 def print_env_variables():
-    print(f"Target Catalog Id: {target_glue_catalog_id}")
-    print(f"Skip Table Archive: {skip_table_archive}")
-    print(f"DynamoDB Table for DB Import Auditing: {ddb_tbl_name_for_db_status_tracking}")
-    print(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
-    print(f"Dead Letter Queue URL: {sqs_queue_url}")
-    print(f"Region: {region}")
-    print(f"SQS Queue URL for Large Tables: {sqs_queue_url_large_table}")
+    logger.info(f"Target Catalog Id: {target_glue_catalog_id}")
+    logger.info(f"Skip Table Archive: {skip_table_archive}")
+    logger.info(f"DynamoDB Table for DB Import Auditing: {ddb_tbl_name_for_db_status_tracking}")
+    logger.info(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
+    logger.info(f"Dead Letter Queue URL: {sqs_queue_url}")
+    logger.info(f"Region: {region}")
+    logger.info(f"SQS Queue URL for Large Tables: {sqs_queue_url_large_table}")
+    logger.info(f"Record Workers: {record_workers}")
 
-def process_sns_event(sns_records: List[Dict]):
+def process_sns_event(sns_records: List[Dict], ddb_util: DDBUtil):
+    # Invoked by a direct subscription to the topic, where there is no queue to deliver a failed message again.
+    for sns_record in sns_records:
+        if not process_sns_record(sns_record, ddb_util):
+            logger.error(f"SNS message '{sns_record['Sns'].get('MessageId', '')}' could not be imported.")
+
+def process_sns_record(sns_record: Dict, ddb_util: DDBUtil) -> bool:
+    # Returns whether the message was imported or handed on to the large table or dead letter queue. A message that
+    # cannot be parsed or is of an unknown type is reported as failed, so it ends up in the queue's dead letter queue.
     sqs_util = SQSUtil()
 
-    for sns_record in sns_records:
-        is_database_type = False
-        is_table_type = False
-        is_large_table = False
-        large_table = None
-        db = None
-        table = None
+    is_database_type = False
+    is_table_type = False
+    is_large_table = False
+    large_table = None
+    db = None
+    table = None
 
-        message = sns_record["Sns"]["Message"]
-        print(f"SNS Message Payload: {message}")
+    message = sns_record["Sns"]["Message"]
+    logger.debug("SNS Message Payload: {}", message)
 
-        msg_attribute_map = sns_record["Sns"]["MessageAttributes"]
-        msg_type_attr = msg_attribute_map["message_type"]["Value"]
-        source_catalog_id_attr = msg_attribute_map["source_catalog_id"]["Value"]
-        export_batch_id_attr = msg_attribute_map["export_batch_id"]["Value"]
-        source_glue_catalog_id = source_catalog_id_attr
-        export_batch_id = export_batch_id_attr
-        print(f"Message Type: {msg_type_attr}")
-        print(f"Source Catalog Id: {source_glue_catalog_id}")
+    msg_attribute_map = sns_record["Sns"]["MessageAttributes"]
+    msg_type_attr = msg_attribute_map["message_type"]["Value"]
+    source_catalog_id_attr = msg_attribute_map["source_catalog_id"]["Value"]
+    export_batch_id_attr = msg_attribute_map["export_batch_id"]["Value"]
+    source_glue_catalog_id = source_catalog_id_attr
+    export_batch_id = export_batch_id_attr
+    logger.debug(f"Message Type: {msg_type_attr}")
+    logger.info(f"Source Catalog Id: {source_glue_catalog_id}")
 
-        try:
-            if msg_type_attr.lower() == "database":
-                db = json.loads(message)
-                is_database_type = True
-            elif msg_type_attr.lower() == "table":
-                msg = json.loads(message)
-                table = TableWithPartitions(msg)
-                is_table_type = True
-            elif msg_type_attr.lower() == "largetable":
-                msg = json.loads(message)
-                large_table = LargeTable()
-                large_table.catalog_id = msg.get("catalog_id", "")
-                large_table.large_table = msg.get("large_table", False)
-                large_table.number_of_partitions = msg.get("number_of_partitions", 0)
-                large_table.table = msg.get("table", "")
-                large_table.s3_object_key = msg.get("s3_object_key", "")
-                large_table.s3_bucket_name = msg.get("s3_bucket_name", "")
-                is_large_table = True
-        except json.JSONDecodeError as e:
-            print("Cannot parse SNS message to Glue Database Type.")
-            print(e)
+    try:
+        if msg_type_attr.lower() == "database":
+            db = json.loads(message)
+            is_database_type = True
+        elif msg_type_attr.lower() == "table":
+            msg = json.loads(message)
+            table = TableWithPartitions(msg)
+            is_table_type = True
+        elif msg_type_attr.lower() == "largetable":
+            msg = json.loads(message)
+            large_table = LargeTable()
+            large_table.catalog_id = msg.get("catalog_id", "")
+            large_table.large_table = msg.get("large_table", False)
+            large_table.number_of_partitions = msg.get("number_of_partitions", 0)
+            large_table.table = msg.get("table", "")
+            large_table.s3_object_key = msg.get("s3_object_key", "")
+            large_table.s3_bucket_name = msg.get("s3_bucket_name", "")
+            is_large_table = True
+        else:
+            logger.error(f"Unknown message type: {msg_type_attr}")
+    except json.JSONDecodeError as e:
+        logger.error("Cannot parse SNS message to Glue Database Type.")
+        logger.error(e)
 
-        gdc_util = GDCUtil()
-        
-        if is_database_type:
-            gdc_util.process_database_schema(glue, sqs, target_glue_catalog_id, db, message,
+    gdc_util = GDCUtil(ddb_util)
+    
+    if is_database_type:
+        return gdc_util.process_database_schema(glue, sqs, target_glue_catalog_id, db, message,
                                                 sqs_queue_url, source_glue_catalog_id, export_batch_id,
                                                 ddb_tbl_name_for_db_status_tracking)
-        elif is_table_type:
-            gdc_util.process_table_schema(glue, sqs, target_glue_catalog_id, source_glue_catalog_id,
-                                            table, message, ddb_tbl_name_for_table_status_tracking,
-                                            sqs_queue_url, export_batch_id, skip_table_archive)
-        elif is_large_table:
-            sqs_util.send_large_table_schema_to_sqs(sqs, sqs_queue_url_large_table, export_batch_id,
-                                                    source_glue_catalog_id, message, large_table)
+    elif is_table_type:
+        return gdc_util.process_table_schema(glue, sqs, target_glue_catalog_id, source_glue_catalog_id,
+                                             table, message, ddb_tbl_name_for_table_status_tracking,
+                                             sqs_queue_url, export_batch_id, skip_table_archive, partition_glue)
+    elif is_large_table:
+        return sqs_util.send_large_table_schema_to_sqs(sqs, sqs_queue_url_large_table, export_batch_id,
+                                                       source_glue_catalog_id, message, large_table)
+    return False
+
+def get_sns_record_from_sqs(record: Dict) -> Dict:
+    # A queue subscribed to the topic without raw message delivery receives the SNS notification as the message body.
+    notification = json.loads(record["body"])
+    return {"Sns": {"Message": notification["Message"], "MessageAttributes": notification.get("MessageAttributes", {})}}
 
 def lambda_handler(event, context):
     print_env_variables()
-    sns_records = event["Records"]
-    process_sns_event(sns_records)
-    return "Success"
+    records = event["Records"]
+    status_writer = DDBStatusWriter(get_client("dynamodb"))
+    ddb_util = DDBUtil(status_writer=status_writer)
+    try:
+        if records and records[0].get("eventSource") == "aws:sqs":
+            # Delivered through an SQS queue: the notifications of the batch are imported concurrently and only
+            # the failed ones are retried.
+            response = process_sqs_records(records, lambda record: process_sns_record(get_sns_record_from_sqs(record), ddb_util),
+                                           record_workers)
+        else:
+            process_sns_event(records, ddb_util)
+            response = "Success"
+    finally:
+        status_writer.flush()
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("ImportDatabaseOrTable")
+    return response
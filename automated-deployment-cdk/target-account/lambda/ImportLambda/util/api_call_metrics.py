@@ -0,0 +1,148 @@
+import threading
+import time
+from urllib.parse import urlencode
+
+from util.logger import logger
+
+# Upper bounds of the latency histogram buckets, in milliseconds. Slower calls fall in a last, unbounded bucket.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class OperationMetrics:
+    # Counters of one API operation (e.g. glue.GetPartitions). A call is counted once however many attempts it took;
+    # retries counts the attempts after the first one and bytes are counted for every attempt.
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, latency_ms, error, retries, bytes_sent, bytes_received):
+        self.calls += 1
+        self.errors += error
+        self.retries += retries
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and latency_ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.latency_buckets[bucket] += 1
+
+    def get_latency_percentile(self, q):
+        # Upper bound of the bucket holding the q-th percentile call, or the maximum latency for the last bucket.
+        rank = max(int(self.calls * q / 100 + 0.5), 1)
+        seen = 0
+        for bucket, count in enumerate(self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else self.max_latency_ms
+        return self.max_latency_ms
+
+    def get_metrics(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "average_latency_ms": self.total_latency_ms / self.calls if self.calls else 0.0,
+            "p50_latency_ms": self.get_latency_percentile(50),
+            "p99_latency_ms": self.get_latency_percentile(99),
+            "max_latency_ms": self.max_latency_ms,
+            "latency_histogram": {
+                f"<={bound}ms" if bucket < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}ms": count
+                for bucket, (bound, count) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.latency_buckets))
+                if count
+            }
+        }
+
+class ApiCallMetrics:
+    # Per-operation accounting of every AWS API call made by the Lambda container. The handlers hook into the
+    # before-call and after-call events of each client, so calls made by paginators, waiters and worker threads are
+    # all counted, and print_metrics reports the calls of the current invocation before it returns.
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def register(self, client):
+        # before_call is registered first for the service, so the clock starts before any other handler of the call
+        # runs.
+        service_id = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register_first(f'before-call.{service_id}', self.before_call)
+        client.meta.events.register(f'after-call.{service_id}', self.after_call)
+        client.meta.events.register(f'after-call-error.{service_id}', self.after_call_error)
+
+    def before_call(self, params, context, **kwargs):
+        context['api_call_started_at'] = time.perf_counter()
+        context['api_call_request_size'] = self.get_request_size(params)
+        return None
+
+    def after_call(self, event_name, http_response, parsed, model, context, **kwargs):
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        self.record(event_name, context, http_response.status_code >= 300, retries,
+                    self.get_response_size(http_response, model))
+
+    def after_call_error(self, event_name, context, **kwargs):
+        # The call failed without a response, e.g. on a connection error that outlasted botocore's retries.
+        self.record(event_name, context, True, 0, 0)
+
+    def record(self, event_name, context, error, retries, bytes_received):
+        started_at = context.get('api_call_started_at')
+        latency_ms = (time.perf_counter() - started_at) * 1000 if started_at is not None else 0.0
+        bytes_sent = context.get('api_call_request_size', 0) * (retries + 1)
+        api_name = event_name.split('.', 1)[1]
+        with self.lock:
+            operation = self.operations.get(api_name)
+            if operation is None:
+                operation = self.operations[api_name] = OperationMetrics()
+            operation.record(latency_ms, error, retries, bytes_sent, bytes_received)
+
+    @staticmethod
+    def get_request_size(params):
+        body = params.get('body')
+        if isinstance(body, (bytes, bytearray, str)):
+            return len(body)
+        # Query protocol APIs (SNS) get their parameters form-encoded when the request is sent.
+        if isinstance(body, dict):
+            return len(urlencode(body))
+        # Streamed bodies, e.g. S3 uploads from a file, are only known by their length header.
+        return int(params.get('headers', {}).get('Content-Length', 0))
+
+    @staticmethod
+    def get_response_size(http_response, model):
+        content_length = http_response.headers.get('content-length')
+        if content_length is not None:
+            return int(content_length)
+        # Without a length header, use the body botocore has already read to parse the response. A streamed body
+        # (S3 GetObject) has not been read yet and is not counted, as reading it here would consume it.
+        if model.has_streaming_output:
+            return 0
+        return len(getattr(http_response, '_content', None) or b'')
+
+    def get_metrics(self, reset=True):
+        with self.lock:
+            metrics = {api_name: operation.get_metrics() for api_name, operation in sorted(self.operations.items())}
+            if reset:
+                self.operations = {}
+        return metrics
+
+    def print_metrics(self, reset=True):
+        # Prints the calls made since the last call, so warm invocations report their own calls.
+        metrics = self.get_metrics(reset)
+        if not metrics:
+            return
+        logger.info(f"API calls: {sum(m['calls'] for m in metrics.values())}, errors: {sum(m['errors'] for m in metrics.values())}, "
+                    f"retries: {sum(m['retries'] for m in metrics.values())}")
+        for api_name, m in metrics.items():
+            histogram = ", ".join(f"{bucket}: {count}" for bucket, count in m["latency_histogram"].items())
+            logger.info(f"{api_name}: {m['calls']} calls, {m['errors']} errors, {m['retries']} retries, "
+                        f"{m['bytes_sent']} bytes sent, {m['bytes_received']} bytes received, "
+                        f"latency avg {m['average_latency_ms']:.1f} ms, p50 {m['p50_latency_ms']:.0f} ms, "
+                        f"p99 {m['p99_latency_ms']:.0f} ms, max {m['max_latency_ms']:.1f} ms ({histogram})")
+
+api_call_metrics = ApiCallMetrics()
@@ -2,15 +2,24 @@ import json
 import time
 
 from util.ddb_util import DDBUtil
+from util.logger import logger
 from util.sqs_util import SQSUtil
 from util.glue_util import GlueUtil
+from util.stage_metrics import stage_metrics
 
 class GDCUtil:
-    
+
+    # ddb_util is shared by the records of an event so their statuses can be written together.
+    def __init__(self, ddb_util=None):
+        self.ddb_util = ddb_util or DDBUtil()
+
     def process_table_schema(self, glue, sqs, target_glue_catalog_id, source_glue_catalog_id,
                              table_with_partitions, message, ddb_tbl_name_for_table_status_tracking,
-                             sqs_queue_url, export_batch_id, skip_table_archive):
-        ddb_util = DDBUtil()
+                             sqs_queue_url, export_batch_id, skip_table_archive, partition_glue=None):
+        # partition_glue is the Glue client for the partition batches, created with PARTITION_BATCH_CLIENT_RETRIES.
+        # Returns whether the message is done with: the table and its partitions were replicated, or the table could
+        # not be created and was handed to the dead letter queue. False lets the message be delivered again.
+        ddb_util = self.ddb_util
         sqs_util = SQSUtil()
         glue_util = GlueUtil()
         import_run_id = int(time.time() * 1000)
@@ -21,7 +30,7 @@ class GDCUtil:
         table_status = glue_util.create_or_update_table(glue, table, target_glue_catalog_id, skip_table_archive)
 
         if table_status.db_not_found_error:
-            print(f"Creating Database with name: '{table['DatabaseName']}'.")
+            logger.debug("Creating Database with name: '{}'.", table['DatabaseName'])
             db_status = glue_util.create_glue_databases(glue, target_glue_catalog_id, table["DatabaseName"],
                                                        f"Database Imported from Glue Data Catalog of AWS Account Id: {source_glue_catalog_id}")
             if db_status.created:
@@ -31,50 +40,38 @@ class GDCUtil:
 
         if not table_status.error:
             partitions_b4_replication = glue_util.get_partitions(glue, target_glue_catalog_id, table["DatabaseName"], table["Name"])
-            print(f"Number of partitions before replication: {len(partitions_b4_replication)}")
-
-            if len(partition_list_from_export) > 0:
-                table_status.export_has_partitions = True
-                if len(partitions_b4_replication) == 0:
-                    print("Adding partitions based on the export.")
-                    partitions_added = glue_util.add_partitions(glue, partition_list_from_export, target_glue_catalog_id,
-                                                                table["DatabaseName"], table["Name"])
-                    if partitions_added:
-                        table_status.partitions_replicated = True
-                else:
-                    print("Table has partitions. They will be deleted first before adding partitions based on Export.")
-                    partitions_deleted = glue_util.delete_partitions(glue, target_glue_catalog_id, table["DatabaseName"],
-                                                                     table["Name"], partitions_b4_replication)
-                    partitions_added = glue_util.add_partitions(glue, partition_list_from_export, target_glue_catalog_id,
-                                                                table["DatabaseName"], table["Name"])
 
-                    if partitions_deleted and partitions_added:
-                        table_status.partitions_replicated = True
-            elif len(partition_list_from_export) == 0:
-                table_status.export_has_partitions = False
-                if len(partitions_b4_replication) > 0:
-                    partitions_deleted = glue_util.delete_partitions(glue, target_glue_catalog_id, table["DatabaseName"],
-                                                                     table["Name"], partitions_b4_replication)
-                    if partitions_deleted:
-                        table_status.partitions_replicated = True
+            table_status.export_has_partitions = len(partition_list_from_export) > 0
+            partition_diff = glue_util.get_partition_diff(partition_list_from_export, partitions_b4_replication)
+            partitions_replicated = glue_util.apply_partition_diff(partition_glue or glue, partition_diff,
+                                                                   target_glue_catalog_id, table["DatabaseName"], table["Name"])
+            if partitions_replicated:
+                table_status.partitions_replicated = True
+            schema_processed = partitions_replicated
         else:
-            print("Error in creating/updating table in the Glue Data Catalog. It will be sent to DLQ.")
-            sqs_util.send_table_schema_to_dead_letter_queue(sqs, sqs_queue_url, table_status, export_batch_id, source_glue_catalog_id)
+            logger.error("Error in creating/updating table in the Glue Data Catalog. It will be sent to DLQ.")
+            schema_processed = sqs_util.send_table_schema_to_dead_letter_queue(sqs, sqs_queue_url, table_status, export_batch_id,
+                                                                               source_glue_catalog_id)
 
+        stage_metrics.add("TablesImported", int(bool(table_status.replicated)))
+        stage_metrics.add("PartitionsInExport", len(partition_list_from_export))
         ddb_util.track_table_import_status(table_status, source_glue_catalog_id, target_glue_catalog_id, import_run_id,
                                            export_batch_id, ddb_tbl_name_for_table_status_tracking)
-        print(f"Processing of Table schema completed. Result: Table replicated: {table_status.replicated}, "
-              f"Export has partitions: {table_status.export_has_partitions}, "
-              f"Partitions replicated: {table_status.partitions_replicated}, Error: {table_status.error}")
+        logger.info(f"Processing of Table schema completed. Result: Table replicated: {table_status.replicated}, "
+                    f"Export has partitions: {table_status.export_has_partitions}, "
+                    f"Partitions replicated: {table_status.partitions_replicated}, Error: {table_status.error}")
+        return schema_processed
 
     def process_database_schema(self, glue, sqs, target_glue_catalog_id, db,
                                 message, sqs_queue_url, source_glue_catalog_id, export_batch_id,
                                 ddb_tbl_name_for_db_status_tracking):
-        ddb_util = DDBUtil()
+        # Returns whether the database exists or was created, or was handed to the dead letter queue.
+        ddb_util = self.ddb_util
         glue_util = GlueUtil()
         sqs_util = SQSUtil()
 
         is_db_created = False
+        schema_processed = True
         import_run_id = int(time.time() * 1000)
         database = glue_util.get_database_if_exist(glue, target_glue_catalog_id, db)
         db_exist = bool(database)
@@ -82,23 +79,16 @@ class GDCUtil:
         if not db_exist:
             db_status = glue_util.create_glue_database(glue, target_glue_catalog_id, db)
             if db_status.error:
-                print("Error in creating database in the Glue Data Catalog. It will be sent to DLQ.")
-                sqs_util.send_database_schema_to_dead_letter_queue(sqs, sqs_queue_url, message, db["Name"], export_batch_id,
-                                                                   source_glue_catalog_id)
+                logger.error("Error in creating database in the Glue Data Catalog. It will be sent to DLQ.")
+                schema_processed = sqs_util.send_database_schema_to_dead_letter_queue(sqs, sqs_queue_url, message, db["Name"],
+                                                                                      export_batch_id, source_glue_catalog_id)
             else:
                 is_db_created = True
         else:
-            print(f"Database with name '{database['Name']}' already exists in target Glue Data Catalog. No action will be taken.")
+            logger.warning(f"Database with name '{database['Name']}' already exists in target Glue Data Catalog. No action will be taken.")
 
+        stage_metrics.add("DatabasesImported", int(is_db_created))
         ddb_util.track_database_import_status(source_glue_catalog_id, target_glue_catalog_id, ddb_tbl_name_for_db_status_tracking,
                                               db["Name"], import_run_id, export_batch_id, is_db_created)
-        print(f"Processing of Database schema completed. Result: DB already exists: {db_exist}, DB created: {is_db_created}.")
-
-
-
-
-
-
-
-
-
+        logger.info(f"Processing of Database schema completed. Result: DB already exists: {db_exist}, DB created: {is_db_created}.")
+        return schema_processed
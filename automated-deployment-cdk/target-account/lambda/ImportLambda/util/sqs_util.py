@@ -2,6 +2,7 @@ import json
 from typing import Dict, Any
  
 import boto3
+from util.logger import logger
 
 class SQSUtil:
 
@@ -12,20 +13,7 @@ class SQSUtil:
 
         status_code = 400
         message_sent_to_sqs = False
-        message_attributes = {
-            "ExportBatchId": {
-                "DataType": "String.ExportBatchId",
-                "StringValue": export_batch_id
-            },
-            "SourceGlueDataCatalogId": {
-                "DataType": "String.SourceGlueDataCatalogId",
-                "StringValue": source_glue_catalog_id
-            },
-            "SchemaType": {
-                "DataType": "String.SchemaType",
-                "StringValue": "largeTable"
-            }
-        }
+        message_attributes = self.get_large_table_message_attributes(export_batch_id, source_glue_catalog_id)
 
         req = {
             "QueueUrl": queue_url,
@@ -37,19 +25,17 @@ class SQSUtil:
             send_msg_res = sqs.send_message(**req)
             status_code = send_msg_res["ResponseMetadata"]["HTTPStatusCode"]
         except Exception as e:
-            print(f"Exception thrown while writing message to SQS. {e}")
+            logger.error(f"Exception thrown while writing message to SQS. {e}")
 
         if status_code == 200:
             message_sent_to_sqs = True
-            print(f"Table details for table '{large_table['Table']['Name']}' of database '{large_table['Table']['DatabaseName']}' sent to SQS.")
+            logger.debug("Table details for table '{}' of database '{}' sent to SQS.",
+                         large_table['Table']['Name'], large_table['Table']['DatabaseName'])
 
         return message_sent_to_sqs
 
-    def send_large_table_schema_to_sqs(self, sqs: boto3.client, queue_url: str, export_batch_id: str,
-                                       source_glue_catalog_id: str, message: str, large_table: Dict[str, Any]) -> None:
-
-        status_code = 400
-        message_attributes = {
+    def get_large_table_message_attributes(self, export_batch_id: str, source_glue_catalog_id: str) -> Dict[str, Any]:
+        return {
             "ExportBatchId": {
                 "DataType": "String.ExportBatchId",
                 "StringValue": export_batch_id
@@ -64,6 +50,12 @@ class SQSUtil:
             }
         }
 
+    def send_large_table_schema_to_sqs(self, sqs: boto3.client, queue_url: str, export_batch_id: str,
+                                       source_glue_catalog_id: str, message: str, large_table: Dict[str, Any]) -> bool:
+
+        status_code = 400
+        message_attributes = self.get_large_table_message_attributes(export_batch_id, source_glue_catalog_id)
+
         req = {
             "QueueUrl": queue_url,
             "MessageBody": message,
@@ -74,16 +66,20 @@ class SQSUtil:
             send_msg_res = sqs.send_message(**req)
             status_code = send_msg_res["ResponseMetadata"]["HTTPStatusCode"]
         except Exception as e:
-            print(f"Exception thrown while writing message to SQS. {e}")
+            logger.error(f"Exception thrown while writing message to SQS. {e}")
 
         if status_code == 200:
             try:
-                print(f"Large Table schema for table '{large_table['Table']['Name']}' of database '{large_table['Table']['DatabaseName']}' sent to SQS.")
+                logger.debug("Large Table schema for table '{}' of database '{}' sent to SQS.",
+                             large_table['Table']['Name'], large_table['Table']['DatabaseName'])
             except Exception as e:
-                print(f"Large Table schema for table '{large_table.table['Name']}' of database '{large_table.table['DatabaseName']}' sent to SQS.")
+                logger.debug("Large Table schema for table '{}' of database '{}' sent to SQS.",
+                             large_table.table['Name'], large_table.table['DatabaseName'])
+
+        return status_code == 200
 
     def send_table_schema_to_dead_letter_queue(self, sqs: boto3.client, queue_url: str, table_status,
-                                               export_batch_id: str, source_glue_catalog_id: str) -> None:
+                                               export_batch_id: str, source_glue_catalog_id: str) -> bool:
 
         status_code = 400
         message_attributes = {
@@ -111,14 +107,17 @@ class SQSUtil:
             send_msg_res = sqs.send_message(**req)
             status_code = send_msg_res["ResponseMetadata"]["HTTPStatusCode"]
         except Exception as e:
-            print(f"Exception thrown while writing message to SQS. {e}")
+            logger.error(f"Exception thrown while writing message to SQS. {e}")
 
         if status_code == 200:
-            print(f"Table schema for table '{table_status.table_name}' of database '{table_status.db_name}' sent to SQS.")
+            logger.debug("Table schema for table '{}' of database '{}' sent to SQS.",
+                         table_status.table_name, table_status.db_name)
+
+        return status_code == 200
 
     def send_database_schema_to_dead_letter_queue(self, sqs: boto3.client, queue_url: str, database_ddl: str,
                                                   database_name: str, export_batch_id: str,
-                                                  source_glue_catalog_id: str) -> None:
+                                                  source_glue_catalog_id: str) -> bool:
 
         status_code = 400
         message_attributes = {
@@ -146,7 +145,9 @@ class SQSUtil:
             send_msg_res = sqs.send_message(**req)
             status_code = send_msg_res["ResponseMetadata"]["HTTPStatusCode"]
         except Exception as e:
-            print(f"Exception thrown while writing message to SQS. {e}")
+            logger.error(f"Exception thrown while writing message to SQS. {e}")
 
         if status_code == 200:
-            print(f"Database schema for database '{database_name}' sent to SQS.")
+            logger.debug("Database schema for database '{}' sent to SQS.", database_name)
+
+        return status_code == 200
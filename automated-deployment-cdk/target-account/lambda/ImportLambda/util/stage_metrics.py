@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# CloudWatch namespace of the metrics. Every function reports under the same namespace with its name as dimension,
+# so one dashboard can show the whole pipeline.
+DEFAULT_NAMESPACE = "GlueDataCatalogReplication"
+# CloudWatch accepts at most 100 metrics in one Embedded Metric Format document.
+MAX_METRICS_PER_DOCUMENT = 100
+
+class StageMetrics:
+    # Metrics of the current invocation, printed at its end as one CloudWatch Embedded Metric Format (EMF) document.
+    # CloudWatch Logs turns the document into metrics, so no API call is made and the metrics can be checked locally
+    # by capturing stdout. Values of the same metric are summed: a stage timed on several worker threads reports
+    # the total time spent in that stage.
+    def __init__(self, namespace=None):
+        self.namespace = namespace or os.environ.get("metrics_namespace", DEFAULT_NAMESPACE)
+        self.values = {}
+        self.units = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value, unit="Count"):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+            self.units[name] = unit
+
+    @contextmanager
+    def time_stage(self, stage):
+        # Adds the time spent in the block to the <stage>Time metric, also when the block raises.
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f"{stage}Time", (time.perf_counter() - started_at) * 1000, "Milliseconds")
+
+    def time_iterator(self, stage, iterable):
+        # Yields the items of iterable, timing only how long each item takes to produce. Used for paginators and
+        # other lazy sources, whose items are consumed outside the stage.
+        iterator = iter(iterable)
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(f"{stage}Time", (time.perf_counter() - started_at) * 1000, "Milliseconds")
+            yield item
+
+    def get_document(self, function_name, reset=True):
+        with self.lock:
+            values = dict(self.values)
+            units = dict(self.units)
+            if reset:
+                self.values = {}
+                self.units = {}
+        names = sorted(values)[:MAX_METRICS_PER_DOCUMENT]
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in names]
+                }]
+            },
+            "FunctionName": function_name
+        }
+        for name in names:
+            document[name] = round(values[name], 3) if units[name] == "Milliseconds" else values[name]
+        return document
+
+    def flush(self, function_name):
+        # Prints the metrics of the invocation on a single line, which is how CloudWatch Logs expects an EMF document.
+        document = self.get_document(function_name)
+        if document["_aws"]["CloudWatchMetrics"][0]["Metrics"]:
+            print(json.dumps(document))
+
+stage_metrics = StageMetrics()
@@ -3,75 +3,128 @@ import os
 import time
 from typing import Dict, List
 
-import boto3
-from botocore.config import Config
-
+from util.api_call_metrics import api_call_metrics
+from util.batch_processor import process_sqs_records
+from util.client_registry import get_client
+from util.ddb_status_writer import DDBStatusWriter
 from util.ddb_util import DDBUtil
-from util.glue_util import GlueUtil
+from util.glue_rate_limiter import glue_rate_limiter
+from util.glue_util import GlueUtil, PARTITION_BATCH_CLIENT_RETRIES
 from util.large_table import LargeTable
+from util.logger import logger
 from util.s3_util import S3Util
+from util.stage_metrics import stage_metrics
 from util.table_replication_status import TableReplicationStatus
 
-def print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_table_status_tracking, region):
-    print(f"Target Catalog Id: {target_glue_catalog_id}")
-    print(f"Skip Table Archive: {skip_table_archive}")
-    print(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
-    print(f"Region: {region}")
+def print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_table_status_tracking, region,
+                        partition_segments, partition_batch_workers, partition_delete_rate_limit, sqs_queue_url_large_tables,
+                        import_deadline_reserve_ms, max_import_continuations, record_workers):
+    logger.info(f"Target Catalog Id: {target_glue_catalog_id}")
+    logger.info(f"Skip Table Archive: {skip_table_archive}")
+    logger.info(f"DynamoDB Table for Table Import Auditing: {ddb_tbl_name_for_table_status_tracking}")
+    logger.info(f"Region: {region}")
+    logger.info(f"Partition Segments: {partition_segments}")
+    logger.info(f"Partition Batch Workers: {partition_batch_workers}")
+    logger.info(f"Partition Delete Rate Limit (requests/s): {partition_delete_rate_limit}")
+    logger.info(f"SQS Queue URL for Large Tables: {sqs_queue_url_large_tables}")
+    logger.info(f"Import Deadline Reserve (ms): {import_deadline_reserve_ms}")
+    logger.info(f"Max Import Continuations: {max_import_continuations}")
+    logger.info(f"Record Workers: {record_workers}")
 
 def lambda_handler(event, context):
     region = os.environ.get("region", "us-east-1")
     target_glue_catalog_id = os.environ.get("target_glue_catalog_id", "1234567890")
     skip_table_archive = os.environ.get("skip_archive", "true").lower() == "true"
     ddb_tbl_name_for_table_status_tracking = os.environ.get("ddb_name_table_import_status", "ddb_name_table_import_status")
-
-    print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_table_status_tracking, region)
-
-    config = Config(retries={"max_attempts": 10})
-    glue = boto3.client("glue", region_name=region, config=config)
-    sqs = boto3.client("sqs", region_name=region, config=config)
+    partition_segments = int(os.environ.get("partition_segments", "4"))
+    partition_batch_workers = int(os.environ.get("partition_batch_workers", "5"))
+    partition_delete_rate_limit = float(os.environ.get("partition_delete_rate_limit", "0"))
+    sqs_queue_url_large_tables = os.environ.get("sqs_queue_url_large_tables", "")
+    import_deadline_reserve_ms = int(os.environ.get("import_deadline_reserve_ms", "30000"))
+    max_import_continuations = int(os.environ.get("max_import_continuations", "100"))
+    record_workers = int(os.environ.get("record_workers", "5"))
+
+    print_env_variables(target_glue_catalog_id, skip_table_archive, ddb_tbl_name_for_table_status_tracking, region,
+                        partition_segments, partition_batch_workers, partition_delete_rate_limit, sqs_queue_url_large_tables,
+                        import_deadline_reserve_ms, max_import_continuations, record_workers)
+
+    # The delete limit caps BatchDeletePartition in the shared Glue rate limiter, which also lowers it on throttles.
+    glue_rate_limiter.set_max_rate("BatchDeletePartition", partition_delete_rate_limit)
+    glue = get_client("glue", region_name=region, retries={"max_attempts": 10})
+    partition_glue = get_client("glue", region_name=region, retries=PARTITION_BATCH_CLIENT_RETRIES)
+    sqs = get_client("sqs", region_name=region, retries={"max_attempts": 10})
     
-    print("EVENT INCIAL")
-    print(event)
+    logger.debug("event: {}", event)
 
-    print(f"Number of messages in SQS Event: {len(event['Records'])}")
+    logger.info(f"Number of messages in SQS Event: {len(event['Records'])}")
 
-    for record in event["Records"]:
+    status_writer = DDBStatusWriter(get_client("dynamodb"))
+    ddb_util = DDBUtil(status_writer=status_writer)
+
+    def process_sqs_record(record):
         ddl = record["body"]
         export_batch_id = ""
         schema_type = ""
         source_glue_catalog_id = ""
+        import_checkpoint = {"partitions_committed": 0, "continuation": 0}
 
         for key, value in record["messageAttributes"].items():
             if key.lower() == "exportbatchid":
                 export_batch_id = value["stringValue"]
-                print(f"Export Batch Id: {export_batch_id}")
+                logger.debug(f"Export Batch Id: {export_batch_id}")
             elif key.lower() == "sourcegluedatacatalogid":
                 source_glue_catalog_id = value["stringValue"]
-                print(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
+                logger.debug(f"Source Glue Data Catalog Id: {source_glue_catalog_id}")
             elif key.lower() == "schematype":
                 schema_type = value["stringValue"]
-                print(f"Message Schema Type: {schema_type}")
-
-        if schema_type.lower() == "largetable":
-            record_processed = process_record(context, glue, sqs, target_glue_catalog_id, ddb_tbl_name_for_table_status_tracking,
-                                              ddl, skip_table_archive, export_batch_id, source_glue_catalog_id, region)
+                logger.debug(f"Message Schema Type: {schema_type}")
+            elif key.lower() == "importcheckpoint":
+                import_checkpoint = json.loads(value["stringValue"])
+                logger.debug(f"Import Checkpoint: {import_checkpoint}")
+
+        record_processed = False
+        if schema_type.lower() != "largetable":
+            logger.warning(f"Message '{record['messageId']}' has unsupported schema type '{schema_type}'.")
+        elif import_checkpoint["continuation"] > max_import_continuations:
+            logger.warning(f"Import of this large table was continued {import_checkpoint['continuation']} times without completing. Giving up.")
+        else:
+            record_processed = process_record(context, glue, partition_glue, sqs, target_glue_catalog_id,
+                                              ddb_tbl_name_for_table_status_tracking, ddl, skip_table_archive, export_batch_id, source_glue_catalog_id, region,
+                                              partition_segments, partition_batch_workers, sqs_queue_url_large_tables,
+                                              import_deadline_reserve_ms, import_checkpoint, ddb_util)
 
         if not record_processed:
-            print(f"Input message '{ddl}' could not be processed. This is an exception. It will be reprocessed again.")
-            raise RuntimeError()
+            logger.error(f"Input message '{ddl}' could not be processed. This is an exception. It will be reprocessed again.")
+        return record_processed
 
-    return "Success"
-
-def process_record(context, glue, sqs, target_glue_catalog_id, ddb_tbl_name_for_table_status_tracking,
-                   message, skip_table_archive, export_batch_id, source_glue_catalog_id, region):
+    try:
+        batch_response = process_sqs_records(event["Records"], process_sqs_record, record_workers)
+    finally:
+        status_writer.flush()
+
+    glue_rate_limiter.print_metrics()
+    api_call_metrics.print_metrics()
+    stage_metrics.flush("ImportLargeTable")
+    return batch_response
+
+def process_record(context, glue, partition_glue, sqs, target_glue_catalog_id, ddb_tbl_name_for_table_status_tracking,
+                   message, skip_table_archive, export_batch_id, source_glue_catalog_id, region, partition_segments=1,
+                   partition_batch_workers=5, sqs_queue_url_large_tables="",
+                   import_deadline_reserve_ms=0, import_checkpoint=None, ddb_util=None):
     record_processed = False
     s3_util = S3Util()
-    ddb_util = DDBUtil()
+    ddb_util = ddb_util or DDBUtil()
     glue_util = GlueUtil()
 
     large_table = None
     table_status = None
     import_run_id = int(time.time() * 1000)
+    import_checkpoint = import_checkpoint or {"partitions_committed": 0, "continuation": 0}
+
+    # Work stops once the remaining time drops below the reserve, leaving time to finish the batches in flight
+    # and enqueue a continuation. Without a continuation queue the import runs until it completes or times out.
+    def should_stop():
+        return bool(sqs_queue_url_large_tables) and context.get_remaining_time_in_millis() < import_deadline_reserve_ms
 
     try:
         msg = json.loads(message)
@@ -82,54 +135,105 @@ def process_record(context, glue, sqs, target_glue_catalog_id, ddb_tbl_name_for_
         large_table.table = msg.get("table", "")
         large_table.s3_object_key = msg.get("s3_object_key", "")
         large_table.s3_bucket_name = msg.get("s3_bucket_name", "")
+        large_table.s3_object_keys = msg.get("s3_object_keys")
+        large_table.export_complete = msg.get("export_complete", True)
     except json.JSONDecodeError as e:
-        print("Cannot parse SNS message to Glue Table Type.")
-        print(e)
-
-    if large_table:
+        logger.error("Cannot parse SNS message to Glue Table Type.")
+        logger.error(e)
+
+    if large_table and not large_table.export_complete and glue_util.get_table(glue, target_glue_catalog_id,
+                                                                               large_table.table["DatabaseName"],
+                                                                               large_table.table["Name"]):
+        # A part of an export still being written. The table is created by the first part imported and updated once,
+        # by the message completing the export, so that parts do not each write a new table version.
+        table_status = TableReplicationStatus()
+        table_status.table_name = large_table.table["Name"]
+        table_status.db_name = large_table.table["DatabaseName"]
+        table_status.replication_time = int(time.time() * 1000)
+        table_status.replicated = True
+        table_status.table_schema = message
+    elif large_table:
         table_status = glue_util.create_or_update_table(glue, large_table.table, target_glue_catalog_id, skip_table_archive)
         table_status.table_schema = message
 
     if not table_status.error:
-        partition_list_from_export = s3_util.get_partitions_from_s3(region, large_table.s3_bucket_name, large_table.s3_object_key)
-        partitions_b4_replication = glue_util.get_partitions(glue, target_glue_catalog_id, large_table.table["DatabaseName"], large_table.table["Name"])
-        print(f"Number of partitions before replication: {len(partitions_b4_replication)}")
-
-        if table_status.replicated and len(partition_list_from_export) > 0:
-            table_status.export_has_partitions = True
-            if len(partitions_b4_replication) == 0:
-                print("Adding partitions based on the export.")
-                partitions_added = glue_util.add_partitions(glue, partition_list_from_export, target_glue_catalog_id,
-                                                            large_table.table["DatabaseName"], large_table.table["Name"])
-                if partitions_added:
-                    table_status.partitions_replicated = True
-                    record_processed = True
-            else:
-                print("Target table has partitions. They will be deleted first before adding partitions based on Export.")
-                partitions_deleted = glue_util.delete_partitions(glue, target_glue_catalog_id, large_table.table["DatabaseName"],
-                                                                 large_table.table["Name"], partitions_b4_replication)
-                partitions_added = glue_util.add_partitions(glue, partition_list_from_export, target_glue_catalog_id,
-                                                            large_table.table["DatabaseName"], large_table.table["Name"])
-
-                if partitions_deleted and partitions_added:
-                    table_status.partitions_replicated = True
-                    record_processed = True
-
-        elif table_status.replicated and len(partition_list_from_export) == 0:
-            table_status.export_has_partitions = False
-            if len(partitions_b4_replication) > 0:
-                partitions_deleted = glue_util.delete_partitions(glue, target_glue_catalog_id, large_table.table["DatabaseName"],
-                                                                 large_table.table["Name"], partitions_b4_replication)
-                if partitions_deleted:
+        if table_status.replicated:
+            try:
+                if large_table.s3_object_keys is not None:
+                    partitions_from_export = s3_util.iter_partitions_from_s3_parts(region, large_table.s3_bucket_name,
+                                                                                   large_table.s3_object_keys)
+                else:
+                    partitions_from_export = s3_util.iter_partitions_from_s3(region, large_table.s3_bucket_name,
+                                                                             large_table.s3_object_key)
+                if large_table.export_complete:
+                    partitions_b4_replication = glue_util.iter_partitions(glue, target_glue_catalog_id, large_table.table["DatabaseName"],
+                                                                          large_table.table["Name"], partition_segments)
+                    partition_diff = glue_util.get_streaming_partition_diff(partitions_from_export, partitions_b4_replication,
+                                                                            import_checkpoint["partitions_committed"])
+                else:
+                    partition_diff = glue_util.get_keyed_partition_diff(glue, target_glue_catalog_id, large_table.table["DatabaseName"],
+                                                                        large_table.table["Name"], partitions_from_export,
+                                                                        import_checkpoint["partitions_committed"])
+                partitions_replicated = glue_util.apply_partition_diff(partition_glue, partition_diff, target_glue_catalog_id,
+                                                                       large_table.table["DatabaseName"], large_table.table["Name"],
+                                                                       partition_batch_workers, should_stop)
+                table_status.export_has_partitions = partition_diff.num_partitions_in_export > 0
+                if partitions_replicated and partition_diff.stopped:
+                    # Every export partition read so far is committed, so the next invocation resumes after them.
+                    next_checkpoint = {
+                        "partitions_committed": partition_diff.num_partitions_consumed,
+                        "continuation": import_checkpoint["continuation"] + 1
+                    }
+                    record_processed = enqueue_import_continuation(sqs, sqs_queue_url_large_tables, message, export_batch_id,
+                                                                   source_glue_catalog_id, next_checkpoint)
+                elif partitions_replicated:
                     table_status.partitions_replicated = True
                     record_processed = True
+            except Exception as e:
+                logger.error(f"Exception thrown while replicating partitions of table '{large_table.table['Name']}': {e}")
     else:
-        print("Table replicated but partitions were not replicated. Message will be reprocessed again.")
+        logger.error("Table replicated but partitions were not replicated. Message will be reprocessed again.")
 
+    if not large_table.export_complete:
+        # The import status of the table is tracked by the message completing the export.
+        stage_metrics.add("PartsImported", int(bool(table_status.partitions_replicated)))
+        logger.info(f"Processing of export part completed. Partitions replicated: {table_status.partitions_replicated}, "
+                    f"Error: {table_status.error}")
+        return record_processed
+
+    stage_metrics.add("TablesImported", int(bool(table_status.partitions_replicated)))
     ddb_util.track_table_import_status(table_status, source_glue_catalog_id, target_glue_catalog_id, import_run_id,
                                        export_batch_id, ddb_tbl_name_for_table_status_tracking)
-    print(f"Processing of Table schema completed. Result: Table replicated: {table_status.replicated}, "
-          f"Export has partitions: {table_status.export_has_partitions}, Partitions replicated: {table_status.partitions_replicated}, "
-          f"Error: {table_status.error}")
+    logger.info(f"Processing of Table schema completed. Result: Table replicated: {table_status.replicated}, "
+                f"Export has partitions: {table_status.export_has_partitions}, Partitions replicated: {table_status.partitions_replicated}, "
+                f"Error: {table_status.error}")
 
     return record_processed
+
+def enqueue_import_continuation(sqs, queue_url, message, export_batch_id, source_glue_catalog_id, import_checkpoint):
+    message_attributes = {
+        "ExportBatchId": {
+            "DataType": "String.ExportBatchId",
+            "StringValue": export_batch_id
+        },
+        "SourceGlueDataCatalogId": {
+            "DataType": "String.SourceGlueDataCatalogId",
+            "StringValue": source_glue_catalog_id
+        },
+        "SchemaType": {
+            "DataType": "String.SchemaType",
+            "StringValue": "largeTable"
+        },
+        "ImportCheckpoint": {
+            "DataType": "String.ImportCheckpoint",
+            "StringValue": json.dumps(import_checkpoint)
+        }
+    }
+
+    try:
+        sqs.send_message(QueueUrl=queue_url, MessageBody=message, MessageAttributes=message_attributes)
+        logger.info(f"Import continued in a new message. Checkpoint: {import_checkpoint}")
+        return True
+    except Exception as e:
+        logger.error(f"Exception thrown while writing import continuation to SQS. {e}")
+        return False
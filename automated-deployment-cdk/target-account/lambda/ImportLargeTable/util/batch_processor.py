@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from util.logger import logger
+
+# Default number of records of an SQS event processed at the same time.
+DEFAULT_RECORD_WORKERS = 5
+
+def process_sqs_records(records, process_record, max_workers=DEFAULT_RECORD_WORKERS):
+    # Calls process_record(record) for every record of an SQS event on up to max_workers threads and returns a
+    # partial batch response: the records it returned False or raised for are listed in batchItemFailures, so with
+    # ReportBatchItemFailures enabled on the event source mapping only those messages become visible again.
+    batch_item_failures = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(records)))) as executor:
+        futures = {executor.submit(process_record, record): record for record in records}
+        for future in as_completed(futures):
+            record = futures[future]
+            try:
+                record_processed = future.result()
+            except Exception as e:
+                logger.error(f"Exception thrown while processing message '{record['messageId']}': {e}")
+                record_processed = False
+            if not record_processed:
+                batch_item_failures.append({"itemIdentifier": record["messageId"]})
+
+    logger.info(f"Messages processed: {len(records) - len(batch_item_failures)}, failed: {len(batch_item_failures)}")
+    return {"batchItemFailures": batch_item_failures}
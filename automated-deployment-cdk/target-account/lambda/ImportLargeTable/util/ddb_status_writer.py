@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from util.logger import logger
+
+# BatchWriteItem accepts at most 25 put or delete requests per call.
+MAX_BATCH_WRITE_ITEMS = 25
+MAX_WRITE_RETRIES = 8
+BASE_RETRY_DELAY = 0.05
+MAX_RETRY_DELAY = 5.0
+
+class DDBStatusWriter:
+    # Buffers status items, in the low-level attribute value format, and writes them with BatchWriteItem. A batch is
+    # written as soon as 25 items are buffered for a table; flush writes the rest and must be called before the
+    # handler returns. Items DynamoDB returns as unprocessed are sent again after an exponential delay with full
+    # jitter, up to max_retries times. put and flush may be called from several threads.
+    def __init__(self, dynamodb_client, max_retries=MAX_WRITE_RETRIES):
+        self.dynamodb_client = dynamodb_client
+        self.max_retries = max_retries
+        self.items = {}
+        self.num_items_written = 0
+        self.num_items_failed = 0
+        self.number_of_calls = 0
+        self.lock = threading.Lock()
+
+    def put(self, ddb_tbl_name, item):
+        with self.lock:
+            table_items = self.items.setdefault(ddb_tbl_name, [])
+            table_items.append({"PutRequest": {"Item": item}})
+            if len(table_items) == MAX_BATCH_WRITE_ITEMS:
+                self.write_batch(ddb_tbl_name, table_items)
+                self.items[ddb_tbl_name] = []
+
+    def flush(self):
+        # Returns the number of items that could not be written since the last flush.
+        with self.lock:
+            items = self.items
+            self.items = {}
+            for ddb_tbl_name, table_items in items.items():
+                for i in range(0, len(table_items), MAX_BATCH_WRITE_ITEMS):
+                    self.write_batch(ddb_tbl_name, table_items[i:i + MAX_BATCH_WRITE_ITEMS])
+            if self.num_items_written or self.num_items_failed:
+                logger.info(f"Status items written to DynamoDB: {self.num_items_written}, failed: {self.num_items_failed}, "
+                            f"BatchWriteItem calls: {self.number_of_calls}")
+            num_items_failed = self.num_items_failed
+            self.num_items_written = 0
+            self.num_items_failed = 0
+            self.number_of_calls = 0
+            return num_items_failed
+
+    def write_batch(self, ddb_tbl_name, write_requests):
+        request_items = {ddb_tbl_name: write_requests}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.get_retry_delay(attempt))
+            try:
+                self.number_of_calls += 1
+                response = self.dynamodb_client.batch_write_item(RequestItems=request_items)
+            except ClientError as e:
+                logger.error(f"Error inserting items to DynamoDB table: {ddb_tbl_name}")
+                logger.error(e)
+                break
+            unprocessed = response.get("UnprocessedItems", {}).get(ddb_tbl_name, [])
+            self.num_items_written += len(request_items[ddb_tbl_name]) - len(unprocessed)
+            if not unprocessed:
+                return
+            request_items = {ddb_tbl_name: unprocessed}
+            logger.warning(f"{len(unprocessed)} items were not processed by DynamoDB table: {ddb_tbl_name}. Retrying.")
+
+        self.num_items_failed += len(request_items[ddb_tbl_name])
+        logger.error(f"Could not insert {len(request_items[ddb_tbl_name])} items to DynamoDB table: {ddb_tbl_name}")
+
+    @staticmethod
+    def get_retry_delay(attempt):
+        return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
@@ -6,4 +6,9 @@ class LargeTable:
         self.table = None
         self.s3_object_key = None
         self.s3_bucket_name = None
+        # Part objects of an export written in parts, in the order they are read back.
+        self.s3_object_keys = []
+        # False for the message of a part published while later parts are still being written. Such a message
+        # only adds and updates the partitions of its parts; the message completing the export also deletes.
+        self.export_complete = True
  
\ No newline at end of file
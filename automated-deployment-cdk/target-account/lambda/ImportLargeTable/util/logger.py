@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+# Messages longer than this are cut, so one oversized schema or event cannot flood CloudWatch Logs. 0 disables it.
+DEFAULT_MAX_MESSAGE_CHARS = "2000"
+# Sampled messages are logged once every this many occurrences.
+DEFAULT_SAMPLE_EVERY = "100"
+
+class Logger:
+    # Leveled logger writing to stdout, which the Lambda runtime ships to CloudWatch Logs. The level comes from the
+    # log_level environment variable and defaults to INFO, so hot paths only log summaries and the full events and
+    # schemas are logged at DEBUG.
+    # Every message is written as one JSON object per line with its timestamp, level, logger name (the function
+    # name by default) and message, so CloudWatch Logs Insights can filter on the fields.
+    # Messages are formatted lazily: logger.debug("event: {}", event) formats the event only when DEBUG is enabled.
+    # Messages logged with sampled=True (e.g. one line per failed partition) are logged for the first occurrence and
+    # then once every log_sample_every occurrences of the same message template; their objects carry the occurrence
+    # count and the sampling rate.
+    def __init__(self, level=None, max_message_chars=None, sample_every=None, name=None):
+        self.name = name or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "glue-catalog-replication")
+        level = level or os.environ.get("log_level", "INFO")
+        self.level = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self.max_message_chars = int(max_message_chars if max_message_chars is not None
+                                     else os.environ.get("log_max_message_chars", DEFAULT_MAX_MESSAGE_CHARS))
+        self.sample_every = max(int(sample_every or os.environ.get("log_sample_every", DEFAULT_SAMPLE_EVERY)), 1)
+        self.sample_counts = {}
+        self.lock = threading.Lock()
+
+    def is_enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def log(self, level, message, *args, sampled=False):
+        if LEVELS[level] < self.level:
+            return
+        count = None
+        if sampled and self.sample_every > 1:
+            with self.lock:
+                count = self.sample_counts.get(message, 0) + 1
+                self.sample_counts[message] = count
+            if (count - 1) % self.sample_every:
+                return
+        text = str(message).format(*args) if args else str(message)
+        if 0 < self.max_message_chars < len(text):
+            text = f"{text[:self.max_message_chars]}... ({len(text) - self.max_message_chars} more characters)"
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "level": level,
+            "logger": self.name,
+            "message": text
+        }
+        if count is not None:
+            record["occurrence"] = count
+            record["sample_every"] = self.sample_every
+        # One write per record, so lines logged by worker threads are not interleaved.
+        sys.stdout.write(json.dumps(record) + "\n")
+
+    def debug(self, message, *args, sampled=False):
+        self.log("DEBUG", message, *args, sampled=sampled)
+
+    def info(self, message, *args, sampled=False):
+        self.log("INFO", message, *args, sampled=sampled)
+
+    def warning(self, message, *args, sampled=False):
+        self.log("WARNING", message, *args, sampled=sampled)
+
+    def error(self, message, *args, sampled=False):
+        self.log("ERROR", message, *args, sampled=sampled)
+
+logger = Logger()
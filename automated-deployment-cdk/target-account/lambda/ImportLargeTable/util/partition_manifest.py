@@ -0,0 +1,68 @@
+import json
+import zlib
+
+# Compact representation of the partitions of one table, written as gzip-compressed JSON lines:
+#   {"format": ..., "common": {...}}       header with the CatalogId/DatabaseName/TableName shared by all partitions
+#   {"sd_id": n, "sd": {...}}              a StorageDescriptor without its Location, written once per distinct value
+#   {"p": {...}, "sd": n, "loc": "s3://"}  a partition without its common fields, referring to a StorageDescriptor
+PARTITION_MANIFEST_FORMAT = "gdc-partition-manifest-v1"
+COMMON_PARTITION_KEYS = ("CatalogId", "DatabaseName", "TableName")
+
+class PartitionManifest:
+
+    def encode(self, partitions):
+        compressor = zlib.compressobj(wbits=31)
+        descriptor_ids = {}
+        common = None
+
+        for partition in partitions:
+            records = []
+            if common is None:
+                common = {key: partition[key] for key in COMMON_PARTITION_KEYS if key in partition}
+                records.append({"format": PARTITION_MANIFEST_FORMAT, "common": common})
+
+            record = {"p": {key: value for key, value in partition.items()
+                            if key != "StorageDescriptor" and not (key in common and common[key] == value)}}
+
+            storage_descriptor = partition.get("StorageDescriptor")
+            if storage_descriptor is not None:
+                shared_descriptor = {key: value for key, value in storage_descriptor.items() if key != "Location"}
+                descriptor_key = json.dumps(shared_descriptor, sort_keys=True)
+                if descriptor_key not in descriptor_ids:
+                    descriptor_ids[descriptor_key] = len(descriptor_ids)
+                    records.append({"sd_id": descriptor_ids[descriptor_key], "sd": shared_descriptor})
+                record["sd"] = descriptor_ids[descriptor_key]
+                if "Location" in storage_descriptor:
+                    record["loc"] = storage_descriptor["Location"]
+            records.append(record)
+
+            chunk = compressor.compress("".join(json.dumps(r) + "\n" for r in records).encode("utf-8"))
+            if chunk:
+                yield chunk
+
+        yield compressor.flush()
+
+    def decode(self, lines):
+        # Expects the decompressed lines of a manifest, e.g. a gzip.GzipFile opened on the object body.
+        common = {}
+        descriptors = {}
+
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "p" in record:
+                partition = dict(common)
+                partition.update(record["p"])
+                if "sd" in record:
+                    storage_descriptor = dict(descriptors[record["sd"]])
+                    if "loc" in record:
+                        storage_descriptor["Location"] = record["loc"]
+                    partition["StorageDescriptor"] = storage_descriptor
+                yield partition
+            elif "sd_id" in record:
+                descriptors[record["sd_id"]] = record["sd"]
+            elif "format" in record:
+                if record["format"] != PARTITION_MANIFEST_FORMAT:
+                    raise ValueError(f"Unsupported partition manifest format: {record['format']}")
+                common = record.get("common", {})
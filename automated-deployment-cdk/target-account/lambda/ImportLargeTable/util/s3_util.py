@@ -1,12 +1,18 @@
-import boto3
+import gzip
 import json
 from botocore.exceptions import ClientError
 from io import BytesIO
+from util.client_registry import get_client
+from util.logger import logger
+from util.partition_manifest import PARTITION_MANIFEST_FORMAT, PartitionManifest
+
+# S3 requires every part of a multipart upload except the last one to be at least 5 MB.
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
 
 class S3Util:
     def create_s3_object(self, region, bucket, object_key, content):
         object_created = False
-        s3 = boto3.client('s3', region_name=region)
+        s3 = get_client('s3', region_name=region)
 
         content_bytes = content.encode('utf-8')
         input_stream = BytesIO(content_bytes)
@@ -25,19 +31,98 @@ class S3Util:
         try:
             s3.put_object(**put_object_request)
             object_created = True
-            print(f"Partition Object uploaded to S3. Object key: {object_key}")
+            logger.debug("Partition Object uploaded to S3. Object key: {}", object_key)
         except ClientError as e:
-            print(f"Error: {e}")
+            logger.error(f"Error: {e}")
         except Exception as e:
-            print(f"Exception: {e}")
+            logger.error(f"Exception: {e}")
         finally:
             input_stream.close()
         return object_created
 
+    def create_s3_object_from_lines(self, region, bucket, object_key, lines, part_size=MULTIPART_PART_SIZE):
+        chunks = ((b"\n" if i > 0 else b"") + line.encode('utf-8') for i, line in enumerate(lines))
+        return self.create_s3_object_from_chunks(region, bucket, object_key, chunks, part_size)
+
+    def create_partition_manifest_object(self, region, bucket, object_key, partitions, part_size=MULTIPART_PART_SIZE):
+        chunks = PartitionManifest().encode(partitions)
+        return self.create_s3_object_from_chunks(region, bucket, object_key, chunks, part_size,
+                                                 {'partition-format': PARTITION_MANIFEST_FORMAT})
+
+    def create_s3_object_from_chunks(self, region, bucket, object_key, chunks, part_size=MULTIPART_PART_SIZE, metadata=None):
+        # Streams content to S3, holding at most one part in memory. Objects smaller than one part are written
+        # with a single put_object call.
+        object_created = False
+        s3 = get_client('s3', region_name=region)
+        metadata = metadata or {}
+
+        upload_id = None
+        parts = []
+        buffer = bytearray()
+
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = s3.create_multipart_upload(Bucket=bucket, Key=object_key, Metadata=metadata)['UploadId']
+                    parts.append(self.upload_part(s3, bucket, object_key, upload_id, len(parts) + 1, buffer))
+                    buffer = bytearray()
+
+            if upload_id is None:
+                s3.put_object(Bucket=bucket, Key=object_key, Body=bytes(buffer), Metadata=metadata)
+            else:
+                if buffer:
+                    parts.append(self.upload_part(s3, bucket, object_key, upload_id, len(parts) + 1, buffer))
+                s3.complete_multipart_upload(Bucket=bucket, Key=object_key, UploadId=upload_id,
+                                             MultipartUpload={'Parts': parts})
+            object_created = True
+            logger.debug("Partition Object uploaded to S3 in {} part(s). Object key: {}",
+                         max(len(parts), 1), object_key)
+        except ClientError as e:
+            logger.error(f"Error: {e}")
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+
+        if not object_created and upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=bucket, Key=object_key, UploadId=upload_id)
+            except ClientError as e:
+                logger.error(f"Multipart upload could not be aborted. Upload Id: {upload_id}. {e}")
+        return object_created
+
+    def delete_objects(self, region, bucket, object_keys):
+        # DeleteObjects accepts at most 1000 keys per request. Returns whether every object was deleted.
+        objects_deleted = True
+        s3 = get_client('s3', region_name=region)
+        object_keys = list(object_keys)
+
+        for i in range(0, len(object_keys), 1000):
+            try:
+                response = s3.delete_objects(Bucket=bucket, Delete={
+                    'Objects': [{'Key': object_key} for object_key in object_keys[i:i+1000]],
+                    'Quiet': True
+                })
+                for error in response.get('Errors', []):
+                    objects_deleted = False
+                    logger.warning("Object could not be deleted. Key: {}, Error Code: {}, Message: {}", error.get('Key'),
+                                   error.get('Code'), error.get('Message'), sampled=True)
+            except ClientError as e:
+                objects_deleted = False
+                logger.error(f"Error: {e}")
+        logger.debug("{} objects deleted from bucket {}.", len(object_keys), bucket)
+        return objects_deleted
+
+    @staticmethod
+    def upload_part(s3, bucket, object_key, upload_id, part_number, content):
+        response = s3.upload_part(Bucket=bucket, Key=object_key, UploadId=upload_id,
+                                  PartNumber=part_number, Body=bytes(content))
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
     def upload_object(self, region, bucket_name, obj_key_name, local_file_path):
-        print("Uploading file to S3.")
+        logger.debug("Uploading file to S3.")
         object_uploaded = False
-        s3_client = boto3.client('s3', region_name=region)
+        s3_client = get_client('s3', region_name=region)
 
         try:
             # Upload a text string as a new object.
@@ -57,9 +142,9 @@ class S3Util:
                 s3_client.put_object(**request)
                 object_uploaded = True
         except ClientError as e:
-            print(f"ClientError: {e}")
+            logger.error(f"ClientError: {e}")
         except Exception as e:
-            print(f"Exception: {e}")
+            logger.error(f"Exception: {e}")
 
         return object_uploaded
 
@@ -67,25 +152,25 @@ class S3Util:
         object_created = False
 
         try:
-            s3_client = boto3.client('s3', region_name=region)
+            s3_client = get_client('s3', region_name=region)
             s3_client.put_object(Bucket=bucket_name, Key=string_obj_key_name, Body=table_ddl)
             object_created = True
         except ClientError as e:
-            print(f"ClientError: {e}")
+            logger.error(f"ClientError: {e}")
         except Exception as e:
-            print(f"Exception: {e}")
+            logger.error(f"Exception: {e}")
 
         return object_created
 
     def get_object(self, region, bucket_name, key):
-        s3_client = boto3.client('s3', region_name=region)
+        s3_client = get_client('s3', region_name=region)
 
         try:
             # Get an object and print its contents.
-            print("Downloading an object")
+            logger.debug("Downloading an object")
             response = s3_client.get_object(Bucket=bucket_name, Key=key)
-            print(f"Content-Type: {response['ContentType']}")
-            print("Content:")
+            logger.debug("Content-Type: {}", response['ContentType'])
+            logger.debug("Content:")
             self.display_text_input_stream(response['Body'])
 
             # Get a range of bytes from an object and print the bytes.
@@ -95,7 +180,7 @@ class S3Util:
                 'Range': 'bytes=0-9'
             }
             response = s3_client.get_object(**range_object_request)
-            print("Printing bytes retrieved.")
+            logger.debug("Printing bytes retrieved.")
             self.display_text_input_stream(response['Body'])
 
             # Get an entire object, overriding the specified response headers, and print the object's content.
@@ -111,39 +196,52 @@ class S3Util:
             response = s3_client.get_object(**get_object_request_header_override)
             self.display_text_input_stream(response['Body'])
         except ClientError as e:
-            print(f"ClientError: {e}")
+            logger.error(f"ClientError: {e}")
         except Exception as e:
-            print(f"Exception: {e}")
+            logger.error(f"Exception: {e}")
 
     @staticmethod
     def display_text_input_stream(input_stream):
         # Read the text input stream one line at a time and display each line.
         for line in input_stream.iter_lines():
-            print(line.decode('utf-8'))
-        print()
+            logger.debug(line.decode('utf-8'))
 
     def get_partitions_from_s3(self, region, bucket, key):
-        s3 = boto3.client('s3', region_name=region)
-        print(f"Bucket Name: {bucket}, Object Key: {key}")
-
         try:
-            response = s3.get_object(Bucket=bucket, Key=key)
+            return list(self.iter_partitions_from_s3(region, bucket, key))
         except Exception as e:
-            print(f"Exception thrown while reading object from S3: {e}")
+            logger.error(f"Exception thrown while reading object from S3: {e}")
             return []
 
-        content_type = response['ContentType']
-        print(f"CONTENT TYPE: {content_type}")
-
-        # Read the text input stream one line at a time and display each line.
-        partition_list = []
+    def iter_partitions_from_s3_parts(self, region, bucket, keys):
+        for key in keys:
+            yield from self.iter_partitions_from_s3(region, bucket, key)
 
-        for line in response['Body'].iter_lines():
-            try:
-                partition = json.loads(line.decode('utf-8'))
-                partition_list.append(partition)
-            except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                print(f"Exception occurred while reading partition information from S3 object: {e}")
+    def iter_partitions_from_s3(self, region, bucket, key):
+        # Yields partitions while the object is downloaded. Unlike get_partitions_from_s3, errors reading the
+        # object are raised so that a partially read export is never mistaken for a complete one.
+        s3 = get_client('s3', region_name=region)
+        logger.debug("Bucket Name: {}, Object Key: {}", bucket, key)
 
-        print(f"Number of partitions read from S3: {len(partition_list)}")
-        return partition_list
\ No newline at end of file
+        response = s3.get_object(Bucket=bucket, Key=key)
+        content_type = response['ContentType']
+        logger.debug("CONTENT TYPE: {}", content_type)
+
+        num_partitions = 0
+        if response.get('Metadata', {}).get('partition-format') == PARTITION_MANIFEST_FORMAT:
+            with gzip.GzipFile(fileobj=response['Body']) as manifest:
+                for partition in PartitionManifest().decode(manifest):
+                    num_partitions += 1
+                    yield partition
+        else:
+            # Read the text input stream one line at a time.
+            for line in response['Body'].iter_lines():
+                try:
+                    partition = json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    logger.error(f"Exception occurred while reading partition information from S3 object: {e}")
+                    continue
+                num_partitions += 1
+                yield partition
+
+        logger.info(f"Number of partitions read from S3: {num_partitions}")